@@ -2,4 +2,5 @@ import sys
 
 sys.path.append("..")
 __all__ = ['check_style_coverage', 'create_media_report',
-           'insert_media_mongodb', 'plot_track_length', 'show_installed_pkgs']
+           'insert_media_mongodb', 'plot_track_length', 'run_benchmarks',
+           'show_installed_pkgs']
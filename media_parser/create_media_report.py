@@ -1,177 +1,348 @@
 # -*- coding: UTF-8 -*-
 """Media driver module to generate Excel report from media."""
 from collections import OrderedDict
-import inspect
+import json
 import os
 import math
 import sys
 import time
 from pathlib import Path
-import pandas
 from dateutil import parser
 from pathvalidate import sanitize_filename
 import xlsxwriter
-from lib import config, file_tools, media_tools, user_input
+from lib import config, export_tools, file_tools, hash_cache, media_tools, \
+    user_input
 
 MODULE_NAME = Path(__file__).resolve().name
 BASE_DIR = Path.cwd()
 PARENT_PATH = Path.cwd().parent
 MAX_EXCEL_TAB = 31
+MANIFEST_NAME = '~media_manifest.json'
+EXCEL_MAX_ROWS = 1048576  # rows per worksheet, header included
+SHARD_BY = ('rows', 'folder')
+SHARD_TO = ('sheet', 'workbook')
+WIDTH_SCALAR = 1.2  # account for presentations difference
+WIDTH_SAMPLE_STRIDE = 16  # 1 in N rows measured past width_sample
 ALPHABET = file_tools.build_index_alphabet()
 
 
-def get_header_column_widths(input_tag_list: list) -> dict:
-    """Returns dynamically sized column widths based on cell values."""
-    # list: [row1:[hdr1, ..., hdrN], row2:[data1, ..., dataN]... rowN]
-    scalar = 1.2  # account for presentations difference
-    headers = media_tools.HEADER_KEYS[:-3]
-    hdr_col_width_dict = OrderedDict([(hdr, len(hdr)) for hdr in headers])
-    for hdr in headers:
-        for tag_dict in input_tag_list:
-            tag_val = tag_dict[hdr]
-            max_length = max(len(hdr), len(str(tag_val))) * scalar
-            # if max_length < 20:
-            #    max_length *= scalar
-            if hdr_col_width_dict[hdr] < max_length:
-                hdr_col_width_dict[hdr] = int(math.ceil(max_length))
-    if config.VERBOSE:
-        print("\ndynamically sized columns widths:")
-        for key, value in hdr_col_width_dict.items():
-            print(f"   {key:28} \t {value} chars")
-    return hdr_col_width_dict
+def top_folder(input_path: Path, file_path: str) -> str:
+    """Returns first folder of file_path below input_path, '.' if none."""
+    parts = Path(file_path).relative_to(input_path).parts
+    return parts[0] if len(parts) > 1 else '.'
 
 
-def export_to_excel(output_path: Path,
-                    output_filename: str,
-                    tab_name: str,
-                    stat_list_of_dicts: list,
-                    dir_size_list: list) -> str:
-    """Exports media tag data into output Excel report file with markup."""
-    def_name = inspect.currentframe().f_code.co_name
-    status = ''
-    try:
-        output_filepath = Path(output_path, output_filename)
-        wb = xlsxwriter.Workbook(f"{output_filepath}")
-        # file size worksheet
-        ws1 = wb.add_worksheet(tab_name[:MAX_EXCEL_TAB])
-        ws1.freeze_panes(1, 0)
+# file worksheet columns: (record field, cell value conversion, format
+# attribute of ExcelSink, True if None values leave the cell empty)
+FILE_SHEET_COLUMNS = [('index', None, 'ctr_int', False),
+                      ('file_size', None, 'ctr_int', False),
+                      ('readable_size', str, 'ctr', False),
+                      ('file_ext', str, 'ctr', False),
+                      ('artist_name', str, 'left_ctr', False),
+                      ('album_title', str, 'left_ctr', False),
+                      ('track_title', str, 'left_ctr', False),
+                      ('track_number', None, 'ctr_int', True),
+                      ('track_length', str, 'ctr_time', False),
+                      ('genre', str, 'ctr', False),
+                      ('genre_in_dict', str, 'ctr', False),
+                      ('album_art', str, 'ctr', False),
+                      ('year', None, 'ctr_int', True),
+                      ('rating', str, 'ctr_int', False),
+                      ('encoder', str, 'ctr', False),
+                      ('composer', str, 'ctr', False),
+                      ('conductor', str, 'ctr', False),
+                      ('comment', str, 'ctr', False),
+                      ('track_gain', None, 'ctr_float', False),
+                      ('album_gain', None, 'ctr_float', False),
+                      ('file_name', str, 'left_ctr', False),
+                      ('path_len', None, 'ctr_int', False),
+                      ('last_modified', None, 'date_ctr', True),
+                      ('encoding', str, 'ctr', False),
+                      ('hash', str, 'ctr', False),
+                      ('audio_hash', str, 'ctr', False)]
+
+
+class MediaSheet:
+    """Media worksheet (shard) of an ExcelSink and its index sheet row."""
+
+    __slots__ = ['worksheet', 'name', 'file_name', 'num', 'first_index',
+                 'last_index', 'first_key', 'last_key']
+
+    def __init__(self, worksheet, name: str, file_name: str):
+        self.worksheet = worksheet
+        self.name = name
+        self.file_name = file_name
+        self.num = 1  # last written Excel row number, 1: header only
+        self.first_index = self.last_index = None
+        self.first_key = self.last_key = None
+
+
+class ExcelSink:
+    """Incremental Excel report writer, one row per write(tags) call.
+
+    Column widths are measured on the cell values as each row is written
+    and applied by close(), which also adds the conditional formats and
+    the directory size worksheet.
+    Errors are reported in the status string returned by close().
+    constant_memory: streams each finished row to a temp file instead of
+                     keeping the worksheets in memory (xlsxwriter option),
+                     cell values and formats are unchanged.
+    shard_rows: media rows per worksheet, at most Excel's row limit.
+    shard_by: 'rows' starts a new shard once shard_rows are written,
+              'folder' also whenever write() gets another shard_key
+              (records are expected grouped by top-level folder).
+    shard_to: 'sheet' adds worksheets '<tab>_002', ... to the report,
+              'workbook' writes '<report>_002.xlsx', ... closing each
+              finished one, so only one shard is open at a time.
+    Once split, an index sheet lists every shard with its row range.
+    width_sample: constant_memory only, the first width_sample rows of
+                  each media sheet are measured then 1 in
+                  WIDTH_SAMPLE_STRIDE. None, or default mode: every row.
+    """
+
+    def __init__(self, output_path: Path, output_filename: str,
+                 tab_name: str, constant_memory: bool = False,
+                 shard_rows: int = EXCEL_MAX_ROWS - 1,
+                 shard_by: str = 'rows', shard_to: str = 'sheet',
+                 width_sample: int = None):
+        self.output_filepath = Path(output_path, output_filename)
+        self.tab_name = tab_name
+        self.constant_memory = constant_memory
+        self.shard_rows = shard_rows
+        self.shard_by = shard_by
+        self.shard_to = shard_to
+        # exact widths cost nothing extra unless rows are streamed
+        self.width_sample = width_sample if constant_memory else None
+        self.status = ''
+        self.shard_status = ''
+        self.headers = media_tools.HEADER_KEYS[:-3]
+        self.max_lengths = [0] * len(self.headers)  # longest cell per column
+        self.measured = False
+        self.sheets = []  # media sheets of this workbook
+        self.shards = []  # media sheets of all workbooks, in write order
+        self.sheet = None
+        self.child = None  # current shard workbook, shard_to='workbook'
+        self.wb = None
+        try:
+            if not 0 < shard_rows < EXCEL_MAX_ROWS:
+                raise ValueError(f"invalid shard_rows: {shard_rows}")
+            if shard_by not in SHARD_BY or shard_to not in SHARD_TO:
+                raise ValueError(f"invalid shard_by/shard_to: "
+                                 f"'{shard_by}'/'{shard_to}'")
+            self.wb = xlsxwriter.Workbook(
+                f"{self.output_filepath}",
+                {'constant_memory': constant_memory})
+            self._add_formats()
+            # (column, field, conversion, format, skip None) per cell
+            self.columns = [(col, field, to_cell, getattr(self, fmt_name),
+                             skip_none) for col, (field, to_cell, fmt_name,
+                                                  skip_none)
+                            in enumerate(FILE_SHEET_COLUMNS)]
+            # file size worksheet
+            self._add_media_sheet(tab_name[:MAX_EXCEL_TAB])
+        except (OSError, xlsxwriter.exceptions.InvalidWorksheetName,
+                ValueError) as exc:
+            self._fail(exc)
+
+    def _fail(self, exc: Exception) -> None:
+        """Records error, later writes are skipped."""
+        def_name = 'export_to_excel'
+        self.status += f"~!ERROR!~ {def_name}() {sys.exc_info()[0]} {exc}\n"
+        self.wb = None
+
+    def _add_media_sheet(self, sheet_name: str) -> None:
+        """Adds media worksheet with header row, the next write target."""
+        worksheet = self.wb.add_worksheet(sheet_name)
+        worksheet.freeze_panes(1, 0)
+        for col, key_hdr in enumerate(self.headers):
+            worksheet.write(0, col, f"{key_hdr}:", self.header_format)
+        self.sheet = MediaSheet(worksheet, sheet_name,
+                                self.output_filepath.name)
+        self.sheets.append(self.sheet)
+        self.shards.append(self.sheet)
+
+    def _add_formats(self) -> None:
+        """Adds cell formats shared by both worksheets."""
+        wb = self.wb
         # Add formatting: RED fill text FFC7CE 9C0006 b07b7b
-        format_red = wb.add_format({'bg_color': '#e7c4c4',
-                                    'font_color': '#332f2f',
-                                    'bold': True})
+        self.format_red = wb.add_format({'bg_color': '#e7c4c4',
+                                         'font_color': '#332f2f',
+                                         'bold': True})
         # Add formatting: GREY fill text C6EFCE, 006100 e3e3e3 dbdbdb
-        format_grey = wb.add_format({'bg_color': '#c2e3c2',
-                                     'font_color': '#332f2f',
-                                     'bold': False})
+        self.format_grey = wb.add_format({'bg_color': '#c2e3c2',
+                                          'font_color': '#332f2f',
+                                          'bold': False})
         xls_font_name = 'Segoe UI'  # monospaced font
         font_pt_size = 11  # default: 11 pt
-        hdr_col_width_dict = get_header_column_widths(stat_list_of_dicts)
         # includes both header and cell values in calculation
-        header_format = wb.add_format({'bold': True,
-                                       'underline': True,
-                                       'font_color': 'blue',
-                                       'center_across': True})
-        header_format.set_font_size(font_pt_size)
-        header_format.set_font_name(xls_font_name)
+        self.header_format = wb.add_format({'bold': True,
+                                            'underline': True,
+                                            'font_color': 'blue',
+                                            'center_across': True})
+        self.header_format.set_font_size(font_pt_size)
+        self.header_format.set_font_name(xls_font_name)
+        self.ctr_int = wb.add_format()
+        self.ctr_int.set_num_format('0')
+        self.ctr_int.set_align('center')
+        self.ctr_int.set_align('vcenter')
+        self.ctr_int.set_font_name(xls_font_name)
+        self.ctr_float = wb.add_format()
+        self.ctr_float.set_num_format('0.00')
+        self.ctr_float.set_align('center')
+        self.ctr_float.set_align('vcenter')
+        self.ctr_float.set_font_name(xls_font_name)
+        self.ctr_time = wb.add_format()
+        self.ctr_time.set_num_format('hh:mm:ss')
+        self.ctr_time.set_align('center')
+        self.ctr_time.set_align('vcenter')
+        self.ctr_time.set_font_name(xls_font_name)
+        self.ctr = wb.add_format()
+        self.ctr.set_align('center')
+        self.ctr.set_align('vcenter')
+        self.ctr.set_font_name(xls_font_name)
+        self.date_ctr = wb.add_format()
+        self.date_ctr.set_num_format('mm/dd/yy hh:mm AM/PM')
+        self.date_ctr.set_align('center')
+        self.date_ctr.set_align('vcenter')
+        self.date_ctr.set_font_name(xls_font_name)
+        self.left_ctr = wb.add_format()
+        self.left_ctr.set_align('left')
+        self.left_ctr.set_align('vcenter')
+        self.left_ctr.set_font_name(xls_font_name)
+
+    def write(self, tags, shard_key: str = None) -> None:
+        """Writes one TrackRecord as the next worksheet row.
+
+        shard_key: top-level folder of the record, starts a new shard
+                   when it changes and shard_by is 'folder'.
+        """
+        if self.wb is None:
+            return
+        tab_count = len(tags)
+        if tab_count != len(media_tools.HEADER_KEYS):  # structure check
+            print(f"\n~!ERROR!~ export_to_excel() tab_count:{tab_count}")
+            for i, tag_value in enumerate(tags):
+                print(f"{i:04} {tag_value}")
+            print(f"tags: {tags}")
+        if len(tags) > 1:
+            try:
+                shard = self.shards[-1]
+                if shard.num > 1 and (
+                        shard.num > self.shard_rows or
+                        (self.shard_by == 'folder' and
+                         shard_key != shard.last_key)):
+                    shard = self._next_shard()
+                if self.child is not None:
+                    self.child._write_row(tags)
+                else:
+                    self._write_row(tags)
+                if shard.first_index is None:
+                    shard.first_index, shard.first_key = tags['index'], \
+                                                         shard_key
+                shard.last_index, shard.last_key = tags['index'], shard_key
+            except (OSError, UnicodeDecodeError, ValueError,
+                    xlsxwriter.exceptions.InvalidWorksheetName) as exc:
+                self._fail(exc)
+
+    def _next_shard(self) -> MediaSheet:
+        """Starts the next worksheet or workbook shard, returns its sheet."""
+        suffix = f"_{len(self.shards) + 1:03d}"
+        sheet_name = f"{self.tab_name[:MAX_EXCEL_TAB - len(suffix)]}{suffix}"
+        if self.shard_to == 'sheet':
+            self._add_media_sheet(sheet_name)
+            return self.sheet
+        if self.child is not None:  # finished, release memory/temp files
+            self.shard_status += self.child.close(None)
+        file_path = self.output_filepath
+        self.child = ExcelSink(file_path.parent,
+                               f"{file_path.stem}{suffix}{file_path.suffix}",
+                               sheet_name, self.constant_memory,
+                               width_sample=self.width_sample)
+        if self.child.wb is None:
+            raise ValueError(self.child.status)
+        self.shards.append(self.child.sheet)
+        return self.child.sheet
+
+    def _write_row(self, tags) -> None:
+        """Writes record cells by integer row/column, in column order.
+
+        Rows are only ever appended, as required by constant_memory mode.
+        Cell lengths are measured in the same pass, reusing str cells.
+        """
+        row = self.sheet.num
+        self.sheet.num += 1
+        measure = (self.width_sample is None or row <= self.width_sample or
+                   not row % WIDTH_SAMPLE_STRIDE)
+        self.measured = True
+        max_lengths = self.max_lengths
+        write = self.sheet.worksheet.write
+        for col, field, to_cell, cell_format, skip_none in self.columns:
+            value = tags[field]
+            if value is None and skip_none:
+                continue
+            cell = value if to_cell is None else to_cell(value)
+            if measure and value is not None:  # None measured as ''
+                length = len(cell) if to_cell is str else len(str(value))
+                if max_lengths[col] < length:
+                    max_lengths[col] = length
+            write(row, col, cell, cell_format)
+
+    def column_widths(self) -> OrderedDict:
+        """Returns media sheet column width by header, as measured."""
+        if not self.measured:
+            return OrderedDict([(hdr, len(hdr)) for hdr in self.headers])
+        return OrderedDict(
+            [(hdr, int(math.ceil(max(len(hdr), length) * WIDTH_SCALAR)))
+             for hdr, length in zip(self.headers, self.max_lengths)])
+
+    def close(self, dir_size_list: list, duplicate_groups=None) -> str:
+        """Applies widths/formats, adds directory sheet, saves workbook.
+
+        dir_size_list: None skips the directory sheet (shard workbooks).
+        """
+        def_name = 'export_to_excel'
+        if self.child is not None:
+            self.shard_status += self.child.close(None)
+            self.child = None
+        if self.wb is None:
+            print(self.status, end='')
+            self.status = self.shard_status + self.status
+            return self.status
+        try:
+            for sheet in self.sheets:
+                self._finish_file_sheet(sheet)
+            if len(self.shards) > 1:
+                self._add_index_sheet()
+            if dir_size_list is not None:
+                self._add_dir_sheet(dir_size_list)
+            if duplicate_groups is not None:
+                self._add_dup_sheet(duplicate_groups)
+            self.wb.close()
+            self.status = f"SUCCESS! {def_name}() " \
+                          f"'{os.sep.join(self.output_filepath.parts[-3:])}'\n"
+        except (OSError, xlsxwriter.exceptions.FileCreateError,
+                xlsxwriter.exceptions.InvalidWorksheetName,
+                UnicodeDecodeError, ValueError) as exc:
+            self._fail(exc)
+        print(self.status, end='')
+        self.status = self.shard_status + self.status
+        return self.status
+
+    def _finish_file_sheet(self, sheet: MediaSheet) -> None:
+        """Sets column widths, conditional formats and autofilter range."""
+        ws1, num = sheet.worksheet, sheet.num
+        hdr_col_width_dict = self.column_widths()
+        if config.VERBOSE:
+            print("\ndynamically sized columns widths:")
+            for key, value in hdr_col_width_dict.items():
+                print(f"   {key:28} \t {value} chars")
         for idx, key_hdr in enumerate(hdr_col_width_dict):
             alpha = ALPHABET[idx + 1]
             col_width_val = hdr_col_width_dict[key_hdr]
             ws1.set_column(f"{alpha}:{alpha}", col_width_val)
-            ws1.write(f"{alpha}1", f"{key_hdr}:", header_format)
-        ctr_int = wb.add_format()
-        ctr_int.set_num_format('0')
-        ctr_int.set_align('center')
-        ctr_int.set_align('vcenter')
-        ctr_int.set_font_name(xls_font_name)
-        ctr_float = wb.add_format()
-        ctr_float.set_num_format('0.00')
-        ctr_float.set_align('center')
-        ctr_float.set_align('vcenter')
-        ctr_float.set_font_name(xls_font_name)
-        ctr_time = wb.add_format()
-        ctr_time.set_num_format('hh:mm:ss')
-        ctr_time.set_align('center')
-        ctr_time.set_align('vcenter')
-        ctr_time.set_font_name(xls_font_name)
-        ctr = wb.add_format()
-        ctr.set_align('center')
-        ctr.set_align('vcenter')
-        ctr.set_font_name(xls_font_name)
-        date_ctr = wb.add_format()
-        date_ctr.set_num_format('mm/dd/yy hh:mm AM/PM')
-        date_ctr.set_align('center')
-        date_ctr.set_align('vcenter')
-        date_ctr.set_font_name(xls_font_name)
-        left_ctr = wb.add_format()
-        left_ctr.set_align('left')
-        left_ctr.set_align('vcenter')
-        left_ctr.set_font_name(xls_font_name)
         last_alpha = ALPHABET[len(hdr_col_width_dict)]
-        ws1.autofilter(f"A1:{last_alpha}65536")
-        num = 1
-        if len(stat_list_of_dicts) > 0:
-            for tags in stat_list_of_dicts:
-                tab_count = len(tags)
-                if tab_count != 28:  # structure validation check
-                    print(f"\n~!ERROR!~ {def_name}() tab_count:{tab_count}")
-                    for i, tag_value in enumerate(tags):
-                        print(f"{i:04} {tag_value}")
-                    print(f"tags: {tags}")
-                if len(tags) > 1:
-                    num += 1
-                    ws1.write('A%d' % num,
-                              int(tags['index']), ctr_int)
-                    ws1.write('B%d' % num,
-                              int(tags['file_size']), ctr_int)
-                    ws1.write('C%d' % num,
-                              str(tags['readable_size']), ctr)
-                    ws1.write('D%d' % num,
-                              str(tags['file_ext']), ctr)
-                    ws1.write('E%d' % num,
-                              str(tags['artist_name']), left_ctr)
-                    ws1.write('F%d' % num,
-                              str(tags['album_title']), left_ctr)
-                    ws1.write('G%d' % num,
-                              str(tags['track_title']), left_ctr)
-                    if len(tags['track_number']) > 0:
-                        ws1.write('H%d' % num,
-                                  int(tags['track_number']), ctr_int)
-                    ws1.write('I%s' % num,
-                              str(tags['track_length']), ctr_time)
-                    ws1.write('J%d' % num,
-                              str(tags['genre']), ctr)
-                    ws1.write('K%d' % num,
-                              str(tags['genre_in_dict']), ctr)
-                    ws1.write('L%d' % num,
-                              str(tags['album_art']), ctr)
-                    if len(tags['year']) > 0:
-                        ws1.write('M%d' % num,
-                                  int(tags['year']), ctr_int)
-                    ws1.write('N%d' % num,
-                              str(tags['rating']), ctr_int)
-                    ws1.write('O%d' % num,
-                              str(tags['encoder']), ctr)
-                    ws1.write('P%d' % num,
-                              str(tags['composer']), ctr)
-                    ws1.write('Q%d' % num,
-                              str(tags['conductor']), ctr)
-                    ws1.write('R%d' % num,
-                              str(tags['comment']), ctr)
-                    ws1.write('S%d' % num,
-                              float(tags['track_gain']), ctr_float)
-                    ws1.write('T%d' % num,
-                              float(tags['album_gain']), ctr_float)
-                    ws1.write('U%d' % num,
-                              str(tags['file_name']), left_ctr)
-                    ws1.write('V%d' % num,
-                              int(tags['path_len']), ctr_int)
-                    modified_date = parser.parse(tags['last_modified'])
-                    ws1.write('W%d' % num,
-                              modified_date, date_ctr)
-                    ws1.write('X%d' % num,
-                              str(tags['encoding']), ctr)
-                    ws1.write('Y%d' % num,
-                              str(tags['hash']), ctr)
+        ws1.autofilter(f"A1:{last_alpha}{num}")
+        format_red, format_grey = self.format_red, self.format_grey
         ws1.conditional_format('K2:K%d' % num, {'type': 'text',
                                                 'criteria': 'containing',
                                                 'value': 'INCONSISTENT',
@@ -196,20 +367,55 @@ def export_to_excel(output_path: Path,
                                                 'criteria': 'not containing',
                                                 'value': 'ascii',
                                                 'format': format_red})
-        # directory size worksheet
-        ws2 = wb.add_worksheet(f"dir_{tab_name}"[:MAX_EXCEL_TAB])
+
+    def _add_index_sheet(self) -> None:
+        """Adds shard index worksheet, one row per media sheet."""
+        ctr, ctr_int, left_ctr = self.ctr, self.ctr_int, self.left_ctr
+        ws0 = self.wb.add_worksheet(f"idx_{self.tab_name}"[:MAX_EXCEL_TAB])
+        ws0.freeze_panes(1, 0)
+        ws0.set_column('A:A', 8)  # Shard
+        ws0.set_column('B:B', 34)  # Worksheet
+        ws0.set_column('C:C', 60)  # Workbook
+        ws0.set_column('D:F', 14)  # Rows, First/Last Index
+        ws0.set_column('G:H', 40)  # First/Last Folder
+        for col, hdr in enumerate(['Shard:', 'Worksheet:', 'Workbook:',
+                                   'Rows:', 'First_Index:', 'Last_Index:',
+                                   'First_Folder:', 'Last_Folder:']):
+            ws0.write(0, col, hdr, self.header_format)
+        for row, sheet in enumerate(self.shards, 1):
+            ws0.write(row, 0, row, ctr_int)
+            if sheet.file_name == self.output_filepath.name:
+                quoted_name = sheet.name.replace("'", "''")
+                ws0.write_url(row, 1, f"internal:'{quoted_name}'!A1",
+                              left_ctr, sheet.name)
+                ws0.write(row, 2, sheet.file_name, left_ctr)
+            else:
+                ws0.write(row, 1, sheet.name, left_ctr)
+                ws0.write_url(row, 2, f"external:{sheet.file_name}",
+                              left_ctr, sheet.file_name)
+            ws0.write(row, 3, sheet.num - 1, ctr_int)
+            ws0.write(row, 4, sheet.first_index, ctr_int)
+            ws0.write(row, 5, sheet.last_index, ctr_int)
+            ws0.write(row, 6, sheet.first_key, ctr)
+            ws0.write(row, 7, sheet.last_key, ctr)
+        ws0.autofilter(f"A1:H{len(self.shards) + 1}")
+        ws0.activate()
+
+    def _add_dir_sheet(self, dir_size_list: list) -> None:
+        """Adds directory size worksheet."""
+        ctr, date_ctr = self.ctr, self.date_ctr
+        ws2 = self.wb.add_worksheet(f"dir_{self.tab_name}"[:MAX_EXCEL_TAB])
         ws2.freeze_panes(1, 0)
         ws2.set_column('A:A', 8)  # Index
         ws2.set_column('B:B', 24)  # Directory Size
         ws2.set_column('C:C', 24)  # Directory Size (readable)
         ws2.set_column('D:D', 60)  # Full Path
         ws2.set_column('E:E', 20)  # Date Modified
-        ws2.write('A1', 'Index:', header_format)
-        ws2.write('B1', 'Directory_Size (bytes):', header_format)
-        ws2.write('C1', 'Directory_Size (readable):', header_format)
-        ws2.write('D1', 'Full_Path:', header_format)
-        ws2.write('E1', 'Date_Modified:', header_format)
-        ws2.autofilter('A1:E65536')
+        ws2.write('A1', 'Index:', self.header_format)
+        ws2.write('B1', 'Directory_Size (bytes):', self.header_format)
+        ws2.write('C1', 'Directory_Size (readable):', self.header_format)
+        ws2.write('D1', 'Full_Path:', self.header_format)
+        ws2.write('E1', 'Date_Modified:', self.header_format)
         dir_num = 1
         for tags in dir_size_list:
             if len(tags) > 1:
@@ -221,43 +427,114 @@ def export_to_excel(output_path: Path,
                 ws2.write('C%d' % dir_num,
                           str(tags[2]), ctr)  # File_Size (readable)
                 ws2.write('D%d' % dir_num,
-                          str(tags[3]), left_ctr)  # Full_Path
+                          str(tags[3]), self.left_ctr)  # Full_Path
                 date_modified = parser.parse(tags[4])
                 ws2.write('E%d' % dir_num,
                           date_modified, date_ctr)  # Date_Modified
-        wb.close()
-        status = f"SUCCESS! {def_name}() " \
-                 f"'{os.sep.join(output_filepath.parts[-3:])}'\n"
-    except (OSError, xlsxwriter.exceptions.FileCreateError,
-            xlsxwriter.exceptions.InvalidWorksheetName,
-            UnicodeDecodeError, ValueError) as exc:
-        status += f"~!ERROR!~ {def_name}() {sys.exc_info()[0]} {exc}\n"
-    print(status, end='')
-    return status
+        ws2.autofilter(f"A1:E{dir_num}")
 
+    def _add_dup_sheet(self, duplicate_groups: list) -> None:
+        """Adds duplicate file worksheet, one row per duplicate path."""
+        ctr, ctr_int = self.ctr, self.ctr_int
+        ws3 = self.wb.add_worksheet(f"dup_{self.tab_name}"[:MAX_EXCEL_TAB])
+        ws3.freeze_panes(1, 0)
+        ws3.set_column('A:A', 8)  # Group
+        ws3.set_column('B:B', 24)  # File Size
+        ws3.set_column('C:C', 24)  # Wasted Size (readable)
+        ws3.set_column('D:D', 70)  # Hash
+        ws3.set_column('E:E', 80)  # Full Path
+        ws3.write('A1', 'Group:', self.header_format)
+        ws3.write('B1', 'File_Size (bytes):', self.header_format)
+        ws3.write('C1', 'Wasted_Size (readable):', self.header_format)
+        ws3.write('D1', 'Hash:', self.header_format)
+        ws3.write('E1', 'Full_Path:', self.header_format)
+        dup_num = 1
+        for group_num, group in enumerate(duplicate_groups, 1):
+            wasted = file_tools.bytes_to_readable(
+                group.size * (len(group.paths) - 1))
+            for file_path in group.paths:
+                dup_num += 1
+                ws3.write('A%d' % dup_num, group_num, ctr_int)
+                ws3.write('B%d' % dup_num, group.size, ctr_int)
+                ws3.write('C%d' % dup_num, wasted, ctr)
+                ws3.write('D%d' % dup_num, group.hash, ctr)
+                ws3.write('E%d' % dup_num, file_path, self.left_ctr)
+        ws3.autofilter(f"A1:E{dup_num}")
 
-def export_to_json(output_path: Path, stat_list_of_dicts: list) -> str:
+
+def export_to_excel(output_path: Path,
+                    output_filename: str,
+                    tab_name: str,
+                    stat_list_of_dicts: list,
+                    dir_size_list: list) -> str:
     """Exports media tag data into output Excel report file with markup."""
-    def_name = inspect.currentframe().f_code.co_name
-    status = ''
-    try:
-        if isinstance(output_path, Path) and output_path:
-            if not output_path.exists():
-                output_path.mkdir(parents=True, exist_ok=True)
-        if isinstance(stat_list_of_dicts, list) and stat_list_of_dicts:
-            if len(stat_list_of_dicts) > 0:
-                json_path = Path(output_path, "media_lib.json")
-                # 1D=series, 2D=dataframe
-                df = pandas.DataFrame(stat_list_of_dicts)
-                df.to_json(json_path, orient='split')
-                status = f"SUCCESS! {def_name}() " \
-                         f"'{os.sep.join(output_path.parts[-3:])}'\n"
+    excel_sink = ExcelSink(output_path, output_filename, tab_name)
+    for tags in stat_list_of_dicts:
+        excel_sink.write(tags)
+    return excel_sink.close(dir_size_list)
+
+
+class JsonSink:
+    """Incremental writer of 'media_lib.json' (pandas 'split' layout)."""
+
+    def __init__(self, output_path: Path):
+        self.output_path = output_path
+        self.json_path = Path(output_path, "media_lib.json")
+        self.json_file = None
+        self.row_count = 0
+        self.status = ''
+
+    def write(self, tags) -> None:
+        """Appends one TrackRecord as the next 'data' row."""
+        if self.status:
+            return
+        try:
+            if self.json_file is None:
+                if not self.output_path.exists():
+                    self.output_path.mkdir(parents=True, exist_ok=True)
+                self.json_file = open(self.json_path, 'w', encoding='utf-8')
+                self.json_file.write('{"columns":')
+                self.json_file.write(json.dumps(list(tags.keys())))
+                self.json_file.write(',"data":[')
             else:
-                status = f"ERROR! no data to export... {def_name}()\n"
-    except (IOError, OSError, PermissionError, FileExistsError) as exc:
-        status = f"\n~!ERROR!~ {exc}\n"
-    print(status, end='')
-    return status
+                self.json_file.write(',')
+            self.json_file.write(json.dumps(
+                [export_tools.json_value(value)
+                 for value in tags.values()]))
+            self.row_count += 1
+        except (IOError, OSError, PermissionError, FileExistsError,
+                TypeError) as exc:
+            self.status = f"\n~!ERROR!~ {exc}\n"
+
+    def close(self) -> str:
+        """Writes row 'index' and closes file, returns status string."""
+        def_name = 'export_to_json'
+        if self.json_file is not None:
+            try:
+                if not self.status:
+                    self.json_file.write('],"index":')
+                    self.json_file.write(
+                        json.dumps(list(range(self.row_count))))
+                    self.json_file.write('}')
+                    trunc_path = os.sep.join(self.output_path.parts[-3:])
+                    self.status = (f"SUCCESS! {def_name}() "
+                                   f"'{trunc_path}'\n")
+                self.json_file.close()
+            except (IOError, OSError) as exc:
+                self.status = f"\n~!ERROR!~ {exc}\n"
+        elif not self.status:
+            self.status = f"ERROR! no data to export... {def_name}()\n"
+        print(self.status, end='')
+        return self.status
+
+
+def export_to_json(output_path: Path, stat_list_of_dicts: list) -> str:
+    """Exports media tag data into output JSON file."""
+    json_sink = JsonSink(output_path)
+    if isinstance(stat_list_of_dicts, list):
+        for tags in stat_list_of_dicts:
+            json_sink.write(tags)
+    return json_sink.close()
 
 
 def main():
@@ -278,11 +555,15 @@ def main():
                            f"'{os.sep.join(input_path.parts[-3:])}'")
                 print(f"\n{log_str}", end='')
                 path_runtime_start = time.perf_counter()
-                log_str += file_tools.build_parent_size_str(input_path)
-                log_str += file_tools.build_ext_count_str(input_path)
-                dir_stat_list = file_tools.get_dir_stats(input_path)
-                stat_list, path_str = media_tools.build_stat_list(input_path)
-                log_str += path_str
+                # one directory walk shared by all report sections
+                inventory = file_tools.DirectoryInventory(
+                    input_path, keep_files=config.FIND_DUPLICATES)
+                log_str += file_tools.build_parent_size_str(input_path,
+                                                            inventory)
+                log_str += file_tools.build_ext_count_str(input_path,
+                                                          inventory)
+                dir_stat_list = file_tools.get_dir_stats(input_path,
+                                                         inventory)
                 trunc_path = f"{'-'.join(input_path.parts[-2:])}"
                 if config.DEMO_ENABLED:
                     output_path = Path(PARENT_PATH, 'data', 'output')
@@ -293,18 +574,60 @@ def main():
                     json_path = Path(input_path, 'json')
                     report_name = (f"{trunc_path}_media_report_"
                                    f"{file_tools.generate_date_str()[0]}")
-                log_str += export_to_json(json_path, stat_list)
+                # incremental re-scan: only new or changed files are parsed
+                manifest_path = Path(json_path, MANIFEST_NAME)
                 txt_file_name = sanitize_filename(f"~{report_name}.txt")
                 xls_output = sanitize_filename(f"~{report_name}.xlsx")
                 if not output_path.exists():
                     output_path.mkdir(parents=True, exist_ok=True)
                 ws_name = sanitize_filename(f"{trunc_path}"[:MAX_EXCEL_TAB])
                 # works on both Linux and Windows
-                log_str += export_to_excel(output_path,
-                                           xls_output,
-                                           ws_name,
-                                           stat_list,
-                                           dir_stat_list)
+                json_sink = JsonSink(json_path)
+                # typed CSV/Parquet/Arrow files, written in chunks
+                export_sinks = [export_tools.open_export_sink(json_path, fmt)
+                                for fmt in config.EXPORT_FORMATS]
+                excel_sink = ExcelSink(
+                    output_path, xls_output, ws_name,
+                    constant_memory=config.EXCEL_CONSTANT_MEMORY,
+                    shard_rows=config.EXCEL_SHARD_ROWS,
+                    shard_by=config.EXCEL_SHARD_BY,
+                    shard_to=config.EXCEL_SHARD_TO,
+                    width_sample=config.EXCEL_WIDTH_SAMPLE)
+                # records stream into the sinks as they are parsed
+                print("iter_stat_records()")
+                path_lines = ["iter_stat_records()"]
+                # folder shards need each top-level folder contiguous
+                order = ('folder' if config.EXCEL_SHARD_BY == 'folder'
+                         else 'ext')
+                # unchanged files are never re-read to be hashed
+                with hash_cache.HashCache(
+                        Path(json_path, config.HASH_CACHE_NAME),
+                        use_xattr=config.HASH_CACHE_XATTR) as file_hashes:
+                    for file_path, tag_dict in media_tools.iter_stat_records(
+                            input_path, order=order,
+                            manifest_path=manifest_path,
+                            workers=config.PARSE_WORKERS,
+                            log=path_lines.append, hash_cache=file_hashes,
+                            with_path=True):
+                        json_sink.write(tag_dict)
+                        for export_sink in export_sinks:
+                            export_sink.write(tag_dict)
+                        excel_sink.write(tag_dict, shard_key=top_folder(
+                            input_path, file_path))
+                    log_str += ''.join(f"{line}\n" for line in path_lines)
+                    duplicate_groups = None
+                    if config.FIND_DUPLICATES:
+                        dup_finder = file_tools.DuplicateFinder(
+                            inventory, extensions=media_tools.AUDIO_EXT,
+                            hash_cache=file_hashes)
+                        duplicate_groups = dup_finder.find()
+                        log_str += dup_finder.summary()
+                        log_str += dup_finder.save_json(json_path)
+                    file_hashes.evict_missing(input_path)
+                log_str += json_sink.close()
+                for export_sink in export_sinks:
+                    log_str += export_sink.close()
+                log_str += excel_sink.close(dir_stat_list, duplicate_groups)
                 path_runtime_end = time.perf_counter() - path_runtime_start
                 run_time_str = (f"\npath_{num:02d}: "
                                 f"'{os.sep.join(input_path.parts[-3:])}' "
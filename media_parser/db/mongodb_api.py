@@ -1,12 +1,19 @@
 # -*- coding: UTF-8 -*-
 """MongoDB module to read/write data NoSQL database."""
+from collections import OrderedDict, namedtuple
 import inspect
 import sys
 import pathlib
-from pymongo import MongoClient, errors, version
+from typing import Iterator
+from pymongo import MongoClient, UpdateOne, errors, version
 from bson import ObjectId
 import gridfs
 
+UPSERT_BATCH_SIZE = 1000  # UpdateOne operations per bulk_write() call
+# ids of one bulk_write(): new documents, existing documents, failed ops
+UpsertBatch = namedtuple('UpsertBatch',
+                         ['upserted_ids', 'matched_ids', 'error_count'])
+
 """
 Sources:   default: 27017  test: 27018
 pymongo version: 3.9.0
@@ -187,6 +194,74 @@ class MongoMedia:
                 return upsert_id
         return None
 
+    @classmethod
+    def upsert_batch_tags(cls, tag, data_list: list,
+                          find_matched: bool = True) -> UpsertBatch:
+        """Upserts documents by tag keyword in one unordered bulk_write.
+
+        tag: keyword, or tuple of keywords matched together as one compound
+             key, e.g. ('file_name', 'audio_hash').
+        Documents with the same tag value in data_list are sent once, the
+        last one wins as with successive upsert_single_tags() calls.
+        find_matched: ids of existing documents are read back by a single
+                      find() of the batch, False leaves matched_ids empty.
+        """
+        fields = (tag,) if isinstance(tag, str) else tuple(tag)
+        updates = OrderedDict()
+        for data in data_list:
+            if ((isinstance(data, dict) or data) and
+                    all(field in data for field in fields)):
+                key = tuple(data[field] for field in fields)
+                updates.pop(key, None)
+                updates[key] = data
+        if not updates:
+            return UpsertBatch([], [], 0)
+        operations = [UpdateOne(dict(zip(fields, key)), {"$set": data},
+                                upsert=True)
+                      for key, data in updates.items()]
+        try:
+            result = cls.tags_coll.bulk_write(operations, ordered=False)
+            details = result.bulk_api_result
+        except errors.BulkWriteError as err:  # other operations still run
+            details = err.details
+        upserted = {item['index']: item['_id']
+                    for item in details['upserted']}
+        failed = {item['index'] for item in details['writeErrors']}
+        matched_keys = [key for index, key in enumerate(updates)
+                        if index not in upserted and index not in failed]
+        matched_ids = []
+        if find_matched and matched_keys:
+            if len(fields) == 1:
+                query = {tag: {'$in': [key[0] for key in matched_keys]}}
+            else:
+                query = {'$or': [dict(zip(fields, key))
+                                 for key in matched_keys]}
+            id_by_key = {tuple(doc.get(field) for field in fields): doc['_id']
+                         for doc in cls.tags_coll.find(
+                             query, {field: 1 for field in fields})}
+            matched_ids = [id_by_key[key] for key in matched_keys
+                           if key in id_by_key]
+        return UpsertBatch([upserted[index] for index in sorted(upserted)],
+                           matched_ids, len(failed))
+
+    @classmethod
+    def iter_upsert_tags(cls, tag, data_iter,
+                         batch_size: int = UPSERT_BATCH_SIZE,
+                         find_matched: bool = True) -> Iterator[UpsertBatch]:
+        """Upserts documents by tag keyword, batch_size per bulk_write.
+
+        data_iter: list or iterable, e.g. media_tools.iter_stat_records(),
+                   yields one UpsertBatch per batch once written.
+        """
+        batch = []
+        for data in data_iter:
+            batch.append(data)
+            if len(batch) >= batch_size:
+                yield cls.upsert_batch_tags(tag, batch, find_matched)
+                batch = []
+        if batch:
+            yield cls.upsert_batch_tags(tag, batch, find_matched)
+
     @classmethod
     def get_media(cls, document_id: ObjectId):
         """Retrieve single document in media database, from objectID."""
@@ -197,6 +272,12 @@ class MongoMedia:
                     {'_id': ObjectId(document_id)})
         return media_data
 
+    @classmethod
+    def get_media_without(cls, tag: str, fields: list) -> Iterator[dict]:
+        """Yields documents missing tag keyword, with fields and '_id'."""
+        yield from cls.tags_coll.find({tag: {'$exists': False}},
+                                      {field: 1 for field in fields})
+
     @classmethod
     def get_media_by_filename(cls, file_path: pathlib.Path):
         """Retrieve single id in media database, from filename."""
@@ -236,24 +317,33 @@ class MongoMedia:
         return data
 
     @classmethod
-    def store_bin_file(cls, file_path: pathlib.Path) -> ObjectId:
-        """Inserts binary data of document into gridfs."""
+    def store_bin_file(cls, file_path: pathlib.Path,
+                       audio_hash: str = None) -> ObjectId:
+        """Inserts binary data of document into gridfs.
+
+        A stored file of the same name is kept, no upload, unless audio_hash
+        is given and differs from the one stored with it: then the audio
+        changed and the stored file is replaced. Retagged files keep their
+        audio_hash and are not uploaded again.
+        """
         try:
             if file_path.exists():
-                if not cls.grid_fs.exists({"filename": str(file_path.name)}):
-                    with open(f"{str(file_path)}", 'rb') as file_ptr:
-                        bin_media = file_ptr.read()
-                        if bin_media:
-                            bin_id = cls.grid_fs.put(bin_media,
-                                                     filename=file_path.name)
-                        file_ptr.close()
-                        return bin_id
-                else:
-                    bin_media = cls.grid_fs.find_one(
-                        {"filename": str(file_path.name)})
-                    return bin_media.__getattr__('_id')
-            else:
-                print(f"input path not found... {file_path}")
+                bin_media = cls.grid_fs.find_one(
+                    {"filename": str(file_path.name)})
+                if bin_media is not None:
+                    if audio_hash is None or audio_hash == getattr(
+                            bin_media, 'audio_hash', None):
+                        return bin_media._id
+                    cls.grid_fs.delete(bin_media._id)
+                bin_id = None
+                with open(f"{str(file_path)}", 'rb') as file_ptr:
+                    bin_media = file_ptr.read()
+                    if bin_media:
+                        bin_id = cls.grid_fs.put(bin_media,
+                                                 filename=file_path.name,
+                                                 audio_hash=audio_hash)
+                return bin_id
+            print(f"input path not found... {file_path}")
             return None
         except (gridfs.errors.GridFSError, gridfs.errors.FileExists) as exc:
             print(f"  {sys.exc_info()[0]}\n {exc}")
@@ -1,27 +1,40 @@
 # -*- coding: UTF-8 -*-
 """MongoDB driver module to insert tag data into NoSQL database."""
 import inspect
+import io
 import time
 import os
 import sys
 from pathlib import Path
-from lib import config, user_input, media_tools
+from lib import config, hash_cache, user_input, media_tools
 from db import mongodb_api, cmd_args
 
 MODULE_NAME = Path(__file__).resolve().name
 BASE_DIR = Path.cwd()
 PARENT_PATH = Path.cwd().parent
+# documents match on file identity plus audio payload, not on tag bytes
+UPSERT_KEY = ('file_name', 'audio_hash')
 
-__all__ = ['insert_files_mongodb', 'insert_tags_mongodb', 'build_media_list']
+__all__ = ['insert_files_mongodb', 'MongoSink', 'insert_tags_mongodb',
+           'backfill_audio_hash', 'build_media_list']
 
 
-def insert_files_mongodb(path_list: list, mdb) -> None:
-    """Inserts media files ('.mp3', '.m4a', etc.) into MongoDB."""
+def insert_files_mongodb(path_list: list, mdb,
+                         audio_hashes: dict = None) -> None:
+    """Inserts media files ('.mp3', '.m4a', etc.) into MongoDB.
+
+    audio_hashes: file name to 'audio_hash' of the upserted tags, files
+                  whose audio is already stored (retagged) are not uploaded.
+    """
     func_name = f"{inspect.currentframe().f_code.co_name}()"
     print(f"\n{func_name}")
+    audio_hashes = audio_hashes or {}
     try:
         for file_path in path_list:
-            object_id = mdb.store_bin_file(file_path)
+            # accepts Path or os.DirEntry from media_tools.iter_media_entries()
+            file_path = Path(os.fspath(file_path))
+            object_id = mdb.store_bin_file(
+                file_path, audio_hashes.get(file_path.name))
             print(f"   adding: {object_id}")
         status = f"SUCCESS! {len(path_list)} files added\n"
     except (OSError, IOError) as ex:
@@ -29,25 +42,118 @@ def insert_files_mongodb(path_list: list, mdb) -> None:
     print(status)
 
 
-def insert_tags_mongodb(tag_list: list, mdb) -> None:
-    """Inserts media metadata (tag data) into MongoDB."""
+class MongoSink:
+    """Incremental tag writer, upserts batch_size documents per bulk_write.
+
+    One unordered bulk_write() round trip per batch instead of an
+    update_one() (and find_one()) per record. Documents are keyed by
+    UPSERT_KEY, file name and audio payload hash: a retagged file updates
+    its tags and 'hash' in place instead of adding a document. Records
+    without 'hash' or 'audio_hash' (unreadable files) are skipped.
+    """
+
+    def __init__(self, mdb,
+                 batch_size: int = mongodb_api.UPSERT_BATCH_SIZE):
+        self.mdb = mdb
+        self.batch_size = batch_size
+        self.batch = []
+        self.audio_hashes = {}  # file name: audio_hash, for file uploads
+        self.count = 0
+        self.upserted = 0
+        self.matched = 0
+        self.skipped = 0
+        self.errors = 0
+
+    def write(self, tag_dict) -> None:
+        """Buffers one TrackRecord, upserted keyed by UPSERT_KEY."""
+        if (tag_dict.get('hash', '') in ('', 'no hash') or
+                tag_dict.get('audio_hash', '') in ('', 'no hash')):
+            self.skipped += 1
+            return
+        self.audio_hashes[tag_dict['file_name']] = tag_dict['audio_hash']
+        self.batch.append(tag_dict)
+        if len(self.batch) >= self.batch_size:
+            self._flush()
+
+    def _flush(self) -> None:
+        """Upserts buffered records in one bulk_write()."""
+        result = self.mdb.upsert_batch_tags(UPSERT_KEY, self.batch)
+        print(f"   adding: {len(result.upserted_ids)} new, "
+              f"{len(result.matched_ids)} existing")
+        self.count += len(self.batch)
+        self.upserted += len(result.upserted_ids)
+        self.matched += len(result.matched_ids)
+        self.errors += result.error_count
+        self.batch = []
+
+    def close(self) -> str:
+        """Upserts the last batch, returns status string."""
+        if self.batch:
+            self._flush()
+        status = (f"SUCCESS! {self.count} media tags added "
+                  f"({self.upserted} new, {self.matched} existing)")
+        if self.skipped:
+            status += f"\n~!ERROR!~ {self.skipped} files without hash skipped"
+        if self.errors:
+            status += f"\n~!ERROR!~ {self.errors} upserts failed"
+        return status
+
+
+def insert_tags_mongodb(tag_list, mdb,
+                        batch_size: int = config.MONGO_BATCH_SIZE) -> dict:
+    """Inserts media metadata (tag data) into MongoDB.
+
+    tag_list: list or iterable, e.g. media_tools.iter_stat_records() to
+              upsert records in batches of batch_size as they are parsed.
+    Returns file name to 'audio_hash' of the records written.
+    """
     func_name = f"{inspect.currentframe().f_code.co_name}()"
     print(f"\n{func_name}")
+    mongo_sink = MongoSink(mdb, batch_size)
     try:
         for tag_dict in tag_list:
-            object_id = mdb.upsert_single_tags('hash', tag_dict)
-            print(f"   adding: {object_id}")
-        status = f"SUCCESS! {len(tag_list)} media tags added"
+            mongo_sink.write(tag_dict)
+        status = mongo_sink.close()
     except (OSError, IOError) as ex:
         status = f"\n~!ERROR!~ {func_name} {sys.exc_info()[0]}\n{ex}"
     print(status)
+    return mongo_sink.audio_hashes
+
+
+def backfill_audio_hash(mdb) -> str:
+    """Sets 'audio_hash' of documents inserted before it was recorded.
+
+    The audio payload hash is computed from the document's GridFS file
+    (same file name), documents without a stored file are left as they
+    are until their file is upserted again.
+    """
+    func_name = f"{inspect.currentframe().f_code.co_name}()"
+    print(f"\n{func_name}")
+    updated, missing = 0, 0
+    for doc in mdb.get_media_without('audio_hash', ['file_name']):
+        file_path = Path(doc.get('file_name', ''))
+        grid_id = mdb.get_gridfs_id(file_path)
+        audio_hex = 'no hash'
+        if grid_id is not None:
+            audio_hex = media_tools.get_audio_hash(
+                file_path, io.BytesIO(mdb.get_bin_file(grid_id)))
+        if audio_hex == 'no hash':
+            missing += 1
+        elif mdb.update_existing(doc['_id'], {'audio_hash': audio_hex}):
+            updated += 1
+    status = f"SUCCESS! {updated} documents backfilled"
+    if missing:
+        status += f", {missing} without stored file"
+    print(status)
+    return status
 
 
-def build_media_list(input_path: Path):
+def build_media_list(input_path: Path, media_entries: list = None):
     """Find media files, parses tag data into list."""
     tag_list = []
     if input_path.exists() and input_path.is_dir():
-        tag_list = media_tools.build_stat_list(input_path)[0]
+        tag_list = media_tools.build_stat_list(
+            input_path, media_entries, workers=config.PARSE_WORKERS)[0]
     else:
         print(f"input path not found... {input_path}")
     return tag_list
@@ -87,10 +193,26 @@ def main():
                 mdb.show_database_status()
                 print(f"\npath_{num:02d}: "
                       f"'{os.sep.join(input_path.parts[-3:])}'")
-                media_tag_list = build_media_list(input_path)
-                insert_tags_mongodb(media_tag_list, mdb)
-                media_paths = media_tools.get_all_media_paths(input_path)
-                insert_files_mongodb(media_paths, mdb)
+                # single directory walk shared by tag parse and file insert
+                media_entries = list(
+                    media_tools.iter_media_entries(input_path))
+                # records are upserted as they are parsed, not listed first
+                if config.DEMO_ENABLED:
+                    cache_path = Path(BASE_DIR, 'data', 'output')
+                else:
+                    cache_path = Path(input_path, 'json')
+                # documents kept from runs before 'audio_hash' existed,
+                # backfilled first so the upserts below match them
+                backfill_audio_hash(mdb)
+                with hash_cache.HashCache(
+                        Path(cache_path, config.HASH_CACHE_NAME),
+                        use_xattr=config.HASH_CACHE_XATTR) as file_hashes:
+                    media_tag_iter = media_tools.iter_stat_records(
+                        input_path, media_entries,
+                        workers=config.PARSE_WORKERS, hash_cache=file_hashes)
+                    audio_hashes = insert_tags_mongodb(media_tag_iter, mdb)
+                    file_hashes.evict_missing(input_path)
+                insert_files_mongodb(media_entries, mdb, audio_hashes)
                 mdb.show_database_status()
         else:
             print(f"input path not found... {input_path}")
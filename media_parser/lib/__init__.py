@@ -1 +1,2 @@
-__all__ = ['config', 'file_tools', 'media_tools', 'user_input']
+__all__ = ['catalog', 'config', 'export_tools', 'file_tools', 'hash_cache',
+           'media_tools', 'user_input']
@@ -0,0 +1,171 @@
+# -*- coding: UTF-8 -*-
+"""Catalog module, local SQLite track catalog with full-text search."""
+import datetime
+import inspect
+from pathlib import Path
+import sqlite3
+import sys
+from typing import Iterator
+from . import media_tools
+
+SQL_TYPES = {int: 'INTEGER', float: 'REAL', str: 'TEXT',
+             datetime.datetime: 'TEXT'}  # ISO 'YYYY-MM-DD HH:MM:SS[.f]'
+INDEXED_FIELDS = ['hash', 'artist_name', 'album_title', 'genre',
+                  'last_modified']
+SEARCH_FIELDS = ['artist_name', 'album_title', 'track_title']
+SEARCH_LIMIT = 100  # records returned by search()
+SCHEMA_VERSION = 1  # PRAGMA user_version, bump when the tracks columns change
+SHOW_METHODS = False
+
+__all__ = ['MediaCatalog']
+
+COLUMNS = ', '.join(f'"{hdr}"' for hdr in media_tools.HEADER_KEYS)
+TRACK_COLUMNS = ', '.join(f'tracks."{hdr}"' for hdr in media_tools.HEADER_KEYS)
+CREATE_STATEMENTS = [
+    "CREATE TABLE IF NOT EXISTS tracks (track_rowid INTEGER PRIMARY KEY, " +
+    ', '.join(f'"{hdr}" {SQL_TYPES[col_type]}' for hdr, col_type
+              in media_tools.COLUMN_TYPES.items()) + ")",
+    *[f'CREATE INDEX IF NOT EXISTS tracks_{field} ON tracks ("{field}")'
+      for field in INDEXED_FIELDS],
+    # external content FTS5 table, rebuilt from tracks after inserts
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS tracks_fts USING fts5("
+    f"{', '.join(SEARCH_FIELDS)}, content='tracks', "
+    f"content_rowid='track_rowid')"]
+INSERT_TRACK = (f"INSERT INTO tracks ({COLUMNS}) VALUES "
+                f"({', '.join('?' * len(media_tools.HEADER_KEYS))})")
+
+
+def show_methods(method_name: str) -> None:
+    """Display method names for verbose/debugging."""
+    if SHOW_METHODS:
+        print(f"{method_name.upper()}()")
+
+
+class MediaCatalog:
+    """Track records in a local SQLite file, queried without a server.
+
+    One 'tracks' row per record, indexed on INDEXED_FIELDS, with an FTS5
+    table over artist, album and track title. WAL journal mode lets
+    readers query while records are inserted in executemany() batches.
+    The FTS5 table is rebuilt once after inserts, by the next search()
+    or close(), which is faster than indexing row by row.
+    Tables of another SCHEMA_VERSION are dropped and created again.
+    """
+
+    def __init__(self, db_path: Path):
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(str(self.db_path))
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        version = self.conn.execute("PRAGMA user_version").fetchone()[0]
+        if version != SCHEMA_VERSION:
+            self.conn.execute("DROP TABLE IF EXISTS tracks_fts")
+            self.conn.execute("DROP TABLE IF EXISTS tracks")
+            self.conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        for statement in CREATE_STATEMENTS:
+            self.conn.execute(statement)
+        self.conn.commit()
+        self.search_stale = False
+        self.date_columns = [
+            col for col, col_type
+            in enumerate(media_tools.COLUMN_TYPES.values())
+            if col_type is datetime.datetime]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        self.close()
+
+    def __len__(self) -> int:
+        return self.conn.execute("SELECT COUNT(*) FROM tracks").fetchone()[0]
+
+    def clear(self) -> None:
+        """Deletes all tracks, before the catalog is populated again."""
+        show_methods(inspect.currentframe().f_code.co_name)
+        self.conn.execute("DELETE FROM tracks")
+        self.conn.execute("INSERT INTO tracks_fts(tracks_fts) "
+                          "VALUES ('delete-all')")
+        self.conn.commit()
+
+    def insert_rows(self, rows: list) -> None:
+        """Inserts HEADER_KEYS ordered value lists in one transaction."""
+        for row in rows:
+            for col in self.date_columns:
+                if row[col] is not None:
+                    row[col] = row[col].isoformat(' ')
+        with self.conn:
+            self.conn.executemany(INSERT_TRACK, rows)
+        self.search_stale = True
+
+    def update_search_index(self) -> None:
+        """Rebuilds the FTS5 table if tracks were inserted since."""
+        if self.search_stale:
+            show_methods(inspect.currentframe().f_code.co_name)
+            with self.conn:
+                self.conn.execute("INSERT INTO tracks_fts(tracks_fts) "
+                                  "VALUES ('rebuild')")
+            self.search_stale = False
+
+    def insert_records(self, records: list) -> None:
+        """Inserts TrackRecords (e.g. build_stat_list() records)."""
+        self.insert_rows([[record[hdr] for hdr in media_tools.HEADER_KEYS]
+                          for record in records])
+
+    def _select(self, query: str, params: tuple = ()) -> list:
+        """Returns TrackRecords of the rows selected by query on tracks."""
+        return [media_tools.TrackRecord(zip(media_tools.HEADER_KEYS, row))
+                for row in self.conn.execute(
+                    f"SELECT {TRACK_COLUMNS} FROM {query}", params)]
+
+    def find(self, **fields) -> list:
+        """Returns records equal to all field values, e.g. genre='Jazz'."""
+        for field in fields:
+            if field not in media_tools.HEADER_KEYS:
+                raise ValueError(f"invalid field: '{field}'")
+        values = [value.isoformat(' ') if isinstance(value, datetime.datetime)
+                  else value for value in fields.values()]
+        where = ' AND '.join(f'"{field}" = ?' for field in fields)
+        return self._select(f"tracks WHERE {where} ORDER BY track_rowid"
+                            if fields else "tracks ORDER BY track_rowid",
+                            values)
+
+    def find_by_hash(self, digest: str) -> list:
+        """Returns records of files with the given 'hash' digest."""
+        return self.find(hash=digest)
+
+    def modified_since(self, since: datetime.datetime) -> list:
+        """Returns records last modified at or after since."""
+        return self._select('tracks WHERE "last_modified" >= ? '
+                            'ORDER BY "last_modified"',
+                            (since.isoformat(' '),))
+
+    def search(self, text: str, limit: int = SEARCH_LIMIT) -> list:
+        """Full-text search of artist/album/title, best matches first.
+
+        Words match as prefixes, all words must match in any field.
+        """
+        query = ' '.join('"{}"*'.format(word.replace('"', '""'))
+                         for word in text.split())
+        if not query:
+            return []
+        self.update_search_index()
+        return self._select(
+            "tracks_fts JOIN tracks ON tracks.track_rowid = tracks_fts.rowid "
+            "WHERE tracks_fts MATCH ? ORDER BY rank LIMIT ?", (query, limit))
+
+    def iter_records(self) -> Iterator[media_tools.TrackRecord]:
+        """Yields all records in insert order."""
+        for row in self.conn.execute(
+                f"SELECT {COLUMNS} FROM tracks ORDER BY track_rowid"):
+            yield media_tools.TrackRecord(zip(media_tools.HEADER_KEYS, row))
+
+    def close(self) -> None:
+        """Commits pending rows and closes the database."""
+        try:
+            self.update_search_index()
+            self.conn.commit()
+            self.conn.close()
+        except sqlite3.Error as exc:
+            print(f"\n~!ERROR!~ {sys.exc_info()[0]} {exc}")
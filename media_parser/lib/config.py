@@ -16,6 +16,17 @@ DEBUG = False
 VERBOSE = False
 DEMO_ENABLED = True
 TEMP_TAG = '~'
+PARSE_WORKERS = 1  # >1: process-pool tag extraction in build_stat_list()
+FIND_DUPLICATES = False  # size -> head/tail -> full hash duplicate report
+HASH_CACHE_NAME = '~hash_cache.sqlite'  # digests keyed by inode/mtime_ns
+HASH_CACHE_XATTR = False  # also store digests as user.* extended attributes
+EXCEL_CONSTANT_MEMORY = False  # stream report rows to disk, flat memory
+EXCEL_SHARD_ROWS = 1048575  # media rows per worksheet, Excel row limit
+EXCEL_SHARD_BY = 'rows'  # 'rows' or 'folder': one shard per top-level folder
+EXCEL_SHARD_TO = 'sheet'  # 'sheet' or 'workbook': one .xlsx file per shard
+EXCEL_WIDTH_SAMPLE = 10000  # constant_memory: rows sized exactly per sheet
+EXPORT_FORMATS = []  # 'csv', 'jsonl[.gz|.zst]', 'parquet', 'arrow', 'sqlite'
+MONGO_BATCH_SIZE = 1000  # upserts per MongoDB bulk_write() round trip
 
 __author__ = "github.pdx"
 __email__ = "github.pdx@runbox.com"
@@ -0,0 +1,345 @@
+# -*- coding: UTF-8 -*-
+"""Export tools module, streaming CSV, JSON Lines and Arrow/Parquet writers."""
+from abc import ABC, abstractmethod
+import csv
+import datetime
+import gzip
+import io
+import json
+import os
+import sqlite3
+import struct
+from pathlib import Path
+from typing import Iterator
+from . import catalog, media_tools
+
+try:  # optional, only needed by the 'parquet' and 'arrow' formats
+    import pyarrow
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+try:  # optional, only needed by the 'jsonl.zst' format
+    import zstandard
+except ImportError:
+    zstandard = None
+
+EXPORT_FORMATS = ['csv', 'jsonl', 'jsonl.gz', 'jsonl.zst', 'parquet', 'arrow',
+                  'sqlite']
+EXPORT_FILE_NAME = 'media_lib'  # media_lib.csv, media_lib.parquet, ...
+CHUNK_ROWS = 8192  # records per CSV writerows() call / Arrow record batch
+ARROW_TYPES = {int: 'int64', float: 'double', str: 'string',
+               datetime.datetime: 'timestamp[us]'}
+FRAME_ROWS = 1024  # JSON Lines records per gzip member/zstd frame
+INDEX_EXT = '.idx'  # sidecar of one INDEX_ENTRY per JSON Lines record
+INDEX_ENTRY = struct.Struct('<QI')  # frame offset, line offset in frame
+
+__all__ = ['arrow_schema', 'json_value', 'RecordSink', 'CsvSink',
+           'JsonLinesSink', 'JsonLinesReader', 'ArrowSink', 'CatalogSink',
+           'open_export_sink']
+
+
+def arrow_schema():
+    """Returns pyarrow.Schema of the HEADER_KEYS columns, native types."""
+    return pyarrow.schema(
+        [(hdr, pyarrow.type_for_alias(ARROW_TYPES[col_type]))
+         for hdr, col_type in media_tools.COLUMN_TYPES.items()])
+
+
+def json_value(value):
+    """JSON cell value, datetimes as ISO strings with milliseconds."""
+    if isinstance(value, datetime.datetime):
+        return value.isoformat(timespec='milliseconds')
+    return value
+
+
+class RecordSink(ABC):
+    """Chunked record writer, one 'media_lib' file per export format.
+
+    write(tags) buffers HEADER_KEYS values of chunk_rows records, each
+    full chunk is written at once, so memory stays bounded. The file is
+    created with the first chunk. Errors are reported in the status
+    string returned by close(), later writes are skipped.
+    Subclasses implement _open(), _write_rows() and _close().
+    """
+    export_format = ''
+    write_errors = (IOError, OSError, TypeError, ValueError)
+
+    def __init__(self, output_path: Path, chunk_rows: int = CHUNK_ROWS):
+        self.output_path = Path(output_path)
+        self.file_path = Path(output_path,
+                              f"{EXPORT_FILE_NAME}.{self.export_format}")
+        self.def_name = f"export_to_{self.export_format.replace('.', '_')}"
+        self.chunk_rows = chunk_rows
+        self.rows = []
+        self.row_count = 0
+        self.is_open = False
+        self.status = ''
+
+    def write(self, tags) -> None:
+        """Buffers one TrackRecord, writes the chunk once full."""
+        if self.status:
+            return
+        self.rows.append([tags[hdr] for hdr in media_tools.HEADER_KEYS])
+        if len(self.rows) >= self.chunk_rows:
+            self._flush()
+
+    def _flush(self) -> None:
+        """Writes buffered rows, opening the file on the first chunk."""
+        try:
+            if not self.is_open:
+                self.output_path.mkdir(parents=True, exist_ok=True)
+                self._open()
+                self.is_open = True
+            self._write_rows(self.rows)
+            self.row_count += len(self.rows)
+        except self.write_errors as exc:
+            self.status = f"\n~!ERROR!~ {self.def_name}() {exc}\n"
+        self.rows = []
+
+    @abstractmethod
+    def _open(self) -> None:
+        """Creates the export file, called before the first chunk."""
+
+    @abstractmethod
+    def _write_rows(self, rows: list) -> None:
+        """Writes one chunk of HEADER_KEYS ordered value lists."""
+
+    @abstractmethod
+    def _close(self) -> None:
+        """Finishes and closes the export file."""
+
+    def close(self) -> str:
+        """Writes the last chunk and closes file, returns status string."""
+        if self.rows and not self.status:
+            self._flush()
+        if self.is_open:
+            try:
+                self._close()
+            except self.write_errors as exc:
+                self.status = f"\n~!ERROR!~ {self.def_name}() {exc}\n"
+            if not self.status:
+                trunc_path = os.sep.join(self.file_path.parts[-3:])
+                self.status = f"SUCCESS! {self.def_name}() '{trunc_path}'\n"
+        elif not self.status:
+            self.status = f"ERROR! no data to export... {self.def_name}()\n"
+        print(self.status, end='')
+        return self.status
+
+
+class CsvSink(RecordSink):
+    """Streaming 'media_lib.csv' writer, header row then one row per record.
+
+    Missing values are empty cells, datetimes 'YYYY-MM-DD HH:MM:SS[.ffffff]'.
+    """
+    export_format = 'csv'
+
+    def _open(self) -> None:
+        self.csv_file = open(self.file_path, 'w', newline='',
+                             encoding='utf-8')
+        self.csv_writer = csv.writer(self.csv_file)
+        self.csv_writer.writerow(media_tools.HEADER_KEYS)
+
+    def _write_rows(self, rows: list) -> None:
+        self.csv_writer.writerows(rows)
+
+    def _close(self) -> None:
+        self.csv_file.close()
+
+
+class JsonLinesSink(RecordSink):
+    """Streaming 'media_lib.jsonl' writer, one JSON object per line.
+
+    compression: '', 'gz' or 'zst' (zstandard), each chunk of chunk_rows
+                 records is one gzip member/zstd frame, concatenated
+                 members/frames read back as one stream.
+    The '.idx' sidecar holds an INDEX_ENTRY per record: offset of its
+    frame (of the line itself if uncompressed) and of the line within
+    the decompressed frame, see JsonLinesReader.
+    """
+
+    def __init__(self, output_path: Path, compression: str = '',
+                 chunk_rows: int = FRAME_ROWS):
+        self.compression = compression
+        self.export_format = 'jsonl' + (f".{compression}" if compression
+                                        else '')
+        super().__init__(output_path, chunk_rows)
+        self.index_path = Path(f"{self.file_path}{INDEX_EXT}")
+        if compression == 'zst' and zstandard is None:
+            self.status = (f"\n~!ERROR!~ {self.def_name}() "
+                           f"zstandard is not installed\n")
+
+    def _open(self) -> None:
+        self.jsonl_file = open(self.file_path, 'wb')
+        self.index_file = open(self.index_path, 'wb')
+        self.compressor = None
+        if self.compression == 'zst':
+            self.compressor = zstandard.ZstdCompressor()
+
+    def _write_rows(self, rows: list) -> None:
+        frame_offset = self.jsonl_file.tell()
+        lines = [json.dumps(dict(zip(media_tools.HEADER_KEYS,
+                                     map(json_value, row))),
+                            ensure_ascii=False).encode() + b'\n'
+                 for row in rows]
+        entries = bytearray()
+        line_offset = 0
+        for line in lines:
+            if self.compression:
+                entries += INDEX_ENTRY.pack(frame_offset, line_offset)
+            else:
+                entries += INDEX_ENTRY.pack(frame_offset + line_offset, 0)
+            line_offset += len(line)
+        frame = b''.join(lines)
+        if self.compression == 'gz':
+            frame = gzip.compress(frame)
+        elif self.compression == 'zst':
+            frame = self.compressor.compress(frame)
+        self.jsonl_file.write(frame)
+        self.index_file.write(entries)
+
+    def _close(self) -> None:
+        self.jsonl_file.close()
+        self.index_file.close()
+
+
+class JsonLinesReader:
+    """Random access to JsonLinesSink files through the '.idx' sidecar.
+
+    reader[num] seeks to the 0-based record num, decompressing at most
+    one frame, iter_records(start) streams TrackRecords from there on.
+    Each iter_records() call reads its own file handle, so several
+    iterators can be consumed interleaved.
+    """
+
+    def __init__(self, file_path: Path):
+        self.file_path = Path(file_path)
+        self.compression = {'.gz': 'gz', '.zst': 'zst'}.get(
+            self.file_path.suffix, '')
+        self.index_file = open(f"{self.file_path}{INDEX_EXT}", 'rb')
+        self.index_file.seek(0, os.SEEK_END)
+        self.record_count = self.index_file.tell() // INDEX_ENTRY.size
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        self.close()
+
+    def __len__(self) -> int:
+        return self.record_count
+
+    def __getitem__(self, num: int) -> media_tools.TrackRecord:
+        if not 0 <= num < self.record_count:
+            raise IndexError(f"record {num} not in 0-{self.record_count}")
+        records = self.iter_records(num)
+        try:
+            return next(records)
+        finally:
+            records.close()
+
+    def _open_stream(self, jsonl_file, frame_offset: int):
+        """Returns decompressed byte stream starting at frame_offset."""
+        jsonl_file.seek(frame_offset)
+        if self.compression == 'gz':
+            return gzip.GzipFile(fileobj=jsonl_file)
+        if self.compression == 'zst':
+            return io.BufferedReader(
+                zstandard.ZstdDecompressor().stream_reader(
+                    jsonl_file, read_across_frames=True, closefd=False))
+        return jsonl_file
+
+    def iter_records(self, start: int = 0) -> Iterator[
+            media_tools.TrackRecord]:
+        """Yields records from 0-based record number start to the end."""
+        if not 0 <= start < self.record_count:
+            if start == self.record_count:
+                return
+            raise IndexError(f"record {start} not in 0-{self.record_count}")
+        self.index_file.seek(start * INDEX_ENTRY.size)
+        frame_offset, line_offset = INDEX_ENTRY.unpack(
+            self.index_file.read(INDEX_ENTRY.size))
+        with open(self.file_path, 'rb') as jsonl_file:
+            stream = self._open_stream(jsonl_file, frame_offset)
+            stream.read(line_offset)
+            for line in stream:
+                yield media_tools.TrackRecord(json.loads(line))
+
+    def close(self) -> None:
+        """Closes the index file."""
+        self.index_file.close()
+
+
+class ArrowSink(RecordSink):
+    """Typed columnar writer, 'media_lib.parquet' or Arrow IPC file.
+
+    Each chunk becomes one record batch of arrow_schema() columns
+    (a Parquet row group), no DataFrame is built. Requires pyarrow.
+    """
+
+    def __init__(self, output_path: Path, export_format: str = 'parquet',
+                 chunk_rows: int = CHUNK_ROWS):
+        self.export_format = export_format
+        super().__init__(output_path, chunk_rows)
+        self.schema = None
+        self.writer = None
+        if pyarrow is None:
+            self.status = (f"\n~!ERROR!~ {self.def_name}() "
+                           f"pyarrow is not installed\n")
+
+    def _open(self) -> None:
+        self.schema = arrow_schema()
+        if self.export_format == 'parquet':
+            self.writer = pyarrow.parquet.ParquetWriter(str(self.file_path),
+                                                        self.schema)
+        else:
+            self.writer = pyarrow.ipc.new_file(str(self.file_path),
+                                               self.schema)
+
+    def _write_rows(self, rows: list) -> None:
+        arrays = [pyarrow.array(column, type=field.type)
+                  for column, field in zip(zip(*rows), self.schema)]
+        batch = pyarrow.RecordBatch.from_arrays(arrays, schema=self.schema)
+        if self.export_format == 'parquet':
+            self.writer.write_table(pyarrow.Table.from_batches([batch]))
+        else:
+            self.writer.write_batch(batch)
+
+    def _close(self) -> None:
+        self.writer.close()
+
+
+class CatalogSink(RecordSink):
+    """'media_lib.sqlite' catalog writer, see catalog.MediaCatalog.
+
+    Tracks of a previous export are replaced, each chunk is inserted by
+    one executemany() transaction.
+    """
+    export_format = 'sqlite'
+    write_errors = RecordSink.write_errors + (sqlite3.Error,)
+
+    def _open(self) -> None:
+        self.catalog = catalog.MediaCatalog(self.file_path)
+        self.catalog.clear()
+
+    def _write_rows(self, rows: list) -> None:
+        self.catalog.insert_rows(rows)
+
+    def _close(self) -> None:
+        self.catalog.close()
+
+
+def open_export_sink(output_path: Path, export_format: str,
+                     chunk_rows: int = CHUNK_ROWS) -> RecordSink:
+    """Returns record sink of an EXPORT_FORMATS format."""
+    if export_format not in EXPORT_FORMATS:
+        raise ValueError(f"invalid export format: '{export_format}' "
+                         f"not in {EXPORT_FORMATS}")
+    if export_format == 'csv':
+        return CsvSink(output_path, chunk_rows)
+    if export_format == 'sqlite':
+        return CatalogSink(output_path, chunk_rows)
+    if export_format.startswith('jsonl'):
+        return JsonLinesSink(output_path, export_format[len('jsonl.'):],
+                             min(chunk_rows, FRAME_ROWS))
+    return ArrowSink(output_path, export_format, chunk_rows)
@@ -7,9 +7,11 @@ from pathlib import Path
 import string
 import sys
 import hashlib
+import json
 import traceback
 from collections import OrderedDict
-from collections import Counter
+from collections import Counter, defaultdict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
 import chardet
 
 MODULE_NAME = Path(__file__).resolve().name
@@ -18,13 +20,25 @@ PARENT_PATH = Path.cwd().parent
 IS_WINDOWS = sys.platform.startswith('win')
 DEBUG = False
 SHOW_METHODS = False
+HASH_BUFFER_SIZE = 1024 * 1024  # bytes, reused read buffer per hash
+PARTIAL_HASH_SIZE = 64 * 1024  # bytes hashed from both head and tail
+HASH_WORKERS = min(8, os.cpu_count() or 1)  # HashPool threads
+# hashlib constructors by name, register_hash_algorithm() adds more;
+# sha3_256 is the media report 'hash' column, sha256 get_sha256_hash()
+HASH_ALGORITHMS = OrderedDict([('blake2b', hashlib.blake2b),
+                               ('sha256', hashlib.sha256),
+                               ('sha3_256', hashlib.sha3_256)])
 
 __all__ = ['build_index_alphabet', 'bytes_to_readable',
-           'is_encoded', 'check_encoding', 'remove_accents', 'get_sha256_hash',
+           'is_encoded', 'check_encoding', 'remove_accents',
+           'register_hash_algorithm', 'new_hash', 'update_file_hash',
+           'get_file_hash', 'get_head_tail_hash', 'get_sha256_hash',
+           'HashPool',
            'get_directory_size', 'split_path', 'is_config_in_path',
            'generate_date_str', 'save_output_txt', 'count_files',
            'build_parent_size_str', 'build_ext_count_str',
-           'get_dir_stats', 'get_directories', 'get_files', 'get_extensions']
+           'get_dir_stats', 'get_directories', 'get_files', 'get_extensions',
+           'DirectoryInventory', 'DuplicateGroup', 'DuplicateFinder']
 
 
 def show_methods(method_name: str) -> None:
@@ -131,23 +145,133 @@ def remove_accents(byte_input, byte_enc: str, confidence: float) -> str:
     return dec_str
 
 
+def register_hash_algorithm(name: str, constructor) -> None:
+    """Adds hash constructor (hashlib API: update/hexdigest) by name."""
+    HASH_ALGORITHMS[name] = constructor
+
+
+def new_hash(algorithm: str = 'sha256'):
+    """Returns new hash object of a registered or hashlib algorithm."""
+    constructor = HASH_ALGORITHMS.get(algorithm)
+    if constructor is None:
+        return hashlib.new(algorithm)  # ValueError if unsupported
+    return constructor()
+
+
+def update_file_hash(hash_obj, file_ptr,
+                     buffer_size: int = HASH_BUFFER_SIZE):
+    """Streams open binary file into hash object with a reused buffer."""
+    read_buffer = bytearray(buffer_size)
+    buffer_view = memoryview(read_buffer)
+    n_bytes = file_ptr.readinto(read_buffer)
+    while n_bytes:
+        hash_obj.update(buffer_view[:n_bytes])
+        n_bytes = file_ptr.readinto(read_buffer)
+    return hash_obj
+
+
+def get_file_hash(input_path: Path, algorithm: str = 'sha256',
+                  buffer_size: int = HASH_BUFFER_SIZE) -> str:
+    """Returns upper case hex digest, memory bounded by buffer_size."""
+    hash_obj = new_hash(algorithm)
+    # unbuffered: readinto() fills read_buffer without an extra copy
+    with open(str(input_path), 'rb', buffering=0) as file_pointer:
+        update_file_hash(hash_obj, file_pointer, buffer_size)
+    return str(hash_obj.hexdigest().upper())
+
+
+def get_head_tail_hash(input_path: Path, size: int,
+                       chunk_size: int = PARTIAL_HASH_SIZE,
+                       algorithm: str = 'sha3_256') -> str:
+    """Hashes head and tail chunks, the whole file if at most two chunks."""
+    hash_obj = new_hash(algorithm)
+    with open(str(input_path), 'rb') as file_pointer:
+        if size <= 2 * chunk_size:
+            hash_obj.update(file_pointer.read())
+        else:
+            hash_obj.update(file_pointer.read(chunk_size))
+            file_pointer.seek(-chunk_size, os.SEEK_END)
+            hash_obj.update(file_pointer.read(chunk_size))
+    return str(hash_obj.hexdigest().upper())
+
+
 def get_sha256_hash(input_path: Path) -> str:
     """Returns hash value of input filepath."""
     sha_hex = 'no hash'
     if isinstance(input_path, Path):
         if input_path.exists():
             try:
-                file_pointer = open(str(input_path), 'rb')
-                fp_read = file_pointer.read()
-                sha_hash = hashlib.sha256(fp_read)
-                sha_hex = str(sha_hash.hexdigest().upper())
-                file_pointer.close()
+                sha_hex = get_file_hash(input_path, 'sha256')
             except (OSError, PermissionError) as exc:
                 print(f"\nERROR: {inspect.currentframe().f_code.co_name}()")
                 print(f"  {sys.exc_info()[0]}\n{exc}")
     return sha_hex
 
 
+class HashPool:
+    """Thread pool hashing backend, one file per task.
+
+    hashlib releases the GIL while hashing buffers over 2 KiB, so with
+    HASH_BUFFER_SIZE reads the threads hash on separate cores without the
+    start-up and pickling cost of a process pool. workers=1 hashes on the
+    calling thread. Used by DuplicateFinder; scan-time hashing stays in
+    media_tools, where tags and hashes come from one read of the file.
+    """
+
+    def __init__(self, algorithm: str = 'sha3_256',
+                 workers: int = HASH_WORKERS,
+                 buffer_size: int = HASH_BUFFER_SIZE):
+        new_hash(algorithm)  # ValueError for unknown algorithms
+        self.algorithm = algorithm
+        self.workers = max(1, workers)
+        self.buffer_size = buffer_size
+        self.executor = None
+        if self.workers > 1:
+            self.executor = ThreadPoolExecutor(max_workers=self.workers)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        self.close()
+
+    def hash_file(self, file_path: Path) -> str:
+        """Returns upper case hex digest of the whole file."""
+        return get_file_hash(Path(file_path), self.algorithm,
+                             self.buffer_size)
+
+    def hash_head_tail(self, file_path: Path, size: int,
+                       chunk_size: int = PARTIAL_HASH_SIZE) -> str:
+        """Returns upper case hex digest of head and tail chunks."""
+        return get_head_tail_hash(file_path, size, chunk_size,
+                                  self.algorithm)
+
+    def _call(self, hash_func, args: tuple) -> str:
+        """Runs one task, None if the file cannot be read."""
+        try:
+            return hash_func(*args)
+        except OSError:
+            show_exception()
+            return None
+
+    def map(self, hash_func, args_list: list) -> list:
+        """Returns hash_func(*args) per args tuple, in order."""
+        if self.executor is None:
+            return [self._call(hash_func, args) for args in args_list]
+        return list(self.executor.map(
+            lambda args: self._call(hash_func, args), args_list))
+
+    def hash_files(self, file_paths: list) -> list:
+        """Returns digests of whole files, None for unreadable files."""
+        return self.map(self.hash_file, [(path,) for path in file_paths])
+
+    def close(self) -> None:
+        """Shuts the thread pool down."""
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+
+
 def get_directory_size(input_path: Path,
                        recursive: bool = True) -> int:
     """Returns sum of file sizes from input directory path."""
@@ -257,27 +381,289 @@ def count_files(input_path: Path, file_ext: str = '.mp3') -> int:
     return file_count
 
 
-def build_parent_size_str(input_path: Path) -> str:
+class DirectoryInventory:
+    """Directory sizes, extension counts and mtimes from one os.scandir() walk.
+
+    Directory sizes are rolled up bottom-up once the walk completes, so every
+    report section reads from the inventory in linear time instead of
+    re-walking each subdirectory.
+    """
+
+    def __init__(self, input_path: Path, keep_files: bool = False):
+        self.root = Path(input_path).absolute()
+        self.dir_sizes = {}  # recursive size in bytes, keyed by dir path str
+        self.dir_mtimes = {}  # st_mtime keyed by dir path str
+        self.ext_counts = Counter()  # file extension counts, as rglob("*.*")
+        self.file_count = 0
+        # keep_files: (st_size, st_dev, st_ino) keyed by file path str
+        self.file_stats = {} if keep_files else None
+        self.is_valid = isinstance(input_path, Path) and input_path.exists()
+        if self.is_valid:
+            self._scan()
+
+    def _scan(self) -> None:
+        """Walks the tree once, then rolls directory sizes up to the root."""
+        show_methods(inspect.currentframe().f_code.co_name)
+        root_str = str(self.root)
+        parent_dirs = {root_str: None}
+        self.dir_sizes[root_str] = 0
+        self.dir_mtimes[root_str] = self.root.stat().st_mtime
+        walk_order = []  # pre-order: parents always before their children
+        pending_dirs = [root_str]
+        while pending_dirs:
+            dir_path = pending_dirs.pop()
+            walk_order.append(dir_path)
+            try:
+                with os.scandir(dir_path) as dir_iter:
+                    for entry in dir_iter:
+                        try:
+                            if entry.is_dir(follow_symlinks=False):
+                                parent_dirs[entry.path] = dir_path
+                                self.dir_sizes[entry.path] = 0
+                                self.dir_mtimes[entry.path] = \
+                                    entry.stat().st_mtime
+                                pending_dirs.append(entry.path)
+                            elif entry.is_file():
+                                file_stat = entry.stat()
+                                self.dir_sizes[dir_path] += file_stat.st_size
+                                self.file_count += 1
+                                if self.file_stats is not None:
+                                    self.file_stats[entry.path] = (
+                                        file_stat.st_size, file_stat.st_dev,
+                                        file_stat.st_ino)
+                                if '.' in entry.name:
+                                    file_ext = os.path.splitext(entry.name)[1]
+                                    self.ext_counts[file_ext] += 1
+                        except OSError:
+                            continue
+            except OSError:
+                continue
+        for dir_path in reversed(walk_order):
+            parent = parent_dirs[dir_path]
+            if parent is not None:
+                self.dir_sizes[parent] += self.dir_sizes[dir_path]
+
+    @property
+    def total_size(self) -> int:
+        """Returns recursive size of the inventory root directory."""
+        return self.dir_sizes.get(str(self.root), 0)
+
+    def get_size(self, dir_path: Path) -> int:
+        """Returns recursive size of a directory within the inventory."""
+        return self.dir_sizes.get(str(Path(dir_path).absolute()), 0)
+
+    def get_mtime(self, dir_path: Path) -> float:
+        """Returns last modified timestamp of a directory in the inventory."""
+        return self.dir_mtimes.get(str(Path(dir_path).absolute()), 0.0)
+
+    def get_directories(self) -> list:
+        """Returns sorted subdirectories, same as get_directories()."""
+        root_str = str(self.root)
+        return sorted(Path(p) for p in self.dir_sizes
+                      if p != root_str and is_config_in_path(Path(p)))
+
+
+DuplicateGroup = namedtuple('DuplicateGroup', ['size', 'hash', 'paths'])
+
+
+class DuplicateFinder:
+    """Finds byte-identical files of an inventory in three tiers.
+
+    Files are grouped by size, same-size files by a hash of their head and
+    tail chunks, and only files still colliding are hashed in full, so
+    unique sizes are never opened. Needs DirectoryInventory(keep_files=True);
+    hard links to one inode are counted once. With an optional
+    hash_cache.HashCache, unchanged files are not read again on later runs.
+    Each tier is hashed on a HashPool of workers threads.
+    """
+
+    def __init__(self, inventory: DirectoryInventory, extensions=None,
+                 algorithm: str = 'sha3_256',
+                 partial_size: int = PARTIAL_HASH_SIZE, min_size: int = 1,
+                 hash_cache=None, workers: int = HASH_WORKERS):
+        self.inventory = inventory
+        self.hash_cache = hash_cache
+        self.workers = workers
+        self.extensions = ({ext.lower() for ext in extensions}
+                           if extensions else None)
+        self.algorithm = algorithm
+        self.partial_size = partial_size
+        self.min_size = min_size
+        self.groups = []
+        self.counts = OrderedDict([('files', 0), ('total_bytes', 0),
+                                   ('size_collisions', 0),
+                                   ('partial_hashed', 0),
+                                   ('full_hashed', 0), ('cache_hits', 0),
+                                   ('bytes_read', 0), ('errors', 0)])
+
+    def _size_groups(self) -> list:
+        """Returns [(size, paths)] for sizes shared by two or more files."""
+        size_dict = defaultdict(list)
+        inodes = set()
+        for file_path, (size, dev, ino) in sorted(
+                (self.inventory.file_stats or {}).items()):
+            if size < self.min_size or not is_config_in_path(Path(file_path)):
+                continue
+            if self.extensions is not None and \
+                    os.path.splitext(file_path)[1].lower() \
+                    not in self.extensions:
+                continue
+            if ino:  # scandir on Windows reports st_ino 0, never a link
+                if (dev, ino) in inodes:
+                    continue
+                inodes.add((dev, ino))
+            self.counts['files'] += 1
+            self.counts['total_bytes'] += size
+            size_dict[size].append(file_path)
+        return [(size, paths) for size, paths in size_dict.items()
+                if len(paths) > 1]
+
+    def _cache_key(self, tier: str, size: int) -> str:
+        """Hash cache key of a 'partial' or 'full' tier digest."""
+        if tier == 'full' or size <= 2 * self.partial_size:
+            return self.algorithm  # small files: partial is the full hash
+        return f"{self.algorithm}_head_tail_{self.partial_size}"
+
+    def _hash_files(self, hash_pool: HashPool, files: list,
+                    tier: str) -> dict:
+        """Returns {file path: digest} of (path, size) files for one tier.
+
+        Cache lookups and counters stay on the calling thread, only the
+        reads and hash updates of cache misses run on the hash pool.
+        """
+        digests = {}
+        pending_files = []
+        for file_path, size in files:
+            cache_key = self._cache_key(tier, size)
+            digest = None
+            if self.hash_cache is not None:
+                digest = self.hash_cache.get(file_path, cache_key)
+            if digest is None:
+                pending_files.append((file_path, size, cache_key))
+            else:
+                self.counts['cache_hits'] += 1
+                digests[file_path] = digest
+        if tier == 'partial':
+            results = hash_pool.map(hash_pool.hash_head_tail,
+                                    [(file_path, size, self.partial_size)
+                                     for file_path, size, _ in pending_files])
+        else:
+            results = hash_pool.hash_files(
+                [file_path for file_path, _, _ in pending_files])
+        for (file_path, size, cache_key), digest in zip(pending_files,
+                                                        results):
+            if digest is None:
+                self.counts['errors'] += 1
+                continue
+            self.counts[f"{tier}_hashed"] += 1
+            if tier == 'partial':
+                self.counts['bytes_read'] += min(size, 2 * self.partial_size)
+            else:
+                self.counts['bytes_read'] += size
+            digests[file_path] = digest
+            if self.hash_cache is not None:
+                self.hash_cache.put(file_path, cache_key, digest)
+        return digests
+
+    @staticmethod
+    def _group_by_digest(paths: list, digests: dict) -> list:
+        """Returns [(digest, paths)] sharing a digest, drops singletons."""
+        hash_dict = defaultdict(list)
+        for file_path in paths:
+            if file_path in digests:
+                hash_dict[digests[file_path]].append(file_path)
+        return [(digest, same) for digest, same in hash_dict.items()
+                if len(same) > 1]
+
+    def find(self) -> list:
+        """Returns duplicate groups, most wasted bytes first."""
+        show_methods(inspect.currentframe().f_code.co_name)
+        self.groups = []
+        size_groups = self._size_groups()
+        with HashPool(self.algorithm, self.workers) as hash_pool:
+            partial_digests = self._hash_files(
+                hash_pool, [(file_path, size) for size, paths in size_groups
+                            for file_path in paths], 'partial')
+            full_candidates = []  # (size, paths) colliding on head/tail
+            for size, paths in size_groups:
+                self.counts['size_collisions'] += len(paths)
+                for digest, same in self._group_by_digest(paths,
+                                                          partial_digests):
+                    if size > 2 * self.partial_size:
+                        full_candidates.append((size, same))
+                    else:  # partial hash already covered every byte
+                        self.groups.append(DuplicateGroup(size, digest, same))
+            full_digests = self._hash_files(
+                hash_pool, [(file_path, size) for size, paths
+                            in full_candidates for file_path in paths],
+                'full')
+        for size, paths in full_candidates:
+            self.groups.extend(
+                DuplicateGroup(size, digest, same) for digest, same
+                in self._group_by_digest(paths, full_digests))
+        self.groups.sort(key=lambda g: (-g.size * (len(g.paths) - 1),
+                                        g.paths[0]))
+        return self.groups
+
+    def summary(self) -> str:
+        """Returns one line of counts and the fraction of bytes read."""
+        counts = self.counts
+        read_pct = 100.0 * counts['bytes_read'] / max(counts['total_bytes'], 1)
+        wasted = sum(g.size * (len(g.paths) - 1) for g in self.groups)
+        return (f"duplicates: {len(self.groups)} groups "
+                f"[{bytes_to_readable(wasted)} wasted] "
+                + ', '.join(f"{key}: {val}" for key, val in counts.items())
+                + f" ({read_pct:0.2f}% of bytes read)\n")
+
+    def save_json(self, output_path: Path,
+                  file_name: str = '~duplicates.json') -> str:
+        """Exports summary counts and duplicate groups as JSON."""
+        def_name = inspect.currentframe().f_code.co_name
+        json_path = Path(output_path, file_name)
+        report = OrderedDict([
+            ('algorithm', self.algorithm),
+            ('counts', self.counts),
+            ('groups', [OrderedDict([('hash', g.hash), ('size', g.size),
+                                     ('wasted', g.size * (len(g.paths) - 1)),
+                                     ('paths', g.paths)])
+                        for g in self.groups])])
+        try:
+            json_path.parent.mkdir(parents=True, exist_ok=True)
+            with open(json_path, 'w', encoding='utf-8') as json_file:
+                json.dump(report, json_file, indent=2, ensure_ascii=False)
+            status = (f"SUCCESS! {def_name}() "
+                      f"'{os.sep.join(json_path.parts[-3:])}'\n")
+        except (IOError, OSError) as exc:
+            status = f"\n~!ERROR!~ {def_name}() {exc}\n"
+        print(status, end='')
+        return status
+
+
+def build_parent_size_str(input_path: Path,
+                          inventory: DirectoryInventory = None) -> str:
     """Return list of directories within input path (including subfolders)."""
     output_str = ''
     if isinstance(input_path, Path):
-        dir_list = get_directories(input_path, recursive=True)
-        par_size = get_directory_size(input_path, recursive=True)
+        if inventory is None:
+            inventory = DirectoryInventory(input_path)
+        dir_list = inventory.get_directories()
+        par_size = inventory.total_size
         output_str += (f"\nfound: '{len(dir_list)}' directories "
                        f"[{bytes_to_readable(par_size)}]\n")
     print(f"{output_str}", end='')
     return output_str
 
 
-def build_ext_count_str(input_path: Path) -> str:
+def build_ext_count_str(input_path: Path,
+                        inventory: DirectoryInventory = None) -> str:
     """Returns recursive set of all file extensions as string."""
     output_str = 'default'
     if isinstance(input_path, Path):
         if input_path.exists():
-            ext_list = [str(p.suffix) for p in
-                        input_path.rglob("*.*") if p.is_file()]
+            if inventory is None:
+                inventory = DirectoryInventory(input_path)
             # get count of each unique extensions in alphabetical order
-            ext_dict = OrderedDict(Counter(sorted(ext_list)))
+            ext_dict = OrderedDict(sorted(inventory.ext_counts.items()))
             ext_count_str = ''
             for _ext, count in ext_dict.items():
                 ext_count_str += f"\t{count:04}\t{_ext:5} files\n"
@@ -287,16 +673,19 @@ def build_ext_count_str(input_path: Path) -> str:
     return output_str
 
 
-def get_dir_stats(input_path: Path) -> list:
+def get_dir_stats(input_path: Path,
+                  inventory: DirectoryInventory = None) -> list:
     """Return list of directory metadata."""
     dir_size_list = []
     print(input_path, type(input_path))
     if isinstance(input_path, Path):
-        dir_list = get_directories(input_path, recursive=True)
+        if inventory is None:
+            inventory = DirectoryInventory(input_path)
+        dir_list = inventory.get_directories()
         print(dir_list)
         for count, subdir_path in enumerate(dir_list):
-            dir_size = get_directory_size(subdir_path, recursive=True)
-            last_mod_ts = os.path.getmtime(subdir_path)
+            dir_size = inventory.get_size(subdir_path)
+            last_mod_ts = inventory.get_mtime(subdir_path)
             last_modified = datetime.fromtimestamp(last_mod_ts)
             dir_stat = [f"{count + 1:02}",
                         f"{dir_size:08}",
@@ -0,0 +1,195 @@
+# -*- coding: UTF-8 -*-
+"""Hash cache module, file digests persisted between scans."""
+from collections import OrderedDict
+import inspect
+import os
+from pathlib import Path
+import sqlite3
+import sys
+import time
+from . import file_tools
+
+RACY_WINDOW_NS = 2 * 10 ** 9  # mtime too close to now to trust
+COMMIT_EVERY = 256  # stored digests per sqlite transaction
+XATTR_PREFIX = 'user.media_parser.'  # one attribute per algorithm
+SHOW_METHODS = False
+
+__all__ = ['file_identity', 'HashCache']
+
+CREATE_TABLE = """
+CREATE TABLE IF NOT EXISTS file_hashes (
+    file_id TEXT NOT NULL,
+    algorithm TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    path TEXT NOT NULL,
+    digest TEXT NOT NULL,
+    PRIMARY KEY (file_id, algorithm)
+) WITHOUT ROWID"""
+
+
+def show_methods(method_name: str) -> None:
+    """Display method names for verbose/debugging."""
+    if SHOW_METHODS:
+        print(f"{method_name.upper()}()")
+
+
+def file_identity(file_path: str, file_stat: os.stat_result = None) -> tuple:
+    """Returns ('st_dev:st_ino', st_size, st_mtime_ns) of a file.
+
+    os.DirEntry.stat() on Windows reports st_ino 0, the file is stat'ed
+    again in that case.
+    """
+    if file_stat is None or not file_stat.st_ino:
+        file_stat = os.stat(file_path)
+    return (f"{file_stat.st_dev}:{file_stat.st_ino}", file_stat.st_size,
+            file_stat.st_mtime_ns)
+
+
+class HashCache:
+    """File digest cache keyed by device, inode, size and mtime_ns.
+
+    Digests of any hashlib algorithm (or derived keys such as the audio
+    payload hash) are kept in a local SQLite file, optionally in extended
+    attributes of the file itself. A changed size or mtime_ns is a miss,
+    so unchanged files are never read again to be hashed. Files modified
+    within RACY_WINDOW_NS of the lookup are not stored.
+    """
+
+    def __init__(self, db_path: Path, use_xattr: bool = False):
+        self.db_path = Path(db_path)
+        self.use_xattr = use_xattr and hasattr(os, 'setxattr')
+        self.counts = OrderedDict([('hits', 0), ('misses', 0),
+                                   ('stored', 0), ('evicted', 0)])
+        self.uncommitted = 0
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(str(self.db_path))
+        self.conn.execute(CREATE_TABLE)
+        self.conn.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        self.close()
+
+    def _get_xattr(self, file_path: str, algorithm: str,
+                   size: int, mtime_ns: int) -> str:
+        """Returns digest stored in the file's xattr if still valid."""
+        try:
+            value = os.getxattr(file_path, f"{XATTR_PREFIX}{algorithm}")
+            xattr_size, xattr_mtime_ns, digest = value.decode().split(':')
+        except (OSError, ValueError):
+            return None
+        if (int(xattr_size), int(xattr_mtime_ns)) == (size, mtime_ns):
+            return digest
+        return None
+
+    def _set_xattr(self, file_path: str, algorithm: str, size: int,
+                   mtime_ns: int, digest: str) -> bool:
+        """Stores digest as xattr, False if the filesystem refuses."""
+        try:
+            os.setxattr(file_path, f"{XATTR_PREFIX}{algorithm}",
+                        f"{size}:{mtime_ns}:{digest}".encode())
+        except OSError:
+            return False
+        return True
+
+    def get(self, file_path: str, algorithm: str,
+            file_stat: os.stat_result = None) -> str:
+        """Returns cached digest, None if missing or the file changed."""
+        file_path = str(file_path)
+        file_id, size, mtime_ns = file_identity(file_path, file_stat)
+        digest = None
+        if self.use_xattr:
+            digest = self._get_xattr(file_path, algorithm, size, mtime_ns)
+        if digest is None:
+            row = self.conn.execute(
+                "SELECT size, mtime_ns, path, digest FROM file_hashes "
+                "WHERE file_id = ? AND algorithm = ?",
+                (file_id, algorithm)).fetchone()
+            if row is not None and row[:2] == (size, mtime_ns):
+                digest = row[3]
+                if row[2] != file_path:  # renamed or moved, same inode
+                    self.conn.execute(
+                        "UPDATE file_hashes SET path = ? WHERE file_id = ?",
+                        (file_path, file_id))
+                    self._commit_later()
+        self.counts['hits' if digest is not None else 'misses'] += 1
+        return digest
+
+    def put(self, file_path: str, algorithm: str, digest: str,
+            file_stat: os.stat_result = None) -> None:
+        """Stores digest of the file as of file_stat."""
+        file_path = str(file_path)
+        file_id, size, mtime_ns = file_identity(file_path, file_stat)
+        if mtime_ns >= time.time_ns() - RACY_WINDOW_NS:
+            return  # may still change within the same timestamp tick
+        if self.use_xattr and self._set_xattr(file_path, algorithm, size,
+                                              mtime_ns, digest):
+            self.counts['stored'] += 1
+            return
+        self.conn.execute(
+            "INSERT OR REPLACE INTO file_hashes VALUES (?, ?, ?, ?, ?, ?)",
+            (file_id, algorithm, size, mtime_ns, file_path, digest))
+        self.counts['stored'] += 1
+        self._commit_later()
+
+    def _commit_later(self) -> None:
+        """Commits once every COMMIT_EVERY changes."""
+        self.uncommitted += 1
+        if self.uncommitted >= COMMIT_EVERY:
+            self.conn.commit()
+            self.uncommitted = 0
+
+    def get_file_hash(self, file_path: Path, algorithm: str = 'sha256',
+                      file_stat: os.stat_result = None) -> str:
+        """Returns cached digest, hashing and storing it on a miss."""
+        digest = self.get(file_path, algorithm, file_stat)
+        if digest is None:
+            if file_stat is None:
+                file_stat = os.stat(file_path)
+            digest = file_tools.get_file_hash(Path(file_path), algorithm)
+            self.put(file_path, algorithm, digest, file_stat)
+        return digest
+
+    def evict_missing(self, root_path: Path = None) -> int:
+        """Drops rows of deleted, replaced or modified files.
+
+        root_path: only rows of files below this directory are checked,
+                   so one cache can be shared by several libraries.
+        """
+        show_methods(inspect.currentframe().f_code.co_name)
+        query = "SELECT file_id, algorithm, size, mtime_ns, path " \
+                "FROM file_hashes"
+        params = ()
+        if root_path is not None:
+            root_str = os.path.join(os.path.abspath(root_path), '')
+            query += " WHERE substr(path, 1, ?) = ?"
+            params = (len(root_str), root_str)
+        stale_keys = []
+        for file_id, algorithm, size, mtime_ns, path in \
+                self.conn.execute(query, params).fetchall():
+            try:
+                if file_identity(path) != (file_id, size, mtime_ns):
+                    stale_keys.append((file_id, algorithm))
+            except OSError:
+                stale_keys.append((file_id, algorithm))
+        self.conn.executemany(
+            "DELETE FROM file_hashes WHERE file_id = ? AND algorithm = ?",
+            stale_keys)
+        self.conn.commit()
+        self.counts['evicted'] += len(stale_keys)
+        return len(stale_keys)
+
+    def summary(self) -> str:
+        """Returns hit/miss/store/evict counts."""
+        return ', '.join(f"{key}: {val}" for key, val in self.counts.items())
+
+    def close(self) -> None:
+        """Commits pending rows and closes the database."""
+        try:
+            self.conn.commit()
+            self.conn.close()
+        except sqlite3.Error as exc:
+            print(f"\n~!ERROR!~ {sys.exc_info()[0]} {exc}")
@@ -1,34 +1,184 @@
 # -*- coding: UTF-8 -*-
 """Media tools module to parse media tags."""
-from collections import OrderedDict
+from collections import OrderedDict, deque, namedtuple
+from collections.abc import Mapping
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import asyncio
 import datetime
+import functools
 import inspect
-import hashlib
+import io
+import itertools
+import json
+import operator
 import os
+import queue
+import re
+import struct
 import sys
+import threading
+import time
 from pathlib import Path
 import traceback
+from typing import AsyncIterator, Iterator
 import chardet
 import mutagen
+import mutagen.asf
+import mutagen.flac
+import mutagen.mp3
+import mutagen.mp4
+from . import file_tools
 
 AUDIO_EXT = ['.mp3', '.m4a', '.flac', '.wma']
+AUDIO_CLASSES = {'.mp3': mutagen.mp3.MP3,
+                 '.m4a': mutagen.mp4.MP4,
+                 '.flac': mutagen.flac.FLAC,
+                 '.wma': mutagen.asf.ASF}
+MEDIA_ORDERS = ['ext', 'path', 'folder', 'none']
+MANIFEST_VERSION = 3  # 3: records carry 'audio_hash'
+# 'hash'/'audio_hash' columns, any file_tools.HASH_ALGORITHMS name;
+# sha3_256 keeps digests comparable with earlier reports and MongoDB
+HASH_ALGORITHM = 'sha3_256'
+AUDIO_HASH_KEY = f"audio_{HASH_ALGORITHM}"  # hash cache key of 'audio_hash'
+RACY_WINDOW_NS = 2 * 10 ** 9  # mtime too close to scan start to trust
+PARSE_CHUNK_SIZE = 32  # files per process-pool task submission
+PIPELINE_STAGES = ['walk', 'stat', 'parse', 'hash', 'sink']
+PIPELINE_WORKERS = OrderedDict([('walk', 1), ('stat', 8), ('parse', 4),
+                                ('hash', 2), ('sink', 1)])
+PIPELINE_QUEUE_SIZE = 64  # items buffered between two stages
+PIPELINE_POLL = 0.1  # seconds, queue timeout to check for cancellation
+ASYNC_CONCURRENCY = 32  # filesystem calls in flight, AsyncScanner
+# chardet's UTF-8 prober is certain (0.99) from 6 multi-byte characters
+UTF8_SURE_CHARS = 6
+ENCODING_DIR_CACHE = 4096  # parent directories with cached path stats
+# chardet only: control/escape sequences, lone surrogates, BOM and 4 byte
+# UTF-8 characters (rejected by the chardet 3 UTF-8 state machine)
+DETECT_ONLY_CHARS = re.compile(
+    '[\x00-\x1f\x7f\ud800-\udfff\ufeff\U00010000-\U0010ffff]|~{')
 IS_WINDOWS = sys.platform.startswith('win')
+REPLAY_GAIN_PATTERN = re.compile(r'[-+]?\d+(?:\.\d+)?')  # '-3.61' of gains
 DEBUG = False
 SHOW_METHODS = False
+LEAN_READ = True  # header-only tag reads, skipping artwork payloads
 
 __all__ = ['show_methods', 'build_genre_dictionary', 'convert_mp3_rating',
-           'convert_flac_m4a_rating', 'dump_tag_data', 'get_all_media_paths',
-           'build_stat_list']
+           'convert_flac_m4a_rating', 'compile_tag_mapping', 'TAG_MAPPINGS',
+           'load_audio', 'load_audio_lean', 'dump_media_tags',
+           'dump_tag_data', 'TrackRecord', 'HashingReader',
+           'audio_payload_ranges', 'PayloadHash', 'get_audio_hash',
+           'hash_media_file',
+           'dump_tag_data_and_hash', 'classify_path_encoding',
+           'iter_media_entries',
+           'get_all_media_paths', 'parse_media_file', 'parse_media_tags',
+           'iter_stat_records', 'build_stat_list', 'ScanManifest',
+           'StageStats', 'ScanPipeline', 'AsyncScanner',
+           'build_stat_list_async']
 
 HEADER_KEYS = ['index', 'file_size', 'readable_size', 'file_ext',
                'artist_name', 'album_title', 'track_title', 'track_number',
                'track_length', 'genre', 'genre_in_dict', 'album_art',
                'year', 'rating', 'encoder', 'composer', 'conductor',
                'comment', 'track_gain', 'album_gain', 'file_name',
-               'path_len', 'last_modified', 'encoding', 'hash',
+               'path_len', 'last_modified', 'encoding', 'hash', 'audio_hash',
                'artist_id', 'album_id', 'track_id']
 
 
+def _to_str(value) -> str:
+    """Text field value, '' for missing values."""
+    if value is None:
+        return ''
+    return value if isinstance(value, str) else str(value)
+
+
+def _to_int(value) -> int:
+    """Native int field value, None for missing or non-numeric values."""
+    if value is None or isinstance(value, int):
+        return value
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _to_float(value) -> float:
+    """Native float gain value, 0.0 for missing or non-numeric values."""
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def _to_datetime(value) -> datetime.datetime:
+    """Native datetime field value, parsed from ISO format strings."""
+    if value is None or isinstance(value, datetime.datetime):
+        return value
+    try:
+        return datetime.datetime.fromisoformat(str(value))
+    except ValueError:
+        return None
+
+
+FIELD_TYPES = OrderedDict([(hdr, _to_str) for hdr in HEADER_KEYS])
+FIELD_TYPES.update([('index', _to_int), ('file_size', _to_int),
+                    ('track_number', _to_int), ('year', _to_int),
+                    ('track_gain', _to_float), ('album_gain', _to_float),
+                    ('path_len', _to_int), ('last_modified', _to_datetime)])
+# native value type per field, for typed (columnar) exports
+COLUMN_TYPES = OrderedDict(
+    [(hdr, {_to_int: int, _to_float: float,
+            _to_datetime: datetime.datetime}.get(to_type, str))
+     for hdr, to_type in FIELD_TYPES.items()])
+
+
+class TrackRecord(Mapping):
+    """Compact typed track record with dict-style access.
+
+    One slot per HEADER_KEYS field holding native int, float and datetime
+    values, assignments are converted by FIELD_TYPES. Missing ints and
+    datetimes are None, gains 0.0 and text ''.
+    """
+    __slots__ = tuple(HEADER_KEYS)
+
+    def __init__(self, values=(), **kwargs):
+        for field, to_type in FIELD_TYPES.items():
+            setattr(self, field, to_type(None))
+        if isinstance(values, Mapping):
+            values = values.items()
+        for field, value in values:
+            self[field] = value
+        for field, value in kwargs.items():
+            self[field] = value
+
+    def __getitem__(self, field: str):
+        if field not in FIELD_TYPES:
+            raise KeyError(field)
+        return getattr(self, field)
+
+    def __setitem__(self, field: str, value) -> None:
+        setattr(self, field, FIELD_TYPES[field](value))
+
+    def __contains__(self, field) -> bool:
+        return field in FIELD_TYPES
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(HEADER_KEYS)
+
+    def __len__(self) -> int:
+        return len(HEADER_KEYS)
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({dict(self)!r})"
+
+    def as_dict(self) -> OrderedDict:
+        """Returns native field values as OrderedDict."""
+        return OrderedDict(self.items())
+
+    def json_values(self) -> list:
+        """Returns field values in HEADER_KEYS order, JSON serializable."""
+        return [value.isoformat(' ') if isinstance(value, datetime.datetime)
+                else value for value in self.values()]
+
+
 def show_methods(method_name: str) -> None:
     """Prints method names for verbose output"""
     if SHOW_METHODS:
@@ -42,23 +192,17 @@ def show_exception():
                               limit=2, file=sys.stdout)
 
 
-def dump_tag_data(media_path: Path) -> dict:
-    """Parses media tag data of interest into dictionary mapping."""
+def dump_tag_data(media_path: Path, file_obj=None) -> TrackRecord:
+    """Parses media tag data of interest into dictionary mapping.
+
+    file_obj: optional open, seekable binary file of media_path to parse
+              instead of re-opening the path (see dump_tag_data_and_hash).
+    """
     show_methods(inspect.currentframe().f_code.co_name)
     file_ext = str(media_path.suffix).lower()
-    tag_dict = OrderedDict([(hdr, '') for hdr in HEADER_KEYS])
-    if file_ext == '.mp3':
-        tag_dict = dump_mp3_tags(media_path, tag_dict)
-    elif file_ext == '.m4a':
-        tag_dict = dump_m4a_tags(media_path, tag_dict)
-    elif file_ext == '.flac':
-        tag_dict = dump_flac_tags(media_path, tag_dict)
-    elif file_ext == '.wma':
-        tag_dict = dump_wma_tags(media_path, tag_dict)
-    if not tag_dict['track_gain']:
-        tag_dict['track_gain'] = 0.0
-    if not tag_dict['album_gain']:
-        tag_dict['album_gain'] = 0.0
+    tag_dict = TrackRecord()  # missing gains default to 0.0
+    if file_ext in TAG_MAPPINGS:
+        tag_dict = dump_media_tags(media_path, tag_dict, file_obj)
     return tag_dict
 
 
@@ -81,61 +225,482 @@ def build_genre_dictionary() -> dict:
     return genre_dict
 
 
+def _build_mp3_ratings() -> tuple:
+    """Precomputes POPM rating (0-255) to 'star' lookup from range starts."""
+    range_starts = [(0, '0-star'), (1, '1/2-star'), (23, '1-star'),
+                    (32, '1-1/2-star'), (64, '2-star'), (96, '2-1/2-star'),
+                    (128, '3-star'), (160, '3-1/2-star'), (196, '4-star'),
+                    (224, '4-1/2-star'), (255, '5-star')]
+    mp3_ratings = []
+    for idx, (start, rating) in enumerate(range_starts[:-1]):
+        stop = range_starts[idx + 1][0]
+        mp3_ratings.extend([rating] * (stop - start))
+    mp3_ratings.append(range_starts[-1][1])
+    return tuple(mp3_ratings)
+
+
+MP3_RATINGS = _build_mp3_ratings()
+FLAC_M4A_RATINGS = {
+    'default': 'Unknown',
+    '0': '0-star',
+    '10': '1/2-star',
+    '20': '1-star',
+    '30': '1-1/2-star',
+    '40': '2-star',
+    '50': '2-1/2-star',
+    '60': '3-star',
+    '70': '3-1/2-star',
+    '80': '4-star',
+    '90': '4-1/2-star',
+    '100': '5-star'
+}
+
+
 def convert_mp3_rating(input_rating: str = 'default') -> str:
     """Converts .mp3 rating number into readable 'star' format."""
     if input_rating == 'default':
-        rating = 'Unknown'
-    else:
-        if input_rating.isdigit():
-            int_rating = int(input_rating)
-            rating = ''
-            if int_rating == 0:
-                rating = '0-star'
-            elif 1 <= int_rating <= 22:
-                rating = '1/2-star'
-            elif 23 <= int_rating <= 31:
-                rating = '1-star'
-            elif 32 <= int_rating <= 63:
-                rating == '1-1/2-star'
-            elif 64 <= int_rating <= 95:
-                rating = '2-star'
-            elif 96 <= int_rating <= 127:
-                rating = '2-1/2-star'
-            elif 128 <= int_rating <= 159:
-                rating = '3-star'
-            elif 160 <= int_rating <= 195:
-                rating = '3-1/2-star'
-            elif 196 <= int_rating <= 223:
-                rating = '4-star'
-            elif 224 <= int_rating <= 254:
-                rating = '4-1/2-star'
-            elif int_rating == 255:
-                rating = '5-star'
-        else:
-            rating = '-999.0-star'
-    # print(f"{input_rating} to '{rating}'")
-    return rating
+        return 'Unknown'
+    if input_rating.isdigit():
+        int_rating = int(input_rating)
+        if int_rating < len(MP3_RATINGS):
+            return MP3_RATINGS[int_rating]
+        return ''
+    return '-999.0-star'
 
 
 def convert_flac_m4a_rating(input_rating: str = 'default') -> str:
     """Converts .flac/.m4a rating number into readable 'star' format."""
-    flac_ratings = {
-        'default': 'Unknown',
-        '0': '0-star',
-        '10': '1/2-star',
-        '20': '1-star',
-        '30': '1-1/2-star',
-        '40': '2-star',
-        '50': '2-1/2-star',
-        '60': '3-star',
-        '70': '3-1/2-star',
-        '80': '4-star',
-        '90': '4-1/2-star',
-        '100': '5-star'
-    }
-    rating = flac_ratings.get(input_rating, '-999.0-star')
-    # print(f"{input_rating} to '{rating}'")
-    return rating
+    return FLAC_M4A_RATINGS.get(input_rating, '-999.0-star')
+
+
+def _strip_newline(tag_str: str) -> str:
+    """Removes trailing/leading newlines from encoder strings."""
+    return tag_str.strip('\n')
+
+
+def _track_number(tag_str: str) -> str:
+    """Track number from 'track/total' strings."""
+    return tag_str.split('/')[0]
+
+
+def _m4a_track_number(tag_str: str) -> str:
+    """Track number from trkn tuple as string: '(1, 11)'."""
+    return tag_str[1:-1].split(",")[0].split('/')[0]
+
+
+def _replay_gain(tag_str: str) -> str:
+    """Gain number of '-3.61 dB', '-3.610000 dB' or "b'-3.61 dB'" strings."""
+    gain_match = REPLAY_GAIN_PATTERN.search(tag_str)
+    return gain_match.group() if gain_match else ''
+
+
+def _mp3_rating(tag_str: str) -> str:
+    """Rating from POPM string: "POPM(email='a@b', rating=196, count=3)"."""
+    return convert_mp3_rating(tag_str.split(",")[1].split("=")[1])
+
+
+def _read_id3_tags(audio, tag_keys: frozenset) -> dict:
+    """Returns only the ID3 frames named in tag_keys."""
+    tags = audio.tags or {}
+    return {key: tags[key] for key in tag_keys if key in tags}
+
+
+def _read_mp4_tags(audio, tag_keys: frozenset) -> dict:
+    """Returns only the MP4 atoms named in tag_keys (list values)."""
+    tags = audio.tags or {}
+    return {key: tags[key] for key in tag_keys
+            if type(tags.get(key)) is list}
+
+
+def _read_vorbis_tags(audio, tag_keys: frozenset) -> dict:
+    """Returns only the Vorbis comments named in tag_keys, plus FLAC
+    picture blocks."""
+    tags = audio.tags or {}
+    raw_tags = {key: tags[key] for key in tag_keys
+                if key != PICTURE_BLOCK_KEY and key in tags}
+    if PICTURE_BLOCK_KEY in tag_keys and getattr(audio, 'pictures', None):
+        raw_tags[PICTURE_BLOCK_KEY] = audio.pictures
+    return raw_tags
+
+
+def _read_asf_tags(audio, tag_keys: frozenset) -> dict:
+    """Returns only the ASF attributes named in tag_keys (list values)."""
+    tags = audio.tags or {}
+    return {key: tags[key] for key in tag_keys if key in tags}
+
+
+def _first_str(tag_value) -> str:
+    """First value of a multi-valued tag as string."""
+    return str(tag_value[0])
+
+
+TagMapping = namedtuple('TagMapping', ['read_tags', 'to_str', 'fields',
+                                       'tag_keys'])
+
+
+def compile_tag_mapping(read_tags, to_str, fields: list) -> TagMapping:
+    """Compiles (tag key, field name, converter) rows for one format.
+
+    converter: callable on the tag string, slice of the tag string, or a
+               constant string stored when the tag is present (the tag
+               value itself is never converted, e.g. album art payloads).
+    Rows apply in order, a later row for the same field wins.
+    """
+    compiled = []
+    for tag_key, field_name, converter in fields:
+        if isinstance(converter, str):
+            compiled.append((tag_key, field_name,
+                             functools.partial(str, converter), False))
+        elif isinstance(converter, slice):
+            compiled.append((tag_key, field_name,
+                             operator.itemgetter(converter), True))
+        else:
+            compiled.append((tag_key, field_name, converter, True))
+    tag_keys = frozenset(row[0] for row in compiled)
+    return TagMapping(read_tags, to_str, tuple(compiled), tag_keys)
+
+
+PICTURE_BLOCK_KEY = 'PICTURE'  # pseudo key, never looked up as a comment
+TAG_MAPPINGS = {
+    '.mp3': compile_tag_mapping(_read_id3_tags, str, [
+        ('TPE1', 'artist_name', str),
+        ('TALB', 'album_title', str),
+        ('TIT2', 'track_title', str),
+        ('TCOM', 'composer', str),
+        ('TPE3', 'conductor', str),
+        ('TCON', 'genre', str),
+        ('TSSE', 'encoder', _strip_newline),
+        ('TENC', 'encoder', _strip_newline),
+        ('TDRC', 'year', slice(0, 4)),
+        ('TRCK', 'track_number', _track_number),
+        ('POPM:no@email', 'rating', _mp3_rating),
+        ('TXXX:replaygain_track_gain', 'track_gain', _replay_gain),
+        ('TXXX:replaygain_album_gain', 'album_gain', _replay_gain),
+        ('COMM::XXX', 'comment', str),
+        ('APIC:', 'album_art', 'ALBUM_ART')]),
+    '.m4a': compile_tag_mapping(_read_mp4_tags, _first_str, [
+        ('©ART', 'artist_name', str),
+        ('©alb', 'album_title', str),
+        ('©nam', 'track_title', str),
+        ('©wrt', 'composer', str),
+        # freeform atoms as string: "b'value'"
+        ('----:com.apple.iTunes:CONDUCTOR', 'conductor', slice(2, -1)),
+        ('©gen', 'genre', str),
+        ('©too', 'encoder', _strip_newline),
+        ('©day', 'year', slice(0, 4)),
+        ('trkn', 'track_number', _m4a_track_number),
+        ('rate', 'rating', convert_flac_m4a_rating),
+        ('----:com.apple.iTunes:replaygain_track_gain', 'track_gain',
+         _replay_gain),
+        ('----:com.apple.iTunes:replaygain_album_gain', 'album_gain',
+         _replay_gain),
+        ('©cmt', 'comment', str),
+        ('covr', 'album_art', 'ALBUM_ART')]),
+    '.flac': compile_tag_mapping(_read_vorbis_tags, _first_str, [
+        ('artist', 'artist_name', str),
+        ('album', 'album_title', str),
+        ('title', 'track_title', str),
+        ('composer', 'composer', str),
+        ('conductor', 'conductor', str),
+        ('genre', 'genre', str),
+        ('encoder', 'encoder', _strip_newline),
+        ('date', 'year', slice(0, 4)),
+        ('tracknumber', 'track_number', _track_number),
+        ('rating', 'rating', convert_flac_m4a_rating),
+        ('replaygain_track_gain', 'track_gain', _replay_gain),
+        ('replaygain_album_gain', 'album_gain', _replay_gain),
+        ('comment', 'comment', str),
+        (PICTURE_BLOCK_KEY, 'album_art', 'ALBUM_ART')]),
+    '.wma': compile_tag_mapping(_read_asf_tags, _first_str, [
+        ('Author', 'artist_name', str),
+        ('WM/AlbumTitle', 'album_title', str),
+        ('Title', 'track_title', str),
+        ('WM/Composer', 'composer', str),
+        ('WM/Conductor', 'conductor', str),
+        ('WM/Genre', 'genre', str),
+        ('WM/ToolName', 'encoder', str),
+        ('WM/Year', 'year', slice(0, 4)),
+        ('WM/TrackNumber', 'track_number', str),
+        ('SDB/Rating', 'rating', convert_flac_m4a_rating),
+        ('replaygain_track_gain', 'track_gain', _replay_gain),
+        ('replaygain_album_gain', 'album_gain', _replay_gain),
+        ('WM/Comment', 'comment', str),
+        ('WM/Picture', 'album_art', 'ALBUM_ART')]),
+}
+
+
+def _media_source(media_path: Path, file_obj=None):
+    """Returns shared file object rewound for the next parse, else path."""
+    if file_obj is None:
+        return media_path
+    file_obj.seek(0)
+    return file_obj
+
+
+def load_audio(media_path: Path, file_obj=None) -> mutagen.FileType:
+    """Parses headers and tags once with the format specific mutagen class."""
+    audio_class = AUDIO_CLASSES[str(media_path.suffix).lower()]
+    return audio_class(_media_source(media_path, file_obj))
+
+
+class _SplicedFile:
+    """Read-only file view: bytes prefix followed by file_ptr[offset:EOF]."""
+
+    def __init__(self, prefix: bytes, file_ptr, offset: int, name: str = ''):
+        self.prefix = prefix
+        self.file_ptr = file_ptr
+        self.offset = offset
+        self.name = name
+        self.size = len(prefix) + file_ptr.seek(0, os.SEEK_END) - offset
+        self.position = 0
+
+    def read(self, size: int = -1) -> bytes:
+        """Reads across the prefix/file boundary."""
+        if size is None or size < 0:
+            size = self.size
+        size = max(0, min(size, self.size - self.position))
+        data = b''
+        if self.position < len(self.prefix):
+            data = self.prefix[self.position:self.position + size]
+        if len(data) < size:
+            view_pos = self.position + len(data)
+            self.file_ptr.seek(self.offset + view_pos - len(self.prefix))
+            data += self.file_ptr.read(size - len(data))
+        self.position += len(data)
+        return data
+
+    def seek(self, offset: int, whence: int = os.SEEK_SET) -> int:
+        """Moves within the spliced view."""
+        if whence == os.SEEK_CUR:
+            offset += self.position
+        elif whence == os.SEEK_END:
+            offset += self.size
+        if offset < 0:
+            raise OSError("negative seek position")
+        self.position = offset
+        return self.position
+
+    def tell(self) -> int:
+        """Returns current position within the spliced view."""
+        return self.position
+
+
+def _read_exact(file_ptr, size: int) -> bytes:
+    """Reads size bytes or raises ValueError for truncated files."""
+    data = file_ptr.read(size)
+    if len(data) != size:
+        raise ValueError("truncated")
+    return data
+
+
+def _lean_flac_source(file_ptr, name: str = ''):
+    """FLAC metadata copy, PICTURE blocks reduced to empty placeholders."""
+    file_ptr.seek(0)
+    if file_ptr.read(4) != b'fLaC':
+        return None  # ID3 prefixed or not FLAC, let mutagen decide
+    blocks = []
+    is_last = False
+    while not is_last:
+        header = _read_exact(file_ptr, 4)
+        is_last = bool(header[0] & 0x80)
+        block_type = header[0] & 0x7F
+        size = int.from_bytes(header[1:4], 'big')
+        if block_type == FLAC_PICTURE_BLOCK:
+            file_ptr.seek(size, os.SEEK_CUR)  # only presence is needed
+            blocks.append((block_type, EMPTY_FLAC_PICTURE))
+        elif block_type in FLAC_KEEP_BLOCKS:
+            blocks.append((block_type, _read_exact(file_ptr, size)))
+        else:
+            file_ptr.seek(size, os.SEEK_CUR)
+    metadata = [b'fLaC']
+    for idx, (block_type, data) in enumerate(blocks):
+        last_bit = 0x80 if idx == len(blocks) - 1 else 0
+        metadata.append(bytes([block_type | last_bit]) +
+                        len(data).to_bytes(3, 'big') + data)
+    source = io.BytesIO(b''.join(metadata))
+    source.name = name
+    return source
+
+
+def _read_mp4_atoms(file_ptr, end: int, keep_tree: dict) -> bytes:
+    """Copies atoms named in keep_tree, recursing into container atoms."""
+    atoms = []
+    position = file_ptr.tell()
+    while position + 8 <= end:
+        size, name = struct.unpack('>I4s', _read_exact(file_ptr, 8))
+        header_size = 8
+        if size == 1:
+            size = struct.unpack('>Q', _read_exact(file_ptr, 8))[0]
+            header_size = 16
+        elif size == 0:
+            size = end - position
+        if size < header_size or position + size > end:
+            raise ValueError(f"invalid atom size: {name}")
+        atom_end = position + size
+        children = keep_tree.get(name, MP4_SKIP)
+        if children is MP4_COVER:
+            # covr: one data atom keeping type flags, image bytes skipped
+            data_header = _read_exact(file_ptr, 16)
+            body = struct.pack('>I', 16) + data_header[4:16]
+        elif children is MP4_LEAF:
+            body = _read_exact(file_ptr, size - header_size)
+        elif children is not MP4_SKIP:
+            prefix = b''
+            if name == b'meta':
+                prefix = _read_exact(file_ptr, 4)  # full atom version/flags
+            body = prefix + _read_mp4_atoms(file_ptr, atom_end, children)
+        if children is not MP4_SKIP:
+            atoms.append(struct.pack('>I4s', len(body) + 8, name) + body)
+        file_ptr.seek(atom_end)
+        position = atom_end
+    return b''.join(atoms)
+
+
+def _lean_mp4_source(file_ptr, name: str = ''):
+    """MP4 copy of moov length/tag atoms, sample tables and covr skipped."""
+    end = file_ptr.seek(0, os.SEEK_END)
+    file_ptr.seek(0)
+    moov = _read_mp4_atoms(file_ptr, end, MP4_KEEP_TREE)
+    if not moov:
+        return None
+    source = io.BytesIO(moov)
+    source.name = name
+    return source
+
+
+def _lean_id3_source(file_ptr, name: str = ''):
+    """ID3v2.3/2.4 copy with APIC image bytes dropped, then MPEG audio."""
+    file_ptr.seek(0)
+    header = file_ptr.read(10)
+    if len(header) != 10 or header[:3] != b'ID3':
+        return None
+    major, flags = header[3], header[5]
+    if major not in (3, 4) or flags & 0xD0:  # unsync, ext header, footer
+        return None
+    tag_end = 10 + _syncsafe_int(header[6:10])
+    frames = []
+    position = 10
+    while position + 10 <= tag_end:
+        frame_header = _read_exact(file_ptr, 10)
+        if frame_header[0] == 0:
+            break  # padding
+        if major == 4:
+            size = _syncsafe_int(frame_header[4:8])
+        else:
+            size = struct.unpack('>I', frame_header[4:8])[0]
+        frame_end = position + 10 + size
+        if frame_end > tag_end:
+            return None
+        if frame_header[:4] == b'APIC':
+            if frame_header[8:10] != b'\x00\x00':
+                return None  # compressed/encrypted/unsync frame
+            payload = _apic_without_image(
+                file_ptr.read(min(size, APIC_HEADER_READ)))
+            if payload is None:
+                return None
+            file_ptr.seek(frame_end)
+        else:
+            payload = _read_exact(file_ptr, size)
+        if major == 4:
+            size_bytes = _to_syncsafe(len(payload))
+        else:
+            size_bytes = struct.pack('>I', len(payload))
+        frames.append(frame_header[:4] + size_bytes + frame_header[8:10] +
+                      payload)
+        position = frame_end
+    frame_data = b''.join(frames)
+    prefix = header[:6] + _to_syncsafe(len(frame_data)) + frame_data
+    return _SplicedFile(prefix, file_ptr, tag_end, name)
+
+
+def _syncsafe_int(data: bytes) -> int:
+    """Decodes 4 byte syncsafe integer, ValueError if high bits are set."""
+    if any(byte & 0x80 for byte in data):
+        raise ValueError("invalid syncsafe integer")
+    return (data[0] << 21) | (data[1] << 14) | (data[2] << 7) | data[3]
+
+
+def _to_syncsafe(value: int) -> bytes:
+    """Encodes integer as 4 byte syncsafe integer."""
+    return bytes([(value >> 21) & 0x7F, (value >> 14) & 0x7F,
+                  (value >> 7) & 0x7F, value & 0x7F])
+
+
+def _apic_without_image(payload: bytes) -> bytes:
+    """APIC encoding/mime/type/description, None if description is cut."""
+    mime_end = payload.find(b'\x00', 1)
+    if mime_end < 0 or mime_end + 2 > len(payload):
+        return None
+    desc_start = mime_end + 2
+    if payload[0] in (1, 2):  # UTF-16: 2 byte aligned double null
+        desc_end = desc_start
+        while desc_end + 1 < len(payload):
+            if payload[desc_end:desc_end + 2] == b'\x00\x00':
+                return payload[:desc_end + 2]
+            desc_end += 2
+        return None
+    desc_end = payload.find(b'\x00', desc_start)
+    if desc_end < 0:
+        return None
+    return payload[:desc_end + 1]
+
+
+FLAC_PICTURE_BLOCK = 6
+FLAC_KEEP_BLOCKS = (0, 4)  # STREAMINFO, VORBIS_COMMENT
+# picture type, empty mime/description, zero dimensions and data length
+EMPTY_FLAC_PICTURE = struct.pack('>3I4II', 3, 0, 0, 0, 0, 0, 0, 0)
+APIC_HEADER_READ = 1024  # bytes, enough for mime type and description
+MP4_LEAF = 'leaf'
+MP4_SKIP = 'skip'
+MP4_COVER = 'cover'
+MP4_ILST = {b'covr': MP4_COVER}
+
+
+class _Mp4Ilst(dict):
+    """ilst keep tree: every item atom is copied, except covr payloads."""
+
+    def get(self, key, default=None):
+        return MP4_ILST.get(key, MP4_LEAF)
+
+
+MP4_KEEP_TREE = {
+    b'moov': {
+        b'mvhd': MP4_LEAF,
+        b'trak': {b'mdia': {b'mdhd': MP4_LEAF,
+                            b'hdlr': MP4_LEAF,
+                            b'minf': {b'stbl': {b'stsd': MP4_LEAF}}}},
+        b'udta': {b'meta': {b'hdlr': MP4_LEAF,
+                            b'ilst': _Mp4Ilst()}}}}
+LEAN_SOURCES = {'.mp3': _lean_id3_source,
+                '.m4a': _lean_mp4_source,
+                '.flac': _lean_flac_source}
+
+
+def load_audio_lean(media_path: Path, file_obj=None) -> mutagen.FileType:
+    """Parses tags without reading embedded artwork payloads.
+
+    Headers are walked to copy only the blocks/frames/atoms mutagen needs,
+    artwork is replaced by an empty placeholder so album_art presence is
+    kept. Falls back to load_audio() whenever the layout is ambiguous.
+    """
+    file_ext = str(media_path.suffix).lower()
+    lean_source = LEAN_SOURCES.get(file_ext)
+    if not LEAN_READ or lean_source is None:
+        return load_audio(media_path, file_obj)
+    file_ptr = file_obj
+    try:
+        if file_ptr is None:
+            file_ptr = open(str(media_path), 'rb')
+        try:
+            source = lean_source(file_ptr, str(media_path))
+            if source is not None:
+                return AUDIO_CLASSES[file_ext](source)
+        except (ValueError, struct.error, mutagen.MutagenError):
+            pass  # ambiguous layout, use the full mutagen parse below
+    finally:
+        if file_obj is None and file_ptr is not None:
+            file_ptr.close()
+    return load_audio(media_path, file_obj)
 
 
 def export_tags(input_path: Path) -> None:
@@ -155,232 +720,26 @@ def export_tags(input_path: Path) -> None:
             show_exception()
 
 
-def dump_mp3_tags(media_path: Path, tag_dict: dict) -> dict:
-    """Parses MP3 tag data of interest into dictionary mapping."""
-    show_methods(inspect.currentframe().f_code.co_name)
-    try:
-        file_data = mutagen.File(media_path)
-        if str(media_path.suffix).lower() == '.mp3':
-            audio = mutagen.mp3.MP3(media_path)
-            parsed_dict = OrderedDict([(key, str(val)) for key, val
-                                       in file_data.tags.items()])
-            hhmmss = str(datetime.timedelta(seconds=audio.info.length))
-            tag_dict['track_length'] = hhmmss.split('.')[0]
-            if 'TPE1' in parsed_dict:
-                tag_dict['artist_name'] = parsed_dict['TPE1']
-            if 'TALB' in parsed_dict:
-                tag_dict['album_title'] = parsed_dict['TALB']
-            if 'TIT2' in parsed_dict:
-                tag_dict['track_title'] = parsed_dict['TIT2']
-            if 'TCOM' in parsed_dict:
-                tag_dict['composer'] = parsed_dict['TCOM']
-            if 'TPE3' in parsed_dict:
-                tag_dict['conductor'] = parsed_dict['TPE3']
-            if 'TCON' in parsed_dict:
-                tag_dict['genre'] = parsed_dict['TCON']
-            if 'TSSE' in parsed_dict:
-                tag_dict['encoder'] = parsed_dict['TSSE'].strip('\n')
-            if 'TENC' in parsed_dict:
-                tag_dict['encoder'] = parsed_dict['TENC'].strip('\n')
-            if 'TDRC' in parsed_dict:
-                tag_dict['year'] = parsed_dict['TDRC']
-                if len(tag_dict['year']) > 4:
-                    tag_dict['year'] = tag_dict['year'][0:4]
-            if 'TRCK' in parsed_dict:
-                track_str = str(parsed_dict['TRCK'])
-                if '/' in track_str:
-                    tag_dict['track_number'] = track_str.split('/')[0]
-                else:
-                    tag_dict['track_number'] = track_str
-            rate_key = 'POPM:no@email'
-            if rate_key in parsed_dict:
-                rating_str = parsed_dict[rate_key].split(",")[1]
-                rating_str = rating_str.split("=")[1]
-                tag_dict['rating'] = convert_mp3_rating(rating_str)
-            else:
-                tag_dict['rating'] = convert_mp3_rating('default')
-            trpg_key = 'TXXX:replaygain_track_gain'
-            if trpg_key in parsed_dict:
-                tag_dict['track_gain'] = parsed_dict[trpg_key][:-3]
-            arpg_key = 'TXXX:replaygain_album_gain'
-            if arpg_key in parsed_dict:
-                tag_dict['album_gain'] = parsed_dict[arpg_key][:-3]
-            if 'COMM::XXX' in parsed_dict:
-                tag_dict['comment'] = parsed_dict['COMM::XXX']
-            if 'APIC:' in parsed_dict:
-                tag_dict['album_art'] = "ALBUM_ART"
-            else:
-                tag_dict['album_art'] = "MISSING_ART"
-    except (OSError, ValueError, mutagen.MutagenError) as exc:
-        print(f"~!ERROR!~ input: '{media_path}' {sys.exc_info()[0]} {exc}")
-        export_tags(media_path)
-    return tag_dict
-
-
-def dump_m4a_tags(media_path: Path, tag_dict: dict) -> dict:
-    """Parses M4A tag data of interest into dictionary mapping."""
+def dump_media_tags(media_path: Path, tag_dict: TrackRecord,
+                    file_obj=None) -> dict:
+    """Parses tag data of interest using the format's TAG_MAPPINGS table."""
     show_methods(inspect.currentframe().f_code.co_name)
     try:
-        if str(media_path.suffix).lower() == '.m4a':
-            audio = mutagen.mp4.MP4(media_path)
-            parsed_dict = OrderedDict([(key, str(val[0])) for key, val
-                                       in audio.tags.items()
-                                       if type(val) is list])
-            hhmmss = str(datetime.timedelta(seconds=audio.info.length))
-            tag_dict['track_length'] = hhmmss.split('.')[0]
-            if '©ART' in parsed_dict:
-                tag_dict['artist_name'] = parsed_dict['©ART']
-            if '©alb' in parsed_dict:
-                tag_dict['album_title'] = parsed_dict['©alb']
-            if '©nam' in parsed_dict:
-                tag_dict['track_title'] = parsed_dict['©nam']
-            if '©wrt' in parsed_dict:
-                tag_dict['composer'] = parsed_dict['©wrt']
-            con_key = '----:com.apple.iTunes:CONDUCTOR'
-            if con_key in parsed_dict:
-                tag_dict['conductor'] = parsed_dict[con_key][2:-1]
-            if '©gen' in parsed_dict:
-                tag_dict['genre'] = parsed_dict['©gen']
-            if '©too' in parsed_dict:
-                tag_dict['encoder'] = parsed_dict['©too'].strip('\n')
-            if '©day' in parsed_dict:
-                tag_dict['year'] = parsed_dict['©day'][0:4]
-            if 'trkn' in parsed_dict:
-                track_str = parsed_dict['trkn'][1:-1].split(",")[0]
-                if '/' in track_str:
-                    tag_dict['track_number'] = track_str.split('/')[0]
+        tag_mapping = TAG_MAPPINGS[str(media_path.suffix).lower()]
+        audio = load_audio_lean(media_path, file_obj)
+        hhmmss = str(datetime.timedelta(seconds=audio.info.length))
+        tag_dict['track_length'] = hhmmss.split('.')[0]
+        tag_dict['rating'] = 'Unknown'
+        tag_dict['album_art'] = 'MISSING_ART'
+        raw_tags = tag_mapping.read_tags(audio, tag_mapping.tag_keys)
+        to_str = tag_mapping.to_str
+        for tag_key, field_name, converter, use_str in tag_mapping.fields:
+            tag_value = raw_tags.get(tag_key)
+            if tag_value is not None:
+                if use_str:
+                    tag_dict[field_name] = converter(to_str(tag_value))
                 else:
-                    tag_dict['track_number'] = track_str
-            if 'rate' in parsed_dict:
-                rating_str = parsed_dict['rate']
-                tag_dict['rating'] = convert_flac_m4a_rating(rating_str)
-            else:
-                tag_dict['rating'] = convert_flac_m4a_rating('default')
-            trpg_key = '----:com.apple.iTunes:replaygain_track_gain'
-            if trpg_key in parsed_dict:
-                track_gain = parsed_dict[trpg_key][2:-13]
-                tag_dict['track_gain'] = f"{track_gain}"
-            arpg_key = '----:com.apple.iTunes:replaygain_album_gain'
-            if arpg_key in parsed_dict:
-                album_gain = parsed_dict[arpg_key][2:-13]
-                tag_dict['album_gain'] = f"{album_gain}"
-            if '©cmt' in parsed_dict:
-                tag_dict['comment'] = parsed_dict['©cmt']
-            if 'covr' in parsed_dict:
-                tag_dict['album_art'] = "ALBUM_ART"
-            else:
-                tag_dict['album_art'] = "MISSING_ART"
-    except (OSError, ValueError, mutagen.MutagenError) as exc:
-        print(f"~!ERROR!~ input: '{media_path}' {sys.exc_info()[0]} {exc}")
-        export_tags(media_path)
-    return tag_dict
-
-
-def dump_flac_tags(media_path: Path, tag_dict: dict) -> dict:
-    """Parses FLAC tag data of interest into dictionary mapping."""
-    show_methods(inspect.currentframe().f_code.co_name)
-    try:
-        file_data = mutagen.File(media_path)
-        if str(media_path.suffix).lower() == '.flac':
-            audio = mutagen.flac.FLAC(media_path)
-            parsed_dict = OrderedDict([(key, str(val[0])) for key, val in
-                                       audio.tags.as_dict().items()])
-            hhmmss = str(datetime.timedelta(seconds=audio.info.length))
-            tag_dict['track_length'] = hhmmss.split('.')[0]
-            if 'artist' in parsed_dict:
-                tag_dict['artist_name'] = parsed_dict['artist']
-            if 'album' in parsed_dict:
-                tag_dict['album_title'] = parsed_dict['album']
-            if 'title' in parsed_dict:
-                tag_dict['track_title'] = parsed_dict['title']
-            if 'composer' in parsed_dict:
-                tag_dict['composer'] = parsed_dict['composer']
-            if 'conductor' in parsed_dict:
-                tag_dict['conductor'] = parsed_dict['conductor']
-            if 'genre' in parsed_dict:
-                tag_dict['genre'] = parsed_dict['genre']
-            if 'encoder' in parsed_dict:
-                tag_dict['encoder'] = parsed_dict['encoder'].strip('\n')
-            if 'date' in parsed_dict:
-                tag_dict['year'] = parsed_dict['date'][0:4]
-            if 'tracknumber' in parsed_dict:
-                track_str = parsed_dict['tracknumber']
-                if '/' in track_str:
-                    tag_dict['track_number'] = track_str.split('/')[0]
-                else:
-                    tag_dict['track_number'] = track_str
-            if 'rating' in parsed_dict:
-                rating_str = parsed_dict['rating']
-                tag_dict['rating'] = convert_flac_m4a_rating(rating_str)
-            else:
-                tag_dict['rating'] = convert_flac_m4a_rating('default')
-            trpg_key = 'replaygain_track_gain'
-            if trpg_key in parsed_dict:
-                track_gain = parsed_dict[trpg_key][0:-7]
-                tag_dict['track_gain'] = f"{track_gain}"
-            arpg_key = 'replaygain_album_gain'
-            if arpg_key in parsed_dict:
-                album_gain = parsed_dict[arpg_key][0:-7]
-                tag_dict['album_gain'] = f"{album_gain}"
-            if 'comment' in parsed_dict:
-                tag_dict['comment'] = parsed_dict['comment']
-            file_pic = file_data.pictures
-            if file_pic:
-                tag_dict['album_art'] = "ALBUM_ART"
-            else:
-                tag_dict['album_art'] = "MISSING_ART"
-    except (OSError, ValueError, mutagen.MutagenError) as exc:
-        print(f"~!ERROR!~ input: '{media_path}' {sys.exc_info()[0]} {exc}")
-        export_tags(media_path)
-    return tag_dict
-
-
-def dump_wma_tags(media_path: Path, tag_dict: dict) -> dict:
-    """Parses WMA tag data of interest into dictionary mapping."""
-    show_methods(inspect.currentframe().f_code.co_name)
-    try:
-
-        if str(media_path.suffix).lower() == '.wma':
-            audio = mutagen.asf.ASF(media_path)
-            parsed_dict = OrderedDict([(key, str(val[0])) for key, val in
-                                       audio.tags.as_dict().items()])
-            hhmmss = str(datetime.timedelta(seconds=audio.info.length))
-            tag_dict['track_length'] = hhmmss.split('.')[0]
-            if 'Author' in parsed_dict:
-                tag_dict['artist_name'] = parsed_dict['Author']
-            if 'WM/AlbumTitle' in parsed_dict:
-                tag_dict['album_title'] = parsed_dict['WM/AlbumTitle']
-            if 'Title' in parsed_dict:
-                tag_dict['track_title'] = parsed_dict['Title']
-            if 'WM/Composer' in parsed_dict:
-                tag_dict['composer'] = parsed_dict['WM/Composer']
-            if 'WM/Conductor' in parsed_dict:
-                tag_dict['conductor'] = parsed_dict['WM/Conductor']
-            if 'WM/Genre' in parsed_dict:
-                tag_dict['genre'] = parsed_dict['WM/Genre']
-            if 'WM/ToolName' in parsed_dict:
-                tag_dict['encoder'] = parsed_dict['WM/ToolName']
-            if 'WM/Year' in parsed_dict:
-                tag_dict['year'] = parsed_dict['WM/Year'][0:4]
-            if 'WM/TrackNumber' in parsed_dict:
-                tag_dict['track_number'] = parsed_dict['WM/TrackNumber']
-            if 'SDB/Rating' in parsed_dict:
-                rating_str = parsed_dict['SDB/Rating']
-                tag_dict['rating'] = convert_flac_m4a_rating(rating_str)
-            else:
-                tag_dict['rating'] = convert_flac_m4a_rating('default')
-            trpg_key = 'replaygain_track_gain'
-            if trpg_key in parsed_dict:
-                tag_dict['track_gain'] = parsed_dict[trpg_key][0:-3]
-            arpg_key = 'replaygain_album_gain'
-            if arpg_key in parsed_dict:
-                tag_dict['album_gain'] = parsed_dict[arpg_key][0:-3]
-            if 'WM/Comment' in parsed_dict:
-                tag_dict['comment'] = parsed_dict['WM/Comment']
-            if 'WM/Picture' in parsed_dict:
-                tag_dict['album_art'] = "ALBUM_ART"
-            else:
-                tag_dict['album_art'] = "MISSING_ART"
+                    tag_dict[field_name] = converter()
     except (OSError, ValueError, mutagen.MutagenError) as exc:
         print(f"~!ERROR!~ input: '{media_path}' {sys.exc_info()[0]} {exc}")
         export_tags(media_path)
@@ -448,82 +807,1304 @@ def check_encoding(input_val: bytes):
     return chardet.detect(bytes_arr), bytes_arr
 
 
+def _path_text_stats(text: str) -> tuple:
+    """Returns (non-ASCII char count, True if only chardet can classify)."""
+    if DETECT_ONLY_CHARS.search(text):
+        return 0, True
+    return len(text) - len(text.encode('ascii', 'ignore')), False
+
+
+_dir_text_stats = functools.lru_cache(maxsize=ENCODING_DIR_CACHE)(
+    _path_text_stats)
+
+
+def classify_path_encoding(file_path) -> str:
+    """Tiered path 'encoding' column, same value as check_encoding().
+
+    1. ASCII: chardet reports 'ascii'.
+    2. strict UTF-8 decode (bytes only, str paths are UTF-8 encoded) with
+       at least UTF8_SURE_CHARS multi-byte characters: 'utf-8'.
+    3. anything else: full chardet.detect().
+    Stats of the parent directory are cached, so per file only the name
+    is scanned.
+    """
+    if isinstance(file_path, (bytes, bytearray)):
+        try:
+            path_str = bytes(file_path).decode('utf-8', errors='strict')
+        except UnicodeDecodeError:
+            return f"{check_encoding(file_path)[0]['encoding']}"
+    else:
+        path_str = str(file_path)
+    dir_path, file_name = os.path.split(path_str)
+    dir_chars, dir_detect = _dir_text_stats(dir_path)
+    name_chars, name_detect = _path_text_stats(file_name)
+    if not (dir_detect or name_detect):
+        if dir_chars + name_chars == 0:
+            return 'ascii'
+        if dir_chars + name_chars >= UTF8_SURE_CHARS:
+            return 'utf-8'
+    return f"{check_encoding(path_str)[0]['encoding']}"
+
+
 def get_sha256_hash(input_path: Path) -> str:
-    """Returns SHA1 hash value of input filepath."""
+    """Returns HASH_ALGORITHM (SHA3-256) hash of input filepath (streamed)."""
     sha_hex = 'no hash'
     if isinstance(input_path, Path) or input_path:
         if input_path.exists():
             try:
-                file_pointer = open(str(input_path), 'rb')
-                fp_read = file_pointer.read()
-                sha_hash = hashlib.sha3_256(fp_read)
-                sha_hex = str(sha_hash.hexdigest().upper())
-                file_pointer.close()
+                sha_hex = file_tools.get_file_hash(input_path,
+                                                   HASH_ALGORITHM)
             except (OSError, PermissionError):
                 show_exception()
     return sha_hex
 
 
-def get_all_media_paths(input_path: Path) -> list:
+class HashingReader:
+    """Read-only seekable file wrapper that hashes bytes as they are read.
+
+    The hash frontier (first byte not yet hashed) only moves forward: a read
+    past it first streams the gap into the hash, so mutagen parses through
+    the same open handle while the file is read sequentially exactly once.
+    Re-reads behind the frontier come from the file buffer/page cache.
+    """
+
+    def __init__(self, file_ptr, hash_obj, name: str = '',
+                 buffer_size: int = file_tools.HASH_BUFFER_SIZE):
+        self.file_ptr = file_ptr
+        self.hash_obj = hash_obj
+        self.name = name  # mutagen reports errors with the file name
+        self.buffer_size = buffer_size
+        self.hashed = 0
+        self.position = file_ptr.tell()
+
+    def _hash_until(self, offset: int = -1) -> None:
+        """Streams bytes from the frontier up to offset (-1: EOF)."""
+        self.file_ptr.seek(self.hashed)
+        if offset < 0:
+            file_tools.update_file_hash(self.hash_obj, self.file_ptr,
+                                        self.buffer_size)
+            self.hashed = self.file_ptr.tell()
+            return
+        read_buffer = bytearray(min(self.buffer_size, offset - self.hashed))
+        buffer_view = memoryview(read_buffer)
+        while self.hashed < offset:
+            n_wanted = min(len(read_buffer), offset - self.hashed)
+            n_bytes = self.file_ptr.readinto(buffer_view[:n_wanted])
+            if not n_bytes:
+                break
+            self.hash_obj.update(buffer_view[:n_bytes])
+            self.hashed += n_bytes
+
+    def read(self, size: int = -1) -> bytes:
+        """Reads from the shared handle, hashing bytes at the frontier."""
+        if self.position > self.hashed:
+            self._hash_until(self.position)
+            self.file_ptr.seek(self.position)
+        data = self.file_ptr.read(size)
+        start = self.position
+        self.position += len(data)
+        if start <= self.hashed < self.position:
+            self.hash_obj.update(memoryview(data)[self.hashed - start:])
+            self.hashed = self.position
+        return data
+
+    def seek(self, offset: int, whence: int = os.SEEK_SET) -> int:
+        """Moves the shared handle without touching the hash frontier."""
+        self.position = self.file_ptr.seek(offset, whence)
+        return self.position
+
+    def tell(self) -> int:
+        """Returns current position of the shared handle."""
+        return self.position
+
+    def finish(self) -> str:
+        """Hashes remaining bytes after the frontier, returns hex digest."""
+        self._hash_until()
+        self.position = self.file_ptr.tell()
+        return str(self.hash_obj.hexdigest().upper())
+
+
+ID3V1_SIZE = 128
+ID3V1_EXT_SIZE = 227  # 'TAG+' enhanced tag, in front of the ID3v1 tag
+APE_FOOTER_SIZE = 32
+LYRICS3_END = b'LYRICS200'
+ASF_DATA_OBJECT = bytes.fromhex('3626B2758E66CF11A6D900AA0062CE6C')
+ASF_DATA_HEADER = 50  # GUID, size, file id, packet count, reserved
+
+
+def _skip_id3v2(file_ptr, start: int = 0) -> int:
+    """Returns offset after the (repeated) ID3v2 tags at start."""
+    file_ptr.seek(start)
+    header = file_ptr.read(10)
+    while len(header) == 10 and header[:3] == b'ID3':
+        start += 10 + _syncsafe_int(header[6:10])
+        if header[5] & 0x10:
+            start += 10  # footer present
+        file_ptr.seek(start)
+        header = file_ptr.read(10)
+    return start
+
+
+def _strip_trailing_tags(file_ptr, start: int, end: int) -> int:
+    """Returns end offset before ID3v1, Lyrics3v2 and APEv2 tags."""
+    stripped = True
+    while stripped:
+        stripped = False
+        if end - start >= ID3V1_SIZE:
+            file_ptr.seek(end - ID3V1_SIZE)
+            if file_ptr.read(3) == b'TAG':
+                end -= ID3V1_SIZE
+                stripped = True
+                if end - start >= ID3V1_EXT_SIZE:
+                    file_ptr.seek(end - ID3V1_EXT_SIZE)
+                    if file_ptr.read(4) == b'TAG+':
+                        end -= ID3V1_EXT_SIZE
+        if end - start >= 15:
+            file_ptr.seek(end - 15)
+            lyrics_footer = file_ptr.read(15)
+            if lyrics_footer[6:] == LYRICS3_END and \
+                    lyrics_footer[:6].isdigit():
+                end -= int(lyrics_footer[:6]) + 15
+                stripped = True
+        if end - start >= APE_FOOTER_SIZE:
+            file_ptr.seek(end - APE_FOOTER_SIZE)
+            footer = file_ptr.read(APE_FOOTER_SIZE)
+            if footer[:8] == b'APETAGEX':
+                tag_size, _, flags = struct.unpack('<III', footer[12:24])
+                end -= tag_size
+                if flags & 0x80000000:
+                    end -= APE_FOOTER_SIZE  # tag header present
+                stripped = True
+        if end < start:
+            raise ValueError("invalid trailing tag size")
+    return end
+
+
+def _mp3_payload_ranges(file_ptr, end: int) -> list:
+    """MPEG frames between leading ID3v2 and trailing tags."""
+    start = _skip_id3v2(file_ptr)
+    return [(start, _strip_trailing_tags(file_ptr, start, end))]
+
+
+def _flac_payload_ranges(file_ptr, end: int) -> list:
+    """FLAC frames after the last metadata block."""
+    position = _skip_id3v2(file_ptr)
+    file_ptr.seek(position)
+    if file_ptr.read(4) != b'fLaC':
+        return None
+    position += 4
+    is_last = False
+    while not is_last:
+        header = _read_exact(file_ptr, 4)
+        is_last = bool(header[0] & 0x80)
+        position += 4 + int.from_bytes(header[1:4], 'big')
+        file_ptr.seek(position)
+    return [(position, _strip_trailing_tags(file_ptr, position, end))]
+
+
+def _mp4_payload_ranges(file_ptr, end: int) -> list:
+    """Contents of the top level mdat atoms, moov (udta/meta) skipped."""
+    ranges = []
+    position = 0
+    while position + 8 <= end:
+        file_ptr.seek(position)
+        size, name = struct.unpack('>I4s', _read_exact(file_ptr, 8))
+        header_size = 8
+        if size == 1:
+            size = struct.unpack('>Q', _read_exact(file_ptr, 8))[0]
+            header_size = 16
+        elif size == 0:
+            size = end - position
+        if size < header_size or position + size > end:
+            raise ValueError(f"invalid atom size: {name}")
+        if name == b'mdat':
+            ranges.append((position + header_size, position + size))
+        position += size
+    return ranges or None
+
+
+def _asf_payload_ranges(file_ptr, end: int) -> list:
+    """Packets of the ASF data object, header and index objects skipped."""
+    position = 0
+    while position + 24 <= end:
+        file_ptr.seek(position)
+        guid, size = struct.unpack('<16sQ', _read_exact(file_ptr, 24))
+        if size < 24 or position + size > end:
+            raise ValueError("invalid ASF object size")
+        if guid == ASF_DATA_OBJECT:
+            return [(position + ASF_DATA_HEADER, position + size)]
+        position += size
+    return None
+
+
+PAYLOAD_RANGES = {'.mp3': _mp3_payload_ranges,
+                  '.flac': _flac_payload_ranges,
+                  '.m4a': _mp4_payload_ranges,
+                  '.wma': _asf_payload_ranges}
+
+
+def audio_payload_ranges(file_ptr, file_ext: str) -> list:
+    """Returns [(start, end)] byte ranges of the audio payload.
+
+    Tags and metadata (ID3v2/ID3v1/APE, FLAC metadata blocks, MP4 moov
+    with udta/meta, ASF header) are excluded, so retagging keeps the
+    ranges' content. Returns [(0, file size)] for unknown layouts.
+    """
+    end = file_ptr.seek(0, os.SEEK_END)
+    ranges = None
+    payload_func = PAYLOAD_RANGES.get(str(file_ext).lower())
+    if payload_func is not None:
+        try:
+            ranges = payload_func(file_ptr, end)
+        except (ValueError, struct.error):
+            ranges = None
+    file_ptr.seek(0)
+    return ranges or [(0, end)]
+
+
+class PayloadHash:
+    """Hash object tee: whole file digest plus digest of payload ranges.
+
+    Bytes must be fed in file order from offset 0, as HashingReader and
+    update_file_hash() do; hexdigest() is the whole file digest.
+    """
+
+    def __init__(self, ranges: list, algorithm: str = HASH_ALGORITHM):
+        self.file_hash = file_tools.new_hash(algorithm)
+        self.payload_hash = file_tools.new_hash(algorithm)
+        self.ranges = ranges
+        self.offset = 0
+
+    def update(self, data) -> None:
+        """Hashes data, payload bytes also go to the payload hash."""
+        self.file_hash.update(data)
+        start, end = self.offset, self.offset + len(data)
+        for range_start, range_end in self.ranges:
+            lower, upper = max(start, range_start), min(end, range_end)
+            if lower < upper:
+                self.payload_hash.update(
+                    memoryview(data)[lower - start:upper - start])
+        self.offset = end
+
+    def hexdigest(self) -> str:
+        """Returns whole file hex digest."""
+        return self.file_hash.hexdigest()
+
+    def payload_hexdigest(self) -> str:
+        """Returns upper case hex digest of the audio payload."""
+        return str(self.payload_hash.hexdigest().upper())
+
+
+def get_audio_hash(media_path: Path, file_obj=None) -> str:
+    """Returns hash of the audio payload only, tags are never read.
+
+    file_obj: optional open, seekable binary file with the contents of
+              media_path (e.g. a stored copy) to hash instead of the path.
+    """
+    hash_obj = file_tools.new_hash(HASH_ALGORITHM)
+    file_pointer = file_obj
+    try:
+        if file_pointer is None:
+            file_pointer = open(str(media_path), 'rb', buffering=0)
+        for start, end in audio_payload_ranges(file_pointer,
+                                               media_path.suffix):
+            file_pointer.seek(start)
+            _hash_range(hash_obj, file_pointer, end - start)
+    except (OSError, PermissionError):
+        show_exception()
+        return 'no hash'
+    finally:
+        if file_obj is None and file_pointer is not None:
+            file_pointer.close()
+    return str(hash_obj.hexdigest().upper())
+
+
+def _hash_range(hash_obj, file_ptr, size: int,
+                buffer_size: int = file_tools.HASH_BUFFER_SIZE) -> None:
+    """Streams size bytes from the current position into hash_obj."""
+    read_buffer = bytearray(min(buffer_size, max(size, 1)))
+    buffer_view = memoryview(read_buffer)
+    while size > 0:
+        n_bytes = file_ptr.readinto(buffer_view[:min(size, len(read_buffer))])
+        if not n_bytes:
+            break
+        hash_obj.update(buffer_view[:n_bytes])
+        size -= n_bytes
+
+
+def hash_media_file(media_path: Path) -> tuple:
+    """Returns (file hash, audio payload hash) from one sequential read."""
+    try:
+        with open(str(media_path), 'rb', buffering=0) as file_pointer:
+            payload_hash = PayloadHash(
+                audio_payload_ranges(file_pointer, media_path.suffix))
+            file_tools.update_file_hash(payload_hash, file_pointer)
+    except (OSError, PermissionError):
+        show_exception()
+        return 'no hash', 'no hash'
+    return str(payload_hash.hexdigest().upper()), \
+        payload_hash.payload_hexdigest()
+
+
+def dump_tag_data_and_hash(media_path: Path) -> tuple:
+    """Parses tags and hashes file (HASH_ALGORITHM) from one open handle.
+
+    The record's 'audio_hash' is filled from the same read, see
+    audio_payload_ranges().
+    """
+    show_methods(inspect.currentframe().f_code.co_name)
+    try:
+        with open(str(media_path), 'rb') as file_pointer:
+            payload_hash = PayloadHash(
+                audio_payload_ranges(file_pointer, media_path.suffix))
+            reader = HashingReader(file_pointer, payload_hash,
+                                   str(media_path))
+            tag_dict = dump_tag_data(media_path, reader)
+            sha_hex = reader.finish()
+            tag_dict['audio_hash'] = payload_hash.payload_hexdigest()
+    except (OSError, PermissionError):
+        show_exception()
+        tag_dict = dump_tag_data(media_path)
+        tag_dict['audio_hash'] = 'no hash'
+        return tag_dict, 'no hash'
+    return tag_dict, sha_hex
+
+
+def _walk_media_entries(input_path: Path) -> Iterator[os.DirEntry]:
+    """Single os.scandir() pass yielding media entries in directory order."""
+    pending_dirs = [os.path.abspath(input_path)]
+    while pending_dirs:
+        dir_path = pending_dirs.pop()
+        try:
+            media_entries, subdir_paths = _scan_media_dir(dir_path)
+        except OSError:  # unreadable directory, same as rglob()
+            continue
+        pending_dirs.extend(subdir_paths)
+        yield from media_entries
+
+
+def _scan_media_dir(dir_path: str) -> tuple:
+    """Lists one directory: ([media DirEntry], [subdirectory paths])."""
+    media_entries = []
+    subdir_paths = []
+    with os.scandir(dir_path) as dir_iter:
+        for entry in dir_iter:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    subdir_paths.append(entry.path)
+                elif (os.path.splitext(entry.name)[1].lower()
+                      in AUDIO_EXT and entry.is_file()):
+                    media_entries.append(entry)
+            except OSError:
+                continue
+    return media_entries, subdir_paths
+
+
+class _CachedEntry:
+    """os.DirEntry stand-in for files listed from the scan manifest."""
+    __slots__ = ('path', 'name', '_stat')
+
+    def __init__(self, path: str, name: str, file_stat: os.stat_result):
+        self.path = path
+        self.name = name
+        self._stat = file_stat
+
+    def stat(self) -> os.stat_result:
+        """Returns stat result captured when the entry was created."""
+        return self._stat
+
+    def is_file(self) -> bool:
+        """Cached entries are only created for regular files."""
+        return True
+
+    def __fspath__(self) -> str:
+        return self.path
+
+
+class ScanManifest:
+    """On-disk record of the last scan, used for incremental re-scans.
+
+    File records are reused while path, size, mtime_ns and inode all match.
+    Directories with an unchanged mtime_ns are not listed again, their cached
+    media file names are stat'ed directly to catch in-place tag edits.
+    Files and directories not seen by the current scan are dropped on save().
+    """
+
+    def __init__(self, manifest_path: Path):
+        self.manifest_path = Path(manifest_path)
+        self.dirs = {}  # dir path: [mtime_ns, [file names], [subdir names]]
+        self.files = {}  # file path: [size, mtime_ns, inode, [values]]
+        self.seen_dirs = {}
+        self.seen_files = {}
+        self.counts = OrderedDict([('listed_dirs', 0), ('cached_dirs', 0),
+                                   ('parsed_files', 0), ('reused_files', 0)])
+        self.scan_start_ns = time.time_ns()
+        self.load()
+
+    def load(self) -> None:
+        """Reads previous scan manifest, ignored if missing or outdated."""
+        if self.manifest_path.exists():
+            try:
+                with open(self.manifest_path, 'r',
+                          encoding='utf-8') as json_file:
+                    manifest = json.load(json_file)
+                if (manifest.get('version') == MANIFEST_VERSION and
+                        manifest.get('header') == HEADER_KEYS):
+                    self.dirs = manifest['dirs']
+                    self.files = manifest['files']
+            except (OSError, ValueError, KeyError):
+                show_exception()
+
+    def save(self) -> None:
+        """Atomically writes manifest of files/directories seen this scan."""
+        manifest = {'version': MANIFEST_VERSION,
+                    'header': HEADER_KEYS,
+                    'dirs': self.seen_dirs,
+                    'files': self.seen_files}
+        tmp_path = Path(f"{self.manifest_path}.tmp")
+        try:
+            self.manifest_path.parent.mkdir(parents=True, exist_ok=True)
+            with open(tmp_path, 'w', encoding='utf-8') as json_file:
+                json.dump(manifest, json_file, separators=(',', ':'))
+            os.replace(tmp_path, self.manifest_path)
+        except (OSError, ValueError):
+            show_exception()
+
+    def is_racy(self, mtime_ns: int) -> bool:
+        """True if mtime may still change within the same timestamp tick."""
+        return mtime_ns >= self.scan_start_ns - RACY_WINDOW_NS
+
+    def walk(self, input_path: Path) -> Iterator:
+        """Yields media entries, skipping listing of unchanged directories."""
+        root_path = os.path.abspath(input_path)
+        try:
+            pending_dirs = [(root_path, os.stat(root_path).st_mtime_ns)]
+        except OSError:
+            return
+        while pending_dirs:
+            dir_path, mtime_ns = pending_dirs.pop()
+            cached_dir = self.dirs.get(dir_path)
+            if cached_dir is not None and cached_dir[0] == mtime_ns:
+                self.counts['cached_dirs'] += 1
+                self.seen_dirs[dir_path] = cached_dir
+                for subdir_name in cached_dir[2]:
+                    subdir_path = os.path.join(dir_path, subdir_name)
+                    try:
+                        subdir_mtime = os.stat(subdir_path).st_mtime_ns
+                        pending_dirs.append((subdir_path, subdir_mtime))
+                    except OSError:
+                        continue
+                for file_name in cached_dir[1]:
+                    file_path = os.path.join(dir_path, file_name)
+                    try:
+                        yield _CachedEntry(file_path, file_name,
+                                           os.stat(file_path))
+                    except OSError:
+                        continue
+                continue
+            self.counts['listed_dirs'] += 1
+            file_names = []
+            subdir_names = []
+            try:
+                with os.scandir(dir_path) as dir_iter:
+                    for entry in dir_iter:
+                        try:
+                            if entry.is_dir(follow_symlinks=False):
+                                subdir_names.append(entry.name)
+                                pending_dirs.append(
+                                    (entry.path, entry.stat().st_mtime_ns))
+                            elif (os.path.splitext(entry.name)[1].lower()
+                                  in AUDIO_EXT and entry.is_file()):
+                                file_names.append(entry.name)
+                                yield entry
+                        except OSError:
+                            continue
+            except OSError:
+                continue
+            if self.is_racy(mtime_ns):
+                mtime_ns = None  # force a fresh listing on the next scan
+            self.seen_dirs[dir_path] = [mtime_ns, file_names, subdir_names]
+
+    def is_unchanged(self, file_path: str,
+                     file_stat: os.stat_result) -> bool:
+        """True if size/mtime/inode match, record is kept for next scan."""
+        cached_file = self.files.get(file_path)
+        if cached_file is not None:
+            if cached_file[:3] == [file_stat.st_size, file_stat.st_mtime_ns,
+                                   file_stat.st_ino]:
+                self.counts['reused_files'] += 1
+                self.seen_files[file_path] = cached_file
+                return True
+        return False
+
+    def cached_record(self, file_path: str) -> TrackRecord:
+        """Returns tag record stored by a previous scan."""
+        return TrackRecord(zip(HEADER_KEYS, self.files[file_path][3]))
+
+    def get_record(self, file_path: str,
+                   file_stat: os.stat_result) -> TrackRecord:
+        """Returns cached tag record if the file is unchanged, else None."""
+        if self.is_unchanged(file_path, file_stat):
+            return self.cached_record(file_path)
+        return None
+
+    def set_record(self, file_path: str, file_stat: os.stat_result,
+                   tag_dict: TrackRecord) -> None:
+        """Stores freshly parsed tag record for the next scan."""
+        self.counts['parsed_files'] += 1
+        if not self.is_racy(file_stat.st_mtime_ns):
+            self.seen_files[file_path] = [file_stat.st_size,
+                                          file_stat.st_mtime_ns,
+                                          file_stat.st_ino,
+                                          tag_dict.json_values()]
+
+    def summary(self) -> str:
+        """Returns counts of reused/parsed files and cached directories."""
+        return ', '.join(f"{key}: {val}" for key, val in self.counts.items())
+
+
+def iter_media_entries(input_path: Path, order: str = 'ext',
+                       manifest: ScanManifest = None) -> Iterator[os.DirEntry]:
+    """Yields media os.DirEntry objects from one walk of the input path.
+
+    order: 'ext' groups by AUDIO_EXT then path (get_all_media_paths order),
+           'path' sorts by path only, 'folder' by directory then name,
+           so a folder's own files come before its subfolders (each
+           top-level folder contiguous, input path files first),
+           'none' streams in directory order.
+    DirEntry.stat() results are cached, so callers never re-stat a file.
+    manifest: optional ScanManifest to skip listing unchanged directories.
+    """
+    if order not in MEDIA_ORDERS:
+        raise ValueError(f"invalid order: '{order}' not in {MEDIA_ORDERS}")
+    if manifest is not None:
+        entries = manifest.walk(input_path)
+    else:
+        entries = _walk_media_entries(input_path)
+    sort_key = _media_sort_key(order)
+    if sort_key is None:
+        yield from entries
+        return
+    yield from sorted(entries, key=sort_key)
+
+
+def _media_sort_key(order: str):
+    """Returns entry sort key function of MEDIA_ORDERS, None for 'none'."""
+    if order == 'ext':
+        def sort_key(entry):
+            file_ext = os.path.splitext(entry.name)[1].lower()
+            return AUDIO_EXT.index(file_ext), Path(entry.path)
+    elif order == 'path':
+        def sort_key(entry):
+            return Path(entry.path)
+    elif order == 'folder':
+        def sort_key(entry):
+            file_path = Path(entry.path)
+            return file_path.parent, file_path.name
+    else:
+        sort_key = None
+    return sort_key
+
+
+def get_all_media_paths(input_path: Path, order: str = 'ext') -> list:
     """Find all media files with extension: [.mp3, .m4a, .flac, .wma]."""
-    all_media_paths = []
-    for file_ext in AUDIO_EXT:
-        path_list = [p.absolute() for p in
-                     sorted(input_path.rglob(f"*{file_ext}"))
-                     if p.is_file()]
-        all_media_paths.extend(path_list)
-    return all_media_paths
+    return [Path(entry.path) for entry in
+            iter_media_entries(input_path, order=order)]
 
 
-def build_stat_list(input_path: Path) -> tuple:
-    """Parses media tags and converts to a list to be later passed to Excel."""
-    func_name = f"{inspect.currentframe().f_code.co_name}()"
-    output_str = f"{func_name}\n"
-    print(output_str, end='')
+def parse_media_file(file_path: Path, file_stat: os.stat_result,
+                     genre_dict: dict) -> TrackRecord:
+    """Parses tags, encoding, stat and hash of one file (except 'index')."""
+    tag_dict, sha_hex = dump_tag_data_and_hash(file_path)
+    tag_dict['hash'] = sha_hex
+    return _add_file_fields(tag_dict, file_path, file_stat, genre_dict)
+
+
+def parse_media_tags(file_path: Path, file_stat: os.stat_result,
+                     genre_dict: dict) -> TrackRecord:
+    """Parses tags, encoding and stat of one file (no 'index'/hashes)."""
+    return _add_file_fields(dump_tag_data(file_path), file_path, file_stat,
+                            genre_dict)
+
+
+def _add_file_fields(tag_dict: TrackRecord, file_path: Path,
+                     file_stat: os.stat_result,
+                     genre_dict: dict) -> TrackRecord:
+    """Fills genre check, stat, file name and path encoding fields."""
+    file_name = str(file_path.stem)
+    file_ext = str(file_path.suffix)
+    if tag_dict['artist_name'] in genre_dict:
+        tag_dict['genre_in_dict'] = 'GENRE_OK'
+    else:
+        tag_dict['genre_in_dict'] = 'INCONSISTENT'
+    file_size = file_stat.st_size
+    ts = file_stat.st_mtime
+    file_last_modified = datetime.datetime.fromtimestamp(ts)
+    tag_dict['file_size'] = file_size
+    tag_dict['readable_size'] = f"{bytes_to_readable(file_size)}"
+    tag_dict['file_ext'] = file_ext
+    tag_dict['file_name'] = file_name + file_ext
+    tag_dict['path_len'] = len(str(file_path))
+    tag_dict['last_modified'] = file_last_modified
+    tag_dict['encoding'] = classify_path_encoding(str(file_path))
+    return tag_dict
+
+
+def _parse_media_task(task: tuple, genre_dict: dict) -> tuple:
+    """Process-pool worker, failures are isolated to the single file.
+
+    task: (file path, stat, cached (hash, audio_hash) or None), files with
+          cached hashes are only tag parsed, never hashed.
+    """
+    file_path_str, file_stat, cached_hashes = task
+    try:
+        if cached_hashes is not None:
+            tag_dict = parse_media_tags(Path(file_path_str), file_stat,
+                                        genre_dict)
+            tag_dict['hash'], tag_dict['audio_hash'] = cached_hashes
+            return tag_dict, ''
+        return parse_media_file(Path(file_path_str), file_stat,
+                                genre_dict), ''
+    except Exception as exc:  # pylint: disable=broad-except
+        return None, (f"~!ERROR!~ input: '{file_path_str}' "
+                      f"{type(exc)} {exc}")
+
+
+def _stat_parse_media_task(entry: os.DirEntry, genre_dict: dict) -> tuple:
+    """Executor task: stat, parse and hash one media entry."""
+    try:
+        file_stat = entry.stat()
+    except OSError as exc:
+        return None, f"~!ERROR!~ input: '{entry.path}' {type(exc)} {exc}"
+    return _parse_media_task((entry.path, file_stat, None), genre_dict)
+
+
+def _progress_line(position: int, total: int, percent_list: list,
+                   file_name: str) -> str:
+    """Returns 'parsing:' status line at each get_progress() step, else ''."""
+    current_hit = round(position / total, 4)
+    if len(percent_list) > 0 and current_hit == percent_list[0]:
+        percent_list.pop(0)
+        percent = f"{current_hit * 100.0:0.1F}%"
+        return (f"   parsing: [{position:04} of {total:04}]"
+                f" {percent: >6} '{file_name}'")
+    return ''
+
+
+def _parse_media_chunk(tasks: list, genre_dict: dict) -> list:
+    """Process-pool worker, parses one chunk of tasks."""
+    return [_parse_media_task(task, genre_dict) for task in tasks]
+
+
+def _iter_parsed(tasks: Iterator[tuple], genre_dict: dict, workers: int,
+                 chunk_size: int) -> Iterator[tuple]:
+    """Yields (tag_dict, error_str) for each task, in submission order.
+
+    Pool submissions are limited to 2 chunks per worker in flight, so
+    results never pile up ahead of a slow consumer.
+    """
+    parse_task = functools.partial(_parse_media_task, genre_dict=genre_dict)
+    if workers <= 1:
+        yield from map(parse_task, tasks)
+        return
+    tasks = iter(tasks)
+    pending_chunks = deque()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        while True:
+            while len(pending_chunks) < workers * 2:
+                chunk = list(itertools.islice(tasks, chunk_size))
+                if not chunk:
+                    break
+                pending_chunks.append(executor.submit(
+                    _parse_media_chunk, chunk, genre_dict))
+            if not pending_chunks:
+                return
+            yield from pending_chunks.popleft().result()
+
+
+def _cached_hashes(hash_cache, file_path: str,
+                   file_stat: os.stat_result) -> tuple:
+    """Returns (hash, audio_hash) from hash_cache, None unless both hit."""
+    if hash_cache is None:
+        return None
+    sha_hex = hash_cache.get(file_path, HASH_ALGORITHM, file_stat)
+    if sha_hex is None:
+        return None
+    audio_hex = hash_cache.get(file_path, AUDIO_HASH_KEY, file_stat)
+    if audio_hex is None:
+        return None
+    return sha_hex, audio_hex
+
+
+def _store_hashes(hash_cache, entry: os.DirEntry,
+                  tag_dict: TrackRecord) -> None:
+    """Stores freshly computed hashes of a parsed record in hash_cache."""
+    for algorithm, field in [(HASH_ALGORITHM, 'hash'),
+                             (AUDIO_HASH_KEY, 'audio_hash')]:
+        if tag_dict[field] and tag_dict[field] != 'no hash':
+            hash_cache.put(entry.path, algorithm, tag_dict[field],
+                           entry.stat())
+
+
+def iter_stat_records(input_path: Path, media_entries: list = None,
+                      order: str = 'ext',
+                      manifest_path: Path = None,
+                      workers: int = 1,
+                      chunk_size: int = PARSE_CHUNK_SIZE,
+                      log=None, hash_cache=None,
+                      with_path: bool = False) -> Iterator[TrackRecord]:
+    """Yields parsed TrackRecord for each media file, as soon as parsed.
+
+    Streaming form of build_stat_list(), records are not retained so
+    sinks can write them incrementally. Progress/error lines are printed
+    and passed to optional log(line) callable. The manifest is saved
+    once the generator is exhausted.
+    hash_cache: optional hash_cache.HashCache, unchanged files are tag
+                parsed only and their hashes taken from the cache.
+    with_path: yields (file path, TrackRecord) tuples instead.
+    """
+    def log_line(line: str) -> None:
+        print(line)
+        if log is not None:
+            log(line)
+
     index = 0
     genre_dict = build_genre_dictionary()
-    # list: [row1:[hdr1, ..., hdrN], row2:[data1, ..., dataN]... rowN]
-    stat_list_of_dicts = []
-    all_media_path_list = get_all_media_paths(input_path)
-    total = len(all_media_path_list)
+    manifest = None
+    if manifest_path is not None:
+        manifest = ScanManifest(manifest_path)
+    if media_entries is None:
+        media_entries = list(iter_media_entries(input_path, order=order,
+                                                manifest=manifest))
+    total = len(media_entries)
     percent_list = get_progress(total)
-    progress_count = 0
     if total > 1:
-        for file_path in all_media_path_list:
-            if str(file_path).lower().endswith(tuple(AUDIO_EXT)):
-                pl_path = Path(file_path)
-                char_enc = check_encoding(str(file_path))[0]
-                tag_dict = dump_tag_data(file_path)
-                curr_dir = str(file_path.parts[-1])
-                file_name = str(file_path.stem)
-                file_ext = str(file_path.suffix)
+        is_cached = [manifest is not None and
+                     manifest.is_unchanged(entry.path, entry.stat())
+                     for entry in media_entries]
+        hashed_paths = set()  # hash_cache misses, stored once parsed
+
+        def parse_task(entry: os.DirEntry) -> tuple:
+            # entry.stat() is cached by os.scandir()
+            cached_hashes = _cached_hashes(hash_cache, entry.path,
+                                           entry.stat())
+            if hash_cache is not None and cached_hashes is None:
+                hashed_paths.add(entry.path)
+            return entry.path, entry.stat(), cached_hashes
+
+        parse_tasks = (parse_task(entry) for entry, cached
+                       in zip(media_entries, is_cached) if not cached)
+        parsed_iter = _iter_parsed(parse_tasks, genre_dict, workers,
+                                   chunk_size)
+        for position, entry in enumerate(media_entries, 1):
+            if is_cached[position - 1]:
+                tag_dict = manifest.cached_record(entry.path)
                 if tag_dict['artist_name'] in genre_dict:
                     tag_dict['genre_in_dict'] = 'GENRE_OK'
                 else:
                     tag_dict['genre_in_dict'] = 'INCONSISTENT'
+            else:
+                tag_dict, error_str = next(parsed_iter)
+                if tag_dict is not None and manifest is not None:
+                    manifest.set_record(entry.path, entry.stat(), tag_dict)
+                if entry.path in hashed_paths:
+                    hashed_paths.discard(entry.path)
+                    if tag_dict is not None:
+                        _store_hashes(hash_cache, entry, tag_dict)
+            status_str = _progress_line(position, total, percent_list,
+                                        entry.name)
+            if status_str:
+                log_line(status_str)
+            if tag_dict is None:  # parse failure, skip only this file
+                log_line(error_str)
+                continue
+            index += 1
+            tag_dict['index'] = index
+            yield (entry.path, tag_dict) if with_path else tag_dict
+        if manifest is not None:
+            manifest.save()
+            log_line(f"   manifest: {manifest.summary()}")
+        if hash_cache is not None:
+            log_line(f"   hash_cache: {hash_cache.summary()}")
+
+
+def build_stat_list(input_path: Path, media_entries: list = None,
+                    order: str = 'ext',
+                    manifest_path: Path = None,
+                    workers: int = 1,
+                    chunk_size: int = PARSE_CHUNK_SIZE,
+                    hash_cache=None) -> tuple:
+    """Parses media tags and converts to a list to be later passed to Excel.
+
+    manifest_path: optional ScanManifest file, only new or changed files
+                   are parsed and hashed, unchanged records are reused.
+    workers: >1 parses/hashes files in a process pool, submitted in chunks
+             of chunk_size files, results keep the same 'index' order.
+    hash_cache: optional hash_cache.HashCache of previous file hashes.
+    See iter_stat_records() to stream records instead of listing them.
+    """
+    func_name = f"{inspect.currentframe().f_code.co_name}()"
+    output_str = f"{func_name}\n"
+    print(output_str, end='')
+    log_lines = []
+    stat_list_of_dicts = list(iter_stat_records(
+        input_path, media_entries, order, manifest_path, workers,
+        chunk_size, log=log_lines.append, hash_cache=hash_cache))
+    output_str += ''.join(f"{line}\n" for line in log_lines)
+    return stat_list_of_dicts, output_str
+
+
+_STOP = object()  # pipeline end-of-stream marker
+
+
+class _PipelineItem:
+    """One media file moving through the ScanPipeline stages."""
+    __slots__ = ('seq', 'entry', 'file_stat', 'record', 'reader',
+                 'error_str')
+
+    def __init__(self, seq: int, entry: os.DirEntry):
+        self.seq = seq
+        self.entry = entry
+        self.file_stat = None
+        self.record = None
+        self.reader = None  # open HashingReader from parse to hash stage
+        self.error_str = ''
+
+
+class StageStats:
+    """Throughput counters of one pipeline stage.
+
+    busy: seconds spent working, wait_in: starved by the upstream stage,
+    wait_out: blocked by a full downstream queue (backpressure).
+    """
+
+    def __init__(self, name: str, workers: int):
+        self.name = name
+        self.workers = workers
+        self.running = workers
+        self.items = 0
+        self.busy = 0.0
+        self.wait_in = 0.0
+        self.wait_out = 0.0
+        self.lock = threading.Lock()
+
+    def add(self, items: int, busy: float, wait_in: float,
+            wait_out: float) -> None:
+        """Adds counters of one worker."""
+        with self.lock:
+            self.items += items
+            self.busy += busy
+            self.wait_in += wait_in
+            self.wait_out += wait_out
+
+    def finish_worker(self) -> bool:
+        """Marks one worker done, True for the last one of the stage."""
+        with self.lock:
+            self.running -= 1
+            return self.running == 0
+
+    def utilization(self, elapsed: float) -> float:
+        """Busy fraction of the stage's total worker time."""
+        if elapsed <= 0:
+            return 0.0
+        return self.busy / (self.workers * elapsed)
+
+    def summary(self, elapsed: float) -> str:
+        """Returns one line of stage counters."""
+        rate = self.items / elapsed if elapsed > 0 else 0.0
+        return (f"   {self.name:5} workers: {self.workers:2}"
+                f" items: {self.items:6} {rate:9.1f}/s"
+                f" busy: {self.utilization(elapsed):6.1%}"
+                f" wait_in: {self.wait_in:7.2f}s"
+                f" wait_out: {self.wait_out:7.2f}s")
+
+
+class ScanPipeline:
+    """Staged media scan: walk -> stat -> parse -> hash -> sink.
+
+    Each stage has its own thread pool, stages are connected by bounded
+    queues so the slowest stage applies backpressure instead of files
+    piling up in memory. Directory listing/stat (latency bound), tag
+    parsing (CPU bound) and hashing (bandwidth bound) overlap. Each file
+    is read once: the parse stage reads tags through a HashingReader,
+    the hash stage hashes the rest of the file from the same handle.
+    With parse_processes > 0 each parse thread hands its file to a
+    process pool, which parses and hashes it, so tag parsing is not
+    limited by the GIL.
+
+    run() yields the same TrackRecords as build_stat_list(), in walk order
+    with contiguous 'index'. StageStats show which stage is the bottleneck.
+    """
+
+    def __init__(self, input_path: Path, order: str = 'none',
+                 stage_workers: dict = None,
+                 queue_size: int = PIPELINE_QUEUE_SIZE,
+                 parse_processes: int = 0):
+        if order not in MEDIA_ORDERS:
+            raise ValueError(f"invalid order: '{order}' not in {MEDIA_ORDERS}")
+        self.input_path = input_path
+        self.order = order
+        workers = OrderedDict(PIPELINE_WORKERS)
+        workers.update(stage_workers or {})
+        workers['walk'] = workers['sink'] = 1
+        self.workers = workers
+        self.stats = OrderedDict()
+        self.queue_size = queue_size
+        self.parse_processes = parse_processes
+        self.genre_dict = build_genre_dictionary()
+        self.elapsed = 0.0
+        self._stop = threading.Event()
+        self._window = None
+        self._executor = None
+        self._walk_error = None  # raised by run() once stages are stopped
+
+    def _put(self, out_queue: queue.Queue, item) -> float:
+        """Blocking put unless stopped, returns seconds waited.
+
+        An item dropped because of the stop closes its open file.
+        """
+        start = time.perf_counter()
+        while not self._stop.is_set():
+            try:
+                out_queue.put(item, timeout=PIPELINE_POLL)
+                return time.perf_counter() - start
+            except queue.Full:
+                continue
+        if item is not _STOP and item.reader is not None:
+            item.reader.file_ptr.close()
+        return time.perf_counter() - start
+
+    def _get(self, in_queue: queue.Queue) -> tuple:
+        """Blocking get unless stopped, returns (item, seconds waited)."""
+        start = time.perf_counter()
+        while not self._stop.is_set():
+            try:
+                return in_queue.get(timeout=PIPELINE_POLL), \
+                    time.perf_counter() - start
+            except queue.Empty:
+                continue
+        return _STOP, time.perf_counter() - start
+
+    def _walk(self, out_queue: queue.Queue, next_workers: int) -> None:
+        """Walk stage: numbers media entries in scan order.
+
+        End-of-stream is always sent downstream, a walk error is kept
+        for run() to raise.
+        """
+        items, busy, wait_out = 0, 0.0, 0.0
+        try:
+            start = time.perf_counter()
+            for seq, entry in enumerate(iter_media_entries(
+                    self.input_path, order=self.order)):
+                busy += time.perf_counter() - start
+                # limits files in flight, including the sink reorder buffer
+                while not self._window.acquire(timeout=PIPELINE_POLL):
+                    if self._stop.is_set():
+                        break
+                wait_out += self._put(out_queue, _PipelineItem(seq, entry))
+                if self._stop.is_set():
+                    break
+                items += 1
+                start = time.perf_counter()
+        except Exception as exc:  # pylint: disable=broad-except
+            self._walk_error = exc
+        finally:
+            self.stats['walk'].add(items, busy, 0.0, wait_out)
+            for _ in range(next_workers):
+                self._put(out_queue, _STOP)
+
+    def _run_stage(self, name: str, stage_func, in_queue: queue.Queue,
+                   out_queue: queue.Queue, next_workers: int) -> None:
+        """Stage worker: applies stage_func to items until end-of-stream."""
+        items, busy, wait_in, wait_out = 0, 0.0, 0.0, 0.0
+        while True:
+            item, waited = self._get(in_queue)
+            wait_in += waited
+            if item is _STOP:
+                break
+            start = time.perf_counter()
+            if not item.error_str:
+                try:
+                    stage_func(item)
+                except Exception as exc:  # pylint: disable=broad-except
+                    item.error_str = (f"~!ERROR!~ input: '{item.entry.path}'"
+                                      f" {type(exc)} {exc}")
+            busy += time.perf_counter() - start
+            items += 1
+            wait_out += self._put(out_queue, item)
+        stats = self.stats[name]
+        stats.add(items, busy, wait_in, wait_out)
+        if stats.finish_worker():
+            for _ in range(next_workers):
+                self._put(out_queue, _STOP)
+
+    def _stat(self, item: _PipelineItem) -> None:
+        """Stat stage: one stat() round trip per file."""
+        item.file_stat = item.entry.stat()
+
+    def _parse(self, item: _PipelineItem) -> None:
+        """Parse stage: tags, path encoding and stat fields.
+
+        Tags are read through a HashingReader left open for the hash
+        stage, process pool tasks parse and hash in one read instead.
+        """
+        file_path = Path(item.entry.path)
+        task = (file_path, item.file_stat, self.genre_dict)
+        if self._executor is not None:
+            item.record = self._executor.submit(parse_media_file,
+                                                *task).result()
+            return
+        file_ptr = None
+        try:
+            file_ptr = open(str(file_path), 'rb')
+            reader = HashingReader(file_ptr, PayloadHash(
+                audio_payload_ranges(file_ptr, file_path.suffix)),
+                str(file_path))
+            item.record = _add_file_fields(dump_tag_data(file_path, reader),
+                                           *task)
+            item.reader, file_ptr = reader, None  # closed by the hash stage
+        except OSError:  # same as dump_tag_data_and_hash()
+            show_exception()
+            item.record = parse_media_tags(*task)
+            item.record['hash'] = item.record['audio_hash'] = 'no hash'
+        finally:
+            if file_ptr is not None:
+                file_ptr.close()
+
+    def _hash(self, item: _PipelineItem) -> None:
+        """Hash stage: hashes the file past the bytes read by the parse."""
+        reader, item.reader = item.reader, None
+        if reader is None:  # hashed by the parse process, or unreadable
+            return
+        try:
+            item.record['hash'] = reader.finish()
+            item.record['audio_hash'] = reader.hash_obj.payload_hexdigest()
+        except OSError:
+            show_exception()
+            item.record['hash'] = item.record['audio_hash'] = 'no hash'
+        finally:
+            reader.file_ptr.close()
+
+    def _sink(self, in_queue: queue.Queue, log_line) -> Iterator[TrackRecord]:
+        """Sink stage: restores walk order, numbers and yields records."""
+        items, busy, wait_in = 0, 0.0, 0.0
+        pending_items = {}
+        next_seq = 0
+        index = 0
+        while True:
+            item, waited = self._get(in_queue)
+            wait_in += waited
+            if item is _STOP:
+                break
+            pending_items[item.seq] = item
+            while next_seq in pending_items:
+                ready = pending_items.pop(next_seq)
+                next_seq += 1
+                self._window.release()
+                if ready.error_str:  # failure skips only this file
+                    log_line(ready.error_str)
+                    continue
                 index += 1
-                current_hit = round(index / total, 4)
-                if len(percent_list) > 0:
-                    if current_hit == percent_list[0]:
-                        percent = f"{current_hit * 100.0:0.1F}%"
-                        status_str = (f"   parsing: [{index:04}"
-                                      f" of {total:04}]"
-                                      f" {percent: >6} '{curr_dir}'")
-                        print(status_str)
-                        output_str += f"{status_str}\n"
-                        progress_count += 1
-                        percent_list.pop(0)
-                file_size = os.stat(file_path).st_size
-                ts = os.path.getmtime(file_path)
-                file_last_modified = datetime.datetime.fromtimestamp(ts)
-                tag_dict['index'] = f"{index:03}"
-                tag_dict['file_size'] = f"{file_size}"
-                tag_dict['readable_size'] = f"{bytes_to_readable(file_size)}"
-                tag_dict['file_ext'] = f"{file_ext}"
-                tag_dict['file_name'] = f"{file_name + file_ext}"
-                tag_dict['path_len'] = f"{len(str(file_path))}"
-                tag_dict['last_modified'] = f"{file_last_modified}"
-                tag_dict['encoding'] = f"{char_enc['encoding']}"
-                tag_dict['hash'] = f"{get_sha256_hash(pl_path)}"
-                stat_list_of_dicts.append(tag_dict)
+                ready.record['index'] = index
+                start = time.perf_counter()
+                yield ready.record  # consumer time counts as sink work
+                busy += time.perf_counter() - start
+                items += 1
+        self.stats['sink'].add(items, busy, wait_in, 0.0)
+
+    def bottleneck(self) -> str:
+        """Returns name of the stage with the highest utilization."""
+        return max(self.stats.values(),
+                   key=lambda stats: stats.utilization(self.elapsed)).name
+
+    def summary(self) -> str:
+        """Returns per-stage counters and the bottleneck stage."""
+        lines = [stats.summary(self.elapsed) for stats in self.stats.values()]
+        lines.append(f"   bottleneck: {self.bottleneck()}"
+                     f" ({self.elapsed:0.2f} seconds)")
+        return '\n'.join(lines)
+
+    def run(self, log=None) -> Iterator[TrackRecord]:
+        """Runs the pipeline, yields TrackRecords as the sink receives them.
+
+        Error lines and the final stage summary are printed and passed to
+        optional log(line) callable. Closing the generator early stops
+        all stages.
+        """
+        def log_line(line: str) -> None:
+            print(line)
+            if log is not None:
+                log(line)
+
+        workers = self.workers
+        self.stats = OrderedDict([(name, StageStats(name, workers[name]))
+                                  for name in PIPELINE_STAGES])
+        queues = [queue.Queue(maxsize=self.queue_size)
+                  for _ in PIPELINE_STAGES[1:]]
+        self._stop.clear()
+        self._walk_error = None
+        self._window = threading.Semaphore(
+            self.queue_size * len(queues) + sum(workers.values()))
+        threads = [threading.Thread(target=self._walk, daemon=True,
+                                    args=(queues[0], workers['stat']))]
+        stage_funcs = [('stat', self._stat), ('parse', self._parse),
+                       ('hash', self._hash)]
+        for idx, (name, stage_func) in enumerate(stage_funcs):
+            next_workers = workers[PIPELINE_STAGES[idx + 2]]
+            threads.extend(threading.Thread(
+                target=self._run_stage, daemon=True,
+                args=(name, stage_func, queues[idx], queues[idx + 1],
+                      next_workers)) for _ in range(workers[name]))
+        if self.parse_processes > 0:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.parse_processes)
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        try:
+            yield from self._sink(queues[-1], log_line)
+        finally:
+            self._stop.set()
+            for thread in threads:
+                thread.join()
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
+            for stage_queue in queues[1:]:  # parsed, not yet hashed
+                while not stage_queue.empty():
+                    item = stage_queue.get_nowait()
+                    if item is not _STOP and item.reader is not None:
+                        item.reader.file_ptr.close()
+            self.elapsed = time.perf_counter() - start
+        if self._walk_error is not None:
+            raise self._walk_error
+        log_line(self.summary())
+
+
+class AsyncScanner:
+    """asyncio scan front-end for high-latency (SMB/NFS) storage.
+
+    Directory listings and per-file stat/parse/hash calls are blocking, so
+    each one runs in a thread pool executor while the event loop keeps up
+    to `concurrency` of them in flight. Per-file round trips overlap
+    instead of adding up. records() yields the same TrackRecords, in the
+    same order, as build_stat_list().
+    """
+
+    def __init__(self, input_path: Path, order: str = 'ext',
+                 concurrency: int = ASYNC_CONCURRENCY):
+        if order not in MEDIA_ORDERS:
+            raise ValueError(f"invalid order: '{order}' not in {MEDIA_ORDERS}")
+        self.input_path = input_path
+        self.order = order
+        self.concurrency = max(1, concurrency)
+        self.genre_dict = build_genre_dictionary()
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self._semaphore = None
+        self._executor = None
+
+    async def _offload(self, func, *args):
+        """Awaits blocking func(*args) in the executor, bounded in flight."""
+        async with self._semaphore:
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+            try:
+                return await asyncio.get_running_loop().run_in_executor(
+                    self._executor, func, *args)
+            finally:
+                self.in_flight -= 1
+
+    async def walk(self) -> list:
+        """Lists all directories concurrently, returns sorted media entries."""
+        media_entries = []
+        pending_dirs = {asyncio.ensure_future(self._offload(
+            _scan_media_dir, os.path.abspath(self.input_path)))}
+        while pending_dirs:
+            done_dirs, pending_dirs = await asyncio.wait(
+                pending_dirs, return_when=asyncio.FIRST_COMPLETED)
+            for dir_task in done_dirs:
+                try:
+                    dir_entries, subdir_paths = dir_task.result()
+                except OSError:  # unreadable directory, same as rglob()
+                    continue
+                media_entries.extend(dir_entries)
+                pending_dirs.update(asyncio.ensure_future(self._offload(
+                    _scan_media_dir, subdir_path))
+                    for subdir_path in subdir_paths)
+        sort_key = _media_sort_key(self.order)
+        if sort_key is not None:
+            media_entries.sort(key=sort_key)
+        return media_entries
+
+    async def records(self, log=None) -> AsyncIterator[TrackRecord]:
+        """Yields parsed TrackRecords in walk order, see iter_stat_records().
+
+        At most 2 * concurrency files are scheduled ahead of the consumer.
+        """
+        def log_line(line: str) -> None:
+            print(line)
+            if log is not None:
+                log(line)
+
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        parse_task = functools.partial(_stat_parse_media_task,
+                                       genre_dict=self.genre_dict)
+        pending_files = deque()
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            self._executor = executor
+            try:
+                media_entries = await self.walk()
+                total = len(media_entries)
+                percent_list = get_progress(total)
+                if total <= 1:
+                    return
+                entry_iter = iter(media_entries)
+                position = 0
+                index = 0
+                while True:
+                    for entry in itertools.islice(
+                            entry_iter,
+                            self.concurrency * 2 - len(pending_files)):
+                        pending_files.append((entry, asyncio.ensure_future(
+                            self._offload(parse_task, entry))))
+                    if not pending_files:
+                        break
+                    entry, file_task = pending_files.popleft()
+                    tag_dict, error_str = await file_task
+                    position += 1
+                    status_str = _progress_line(position, total,
+                                                percent_list, entry.name)
+                    if status_str:
+                        log_line(status_str)
+                    if tag_dict is None:  # failure skips only this file
+                        log_line(error_str)
+                        continue
+                    index += 1
+                    tag_dict['index'] = index
+                    yield tag_dict
+            finally:
+                for _, file_task in pending_files:
+                    file_task.cancel()
+                self._executor = None
+
+
+def build_stat_list_async(input_path: Path, order: str = 'ext',
+                          concurrency: int = ASYNC_CONCURRENCY) -> tuple:
+    """build_stat_list() through AsyncScanner, for network file systems.
+
+    Runs its own event loop, call AsyncScanner.records() from async code.
+    """
+    func_name = f"{inspect.currentframe().f_code.co_name}()"
+    output_str = f"{func_name}\n"
+    print(output_str, end='')
+    log_lines = []
+
+    async def collect_records() -> list:
+        scanner = AsyncScanner(input_path, order, concurrency)
+        return [record async for record
+                in scanner.records(log=log_lines.append)]
+
+    stat_list_of_dicts = asyncio.run(collect_records())
+    output_str += ''.join(f"{line}\n" for line in log_lines)
     return stat_list_of_dicts, output_str
@@ -0,0 +1,343 @@
+# -*- coding: UTF-8 -*-
+"""Micro-benchmarks for media scan stages."""
+import argparse
+from collections import OrderedDict
+import contextlib
+import functools
+import inspect
+import io
+import os
+import time
+import timeit
+import tracemalloc
+from pathlib import Path
+import tempfile
+import mutagen
+from lib import file_tools, media_tools
+import create_media_report
+
+MODULE_NAME = Path(__file__).resolve().name
+BASE_DIR = Path.cwd()
+PARENT_PATH = Path.cwd().parent
+
+__all__ = ['time_per_file', 'bench_tag_parse', 'bench_lean_read',
+           'bench_record_memory', 'bench_pipeline', 'bench_async_scan',
+           'bench_path_encoding', 'bench_duplicates', 'bench_hash_backend',
+           'bench_excel_export']
+
+
+def time_per_file(func, media_paths: list, repeat: int = 5) -> float:
+    """Returns best of repeat runs, in microseconds per file."""
+    timer = timeit.Timer(lambda: [func(path) for path in media_paths])
+    best = min(timer.repeat(repeat=repeat, number=1))
+    return best / len(media_paths) * 1e6
+
+
+def double_parse(media_path: Path):
+    """Legacy dump_mp3_tags()/dump_flac_tags() access: two mutagen parses."""
+    mutagen.File(media_path)
+    return media_tools.AUDIO_CLASSES[media_path.suffix.lower()](media_path)
+
+
+def bench_tag_parse(media_paths: list, repeat: int = 5) -> str:
+    """Compares legacy double mutagen parse to single load_audio() parse."""
+    def_name = inspect.currentframe().f_code.co_name
+    # only .mp3 and .flac were parsed twice by the dump_*_tags() functions
+    media_paths = [path for path in media_paths
+                   if path.suffix.lower() in ('.mp3', '.flac')]
+    output_str = f"{def_name}() files: {len(media_paths)}\n"
+    if not media_paths:
+        return f"{output_str}   no .mp3/.flac files to parse\n"
+    double_us = time_per_file(double_parse, media_paths, repeat)
+    single_us = time_per_file(media_tools.load_audio, media_paths, repeat)
+    output_str += f"   {'mutagen.File + class':24} {double_us:10.1f} us/file\n"
+    output_str += f"   {'load_audio':24} {single_us:10.1f} us/file\n"
+    output_str += f"   {'speedup':24} {double_us / single_us:10.2f}x\n"
+    return output_str
+
+
+class CountingReader(io.FileIO):
+    """FileIO counting bytes handed to the parser."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.bytes_read = 0
+
+    def read(self, size: int = -1) -> bytes:
+        data = super().read(size)
+        self.bytes_read += len(data)
+        return data
+
+
+def bytes_read(load_func, media_paths: list) -> int:
+    """Returns total bytes read by load_func(path, file_obj) over paths."""
+    total = 0
+    for media_path in media_paths:
+        with CountingReader(str(media_path), 'rb') as file_ptr:
+            load_func(media_path, file_ptr)
+            total += file_ptr.bytes_read
+    return total
+
+
+def bench_lean_read(media_paths: list, repeat: int = 5) -> str:
+    """Compares full load_audio() to header-only load_audio_lean()."""
+    def_name = inspect.currentframe().f_code.co_name
+    output_str = f"{def_name}() files: {len(media_paths)}\n"
+    for label, load_func in [('load_audio', media_tools.load_audio),
+                             ('load_audio_lean', media_tools.load_audio_lean)]:
+        load_us = time_per_file(load_func, media_paths, repeat)
+        read_size = media_tools.bytes_to_readable(
+            bytes_read(load_func, media_paths))
+        output_str += (f"   {label:24} {load_us:10.1f} us/file"
+                       f" {read_size:>12}\n")
+    return output_str
+
+
+def legacy_record(record: media_tools.TrackRecord) -> OrderedDict:
+    """Previous per-file layout: OrderedDict of formatted strings."""
+    legacy_dict = OrderedDict()
+    for hdr, value in record.items():
+        if hdr == 'index':
+            legacy_dict[hdr] = f"{value:03}"
+        elif value is None:
+            legacy_dict[hdr] = ''
+        else:
+            legacy_dict[hdr] = f"{value}"
+    return legacy_dict
+
+
+def traced_size(build_func) -> tuple:
+    """Returns (result, bytes still allocated) of build_func()."""
+    tracemalloc.start()
+    result = build_func()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, size
+
+
+def bench_record_memory(media_paths: list, repeat: int = 5,
+                        record_count: int = 20000) -> str:
+    """Compares memory of OrderedDict strings to TrackRecord layout."""
+    def_name = inspect.currentframe().f_code.co_name
+    genre_dict = media_tools.build_genre_dictionary()
+    records = [media_tools.parse_media_file(path, path.stat(), genre_dict)
+               for path in media_paths]
+    for index, record in enumerate(records, 1):
+        record['index'] = index
+    output_str = (f"{def_name}() files: {len(media_paths)}"
+                  f" records: {record_count}\n")
+    # text values are shared by both layouts, numbers/dates are rebuilt
+    legacy_list, legacy_size = traced_size(
+        lambda: [legacy_record(records[num % len(records)])
+                 for num in range(record_count)])
+    typed_size = traced_size(
+        lambda: [media_tools.TrackRecord(legacy_dict)
+                 for legacy_dict in legacy_list])[1]
+    for label, size in [('OrderedDict of str', legacy_size),
+                        ('TrackRecord', typed_size)]:
+        output_str += (f"   {label:24} {size / record_count:10.1f} B/record"
+                       f" {media_tools.bytes_to_readable(size):>12}\n")
+    output_str += f"   {'reduction':24} {legacy_size / typed_size:10.2f}x\n"
+    return output_str
+
+
+def bench_pipeline(media_paths: list, repeat: int = 5) -> str:
+    """Compares sequential iter_stat_records() to staged ScanPipeline."""
+    def_name = inspect.currentframe().f_code.co_name
+    input_path = Path(os.path.commonpath(media_paths))
+    if len(media_paths) == 1:
+        input_path = input_path.parent
+    output_str = f"{def_name}() files: {len(media_paths)}\n"
+    pipeline = media_tools.ScanPipeline(input_path)
+    timings = OrderedDict([('iter_stat_records', []), ('ScanPipeline', [])])
+    for _ in range(repeat):
+        with contextlib.redirect_stdout(io.StringIO()):
+            for label, record_iter in [
+                    ('iter_stat_records',
+                     lambda: media_tools.iter_stat_records(input_path)),
+                    ('ScanPipeline', pipeline.run)]:
+                start = time.perf_counter()
+                for _ in record_iter():
+                    pass
+                timings[label].append(time.perf_counter() - start)
+    for label, seconds in timings.items():
+        output_str += (f"   {label:24} {min(seconds) * 1e3:10.1f} ms"
+                       f" {len(media_paths) / min(seconds):10.1f} files/s\n")
+    output_str += f"{pipeline.summary()}\n"
+    return output_str
+
+
+def bench_async_scan(media_paths: list, repeat: int = 5) -> str:
+    """Compares build_stat_list() to AsyncScanner at several concurrencies.
+
+    Gains show on high-latency (SMB/NFS) paths, local disks mostly measure
+    the executor overhead.
+    """
+    def_name = inspect.currentframe().f_code.co_name
+    input_path = Path(os.path.commonpath(media_paths))
+    if len(media_paths) == 1:
+        input_path = input_path.parent
+    output_str = f"{def_name}() files: {len(media_paths)}\n"
+    scans = OrderedDict([('build_stat_list',
+                          lambda: media_tools.build_stat_list(input_path))])
+    for concurrency in (4, 16, media_tools.ASYNC_CONCURRENCY):
+        scans[f"async concurrency={concurrency}"] = functools.partial(
+            media_tools.build_stat_list_async, input_path,
+            concurrency=concurrency)
+    for label, scan_func in scans.items():
+        with contextlib.redirect_stdout(io.StringIO()):
+            seconds = min(timeit.repeat(scan_func, repeat=repeat, number=1))
+        output_str += (f"   {label:24} {seconds * 1e3:10.1f} ms"
+                       f" {len(media_paths) / seconds:10.1f} files/s\n")
+    return output_str
+
+
+def chardet_path_encoding(file_path: str) -> str:
+    """Previous 'encoding' column: chardet.detect() on every path."""
+    return f"{media_tools.check_encoding(file_path)[0]['encoding']}"
+
+
+def bench_path_encoding(media_paths: list, repeat: int = 5) -> str:
+    """Compares chardet per path to the tiered path encoding classifier."""
+    def_name = inspect.currentframe().f_code.co_name
+    path_strs = [str(path) for path in media_paths]
+    output_str = f"{def_name}() files: {len(path_strs)}\n"
+    for label, classify_func in [
+            ('chardet.detect', chardet_path_encoding),
+            ('classify_path_encoding', media_tools.classify_path_encoding)]:
+        path_us = time_per_file(classify_func, path_strs, repeat)
+        output_str += f"   {label:24} {path_us:10.1f} us/path\n"
+    mismatches = sum(chardet_path_encoding(path_str) !=
+                     media_tools.classify_path_encoding(path_str)
+                     for path_str in path_strs)
+    output_str += f"   {'column mismatches':24} {mismatches:10}\n"
+    return output_str
+
+
+def bench_duplicates(media_paths: list, repeat: int = 5) -> str:
+    """Compares full hash of every file to the tiered duplicate finder."""
+    def_name = inspect.currentframe().f_code.co_name
+    root_path = Path(os.path.commonpath([str(path.parent)
+                                         for path in media_paths]))
+    inventory = file_tools.DirectoryInventory(root_path, keep_files=True)
+    output_str = f"{def_name}() files: {len(media_paths)}\n"
+    full_seconds = min(timeit.repeat(
+        lambda: [file_tools.get_file_hash(path, 'sha3_256')
+                 for path in media_paths], repeat=repeat, number=1))
+    tiered_seconds = min(timeit.repeat(
+        lambda: file_tools.DuplicateFinder(
+            inventory, extensions=media_tools.AUDIO_EXT).find(),
+        repeat=repeat, number=1))
+    finder = file_tools.DuplicateFinder(inventory,
+                                        extensions=media_tools.AUDIO_EXT)
+    finder.find()
+    total_bytes = sum(path.stat().st_size for path in media_paths)
+    for label, seconds, n_bytes in [
+            ('full hash every file', full_seconds, total_bytes),
+            ('DuplicateFinder', tiered_seconds, finder.counts['bytes_read'])]:
+        output_str += (f"   {label:24} {seconds * 1e3:10.1f} ms"
+                       f" {file_tools.bytes_to_readable(n_bytes):>14} read\n")
+    output_str += f"   {'duplicate groups':24} {len(finder.groups):10}\n"
+    return output_str
+
+
+def bench_hash_backend(media_paths: list, repeat: int = 5) -> str:
+    """Compares hash algorithms, serial and on a HashPool of threads."""
+    def_name = inspect.currentframe().f_code.co_name
+    file_sizes = sorted(path.stat().st_size for path in media_paths)
+    total_bytes = sum(file_sizes)
+    median_size = file_tools.bytes_to_readable(
+        file_sizes[len(file_sizes) // 2])
+    output_str = (f"{def_name}() files: {len(media_paths)} "
+                  f"median: {median_size} "
+                  f"workers: {file_tools.HASH_WORKERS}\n")
+    for algorithm in file_tools.HASH_ALGORITHMS:
+        rates = []
+        for workers in (1, file_tools.HASH_WORKERS):
+            with file_tools.HashPool(algorithm, workers) as hash_pool:
+                seconds = min(timeit.repeat(
+                    lambda: hash_pool.hash_files(media_paths),
+                    repeat=repeat, number=1))
+            rates.append(total_bytes / seconds / 1e6)
+        output_str += (f"   {algorithm:12} {rates[0]:10.1f} MB/s serial"
+                       f" {rates[1]:10.1f} MB/s pool"
+                       f" {rates[1] / rates[0]:6.2f}x\n")
+    return output_str
+
+
+def traced_peak(run_func) -> int:
+    """Returns peak bytes allocated while running run_func()."""
+    tracemalloc.start()
+    run_func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak
+
+
+def bench_excel_export(media_paths: list, repeat: int = 5,
+                       record_count: int = 10000) -> str:
+    """Compares in-memory and constant_memory ExcelSink exports."""
+    def_name = inspect.currentframe().f_code.co_name
+    genre_dict = media_tools.build_genre_dictionary()
+    records = [media_tools.parse_media_file(path, path.stat(), genre_dict)
+               for path in media_paths]
+    output_str = (f"{def_name}() files: {len(media_paths)}"
+                  f" rows: {record_count}\n")
+
+    def export(output_dir: str, constant_memory: bool) -> None:
+        excel_sink = create_media_report.ExcelSink(
+            Path(output_dir), '~bench.xlsx', 'bench', constant_memory)
+        for num in range(record_count):
+            excel_sink.write(records[num % len(records)])
+        with contextlib.redirect_stdout(io.StringIO()):
+            excel_sink.close([])
+
+    for label, constant_memory in [('default', False),
+                                   ('constant_memory', True)]:
+        with tempfile.TemporaryDirectory() as output_dir:
+            seconds = min(timeit.repeat(
+                lambda: export(output_dir, constant_memory),
+                repeat=repeat, number=1))
+            # traced separately, tracemalloc slows the export down
+            peak = traced_peak(lambda: export(output_dir, constant_memory))
+        output_str += (f"   {label:24} {seconds * 1e3:10.1f} ms"
+                       f" {media_tools.bytes_to_readable(peak):>12} peak\n")
+    return output_str
+
+
+BENCHMARKS = OrderedDict([('tag_parse', bench_tag_parse),
+                          ('lean_read', bench_lean_read),
+                          ('record_memory', bench_record_memory),
+                          ('pipeline', bench_pipeline),
+                          ('async_scan', bench_async_scan),
+                          ('path_encoding', bench_path_encoding),
+                          ('duplicates', bench_duplicates),
+                          ('hash_backend', bench_hash_backend),
+                          ('excel_export', bench_excel_export)])
+
+
+def main():
+    """Driver to run micro-benchmarks against media in input path."""
+    parser = argparse.ArgumentParser(description=MODULE_NAME)
+    parser.add_argument("-f", "--file_path", type=Path,
+                        default=Path(PARENT_PATH, 'data', 'input'),
+                        help="directory to scan for media files")
+    parser.add_argument("-r", "--repeat", type=int, default=5,
+                        help="timing repeats, best run is reported")
+    parser.add_argument("-b", "--benchmark", choices=list(BENCHMARKS),
+                        action='append', help="benchmark(s) to run")
+    args = parser.parse_args()
+    print(f"{MODULE_NAME} starting...")
+    start = time.perf_counter()
+    media_paths = media_tools.get_all_media_paths(args.file_path)
+    if media_paths:
+        for bench_name in args.benchmark or list(BENCHMARKS):
+            print(BENCHMARKS[bench_name](media_paths, args.repeat))
+    else:
+        print(f"no media files found... {args.file_path}")
+    end = time.perf_counter() - start
+    print(f"{MODULE_NAME} finished in {end:0.2f} seconds")
+
+
+if __name__ == "__main__":
+    main()
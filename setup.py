@@ -9,5 +9,7 @@ setup(
     license='MIT',
     author='github.pdx',
     author_email='github.pdx@runbox.com',
-    description=f'extract metadata from ['.mp3','.m4a','.flac','.wma'] files'
+    description=f'extract metadata from ['.mp3','.m4a','.flac','.wma'] files',
+    # optional export formats: 'parquet'/'arrow' and 'jsonl.zst'
+    extras_require={'export': ['pyarrow>=1.0.0', 'zstandard>=0.18.0']}
 )
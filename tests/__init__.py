@@ -1,3 +1,5 @@
 import sys
 sys.path.append("..")
-__all__ = ['test_file_tools', 'test_mongodb_api']
\ No newline at end of file
+__all__ = ['test_catalog', 'test_create_media_report', 'test_export_tools',
+           'test_file_tools', 'test_hash_cache', 'test_insert_media_mongodb',
+           'test_media_tools', 'test_mongodb_api']
\ No newline at end of file
@@ -0,0 +1,93 @@
+import unittest
+import contextlib
+import datetime
+import io
+import shutil
+import tempfile
+from pathlib import Path
+from media_parser.lib import catalog as ct
+from media_parser.lib import export_tools as et
+from media_parser.lib import media_tools as mt
+
+MODULE_NAME = Path(__file__).resolve().name
+BASE_DIR = Path.cwd()
+
+
+class TestCatalog(unittest.TestCase):
+    """Test case class for catalog.py"""
+
+    def setUp(self):
+        self.tmp_dir = Path(tempfile.mkdtemp(prefix='~catalog_'))
+        self.db_path = Path(self.tmp_dir, 'media_lib.sqlite')
+        self.records = [mt.TrackRecord(
+            index=num, artist_name=artist, album_title=f"{artist} Live",
+            track_title=f"Track {num}", genre=['Jazz', 'Rock'][num % 2],
+            hash=f"{num % 3:064X}", track_number=num,
+            last_modified=datetime.datetime(2020, 1, num, 12, 30, 15, 5))
+            for num, artist in enumerate(['Miles Davis', 'Nina Simone',
+                                          'Davis Trio', 'Queen'], 1)]
+
+    def test_media_catalog(self):
+        with ct.MediaCatalog(self.db_path) as catalog:
+            catalog.insert_records(self.records)
+            self.assertEqual(len(catalog), 4)
+            self.assertEqual(list(catalog.iter_records()), self.records)
+            self.assertEqual(catalog.find_by_hash(self.records[0]['hash']),
+                             [self.records[0], self.records[3]])
+            self.assertEqual(catalog.find(genre='Rock', track_number=3),
+                             [self.records[2]])
+            self.assertEqual(catalog.modified_since(
+                self.records[2]['last_modified']), self.records[2:])
+            with self.assertRaises(ValueError):
+                catalog.find(path='x')
+            # prefix words, any of artist/album/title
+            self.assertEqual(catalog.search('davis'),
+                             [self.records[0], self.records[2]])
+            self.assertEqual(catalog.search('liv trac 2'), [self.records[1]])
+            self.assertEqual(catalog.search('"'), [])
+            # search index is rebuilt after later inserts
+            catalog.insert_records(self.records[:1])
+            self.assertEqual(len(catalog.search('miles')), 2)
+            for field in ct.INDEXED_FIELDS:
+                plan = catalog.conn.execute(
+                    f'EXPLAIN QUERY PLAN SELECT * FROM tracks '
+                    f'WHERE "{field}" = ?', ('x',)).fetchall()
+                self.assertIn(f"INDEX tracks_{field}", str(plan))
+            journal_mode = catalog.conn.execute(
+                "PRAGMA journal_mode").fetchone()[0]
+            self.assertEqual(journal_mode, 'wal')
+
+    def test_catalog_sink(self):
+        for _ in range(2):  # export again replaces the tracks
+            export_sink = et.open_export_sink(self.tmp_dir, 'sqlite',
+                                              chunk_rows=3)
+            for record in self.records:
+                export_sink.write(record)
+            with contextlib.redirect_stdout(io.StringIO()):
+                self.assertIn('SUCCESS!', export_sink.close())
+        with ct.MediaCatalog(self.db_path) as catalog:
+            self.assertEqual(list(catalog.iter_records()), self.records)
+            self.assertEqual(catalog.search('queen'), [self.records[3]])
+
+    def test_schema_version(self):
+        with ct.MediaCatalog(self.db_path) as catalog:
+            catalog.insert_records(self.records)
+            # catalog written before a HEADER_KEYS change
+            catalog.conn.execute('ALTER TABLE tracks DROP COLUMN "encoding"')
+            catalog.conn.execute("PRAGMA user_version = 0")
+        with ct.MediaCatalog(self.db_path) as catalog:
+            self.assertEqual(len(catalog), 0)
+            catalog.insert_records(self.records)
+            self.assertEqual(list(catalog.iter_records()), self.records)
+            self.assertEqual(catalog.search('queen'), [self.records[3]])
+            self.assertEqual(catalog.conn.execute(
+                "PRAGMA user_version").fetchone()[0], ct.SCHEMA_VERSION)
+        with ct.MediaCatalog(self.db_path) as catalog:
+            self.assertEqual(len(catalog), 4)  # same version, kept
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    unittest.main()
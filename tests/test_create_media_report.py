@@ -0,0 +1,176 @@
+import unittest
+import contextlib
+import datetime
+import io
+import re
+import shutil
+import sys
+import tempfile
+import zipfile
+from pathlib import Path
+from xml.etree import ElementTree
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / 'media_parser'))
+import create_media_report as cmr  # noqa: E402 (scripts import 'lib')
+
+MODULE_NAME = Path(__file__).resolve().name
+BASE_DIR = Path.cwd()
+XLSX_NS = {'x': 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'}
+
+
+def read_xlsx_sheet(file_path: Path, sheet_num: int = 1) -> dict:
+    """Returns {cell ref: str or float value} of a worksheet, no openpyxl."""
+    with zipfile.ZipFile(file_path) as xlsx:
+        shared = []
+        if 'xl/sharedStrings.xml' in xlsx.namelist():
+            root = ElementTree.fromstring(xlsx.read('xl/sharedStrings.xml'))
+            shared = [''.join(node.itertext())
+                      for node in root.iterfind('x:si', XLSX_NS)]
+        root = ElementTree.fromstring(
+            xlsx.read(f"xl/worksheets/sheet{sheet_num}.xml"))
+    cells = {}
+    for cell in root.iterfind('.//x:c', XLSX_NS):
+        cell_type = cell.get('t')
+        value = cell.find('x:v', XLSX_NS)
+        if cell_type == 's':  # shared string table
+            cells[cell.get('r')] = shared[int(value.text)]
+        elif cell_type == 'inlineStr':  # constant_memory mode
+            cells[cell.get('r')] = ''.join(
+                cell.find('x:is', XLSX_NS).itertext())
+        elif value is not None:
+            cells[cell.get('r')] = float(value.text)
+    return cells
+
+
+def read_xlsx_autofilter(file_path: Path, sheet_num: int = 1) -> str:
+    """Returns autofilter range of a worksheet, e.g. 'A1:Z3'."""
+    with zipfile.ZipFile(file_path) as xlsx:
+        sheet_xml = xlsx.read(f"xl/worksheets/sheet{sheet_num}.xml").decode()
+    return re.search(r'<autoFilter ref="([^"]+)"', sheet_xml).group(1)
+
+
+def read_xlsx_sheet_names(file_path: Path) -> list:
+    """Returns worksheet names in workbook order."""
+    with zipfile.ZipFile(file_path) as xlsx:
+        root = ElementTree.fromstring(xlsx.read('xl/workbook.xml'))
+    return [sheet.get('name') for sheet in root.iterfind('.//x:sheet',
+                                                         XLSX_NS)]
+
+
+class TestCreateMediaReport(unittest.TestCase):
+    """Test case class for create_media_report.py"""
+
+    def setUp(self):
+        self.tmp_dir = Path(tempfile.mkdtemp(prefix='~media_report_'))
+        self.records = [cmr.media_tools.TrackRecord(
+            index=num, file_size=1000 * num, readable_size=f"{num} KB",
+            file_ext='.mp3', artist_name=f"Artist {num}",
+            track_title='Title' * num, track_number=num if num > 1 else None,
+            track_length='00:03:05', year=2000 + num, rating='3',
+            track_gain=-1.25 * num, file_name=f"track_{num}.mp3",
+            path_len=40 + num, last_modified=datetime.datetime(
+                2020, 1, num, 12, 0), encoding='ascii', hash=f"{num:064X}")
+            for num in range(1, 5)]
+
+    def write_report(self, report_name: str, records: list,
+                     shard_keys: list = None, **options) -> str:
+        excel_sink = cmr.ExcelSink(self.tmp_dir, report_name, 'media',
+                                   **options)
+        for num, record in enumerate(records):
+            excel_sink.write(record, None if shard_keys is None
+                             else shard_keys[num])
+        with contextlib.redirect_stdout(io.StringIO()):
+            return excel_sink.close([])
+
+    def test_excel_sink(self):
+        for constant_memory in [False, True]:
+            report_path = Path(self.tmp_dir, f"~{constant_memory}.xlsx")
+            self.assertIn('SUCCESS!', self.write_report(
+                report_path.name, self.records[:3],
+                constant_memory=constant_memory))
+            cells = read_xlsx_sheet(report_path)
+            self.assertEqual(cells['A1'], 'index:')
+            self.assertEqual(cells['Z1'], 'audio_hash:')
+            self.assertEqual(cells['A2'], 1.0)  # index, number cell
+            self.assertEqual(cells['B3'], 2000.0)  # file_size
+            self.assertEqual(cells['C3'], '2 KB')
+            self.assertEqual(cells['G4'], 'TitleTitleTitle')
+            self.assertNotIn('H2', cells)  # no track_number, empty cell
+            self.assertEqual(cells['H3'], 2.0)
+            self.assertEqual(cells['I2'], '00:03:05')
+            self.assertEqual(cells['M4'], 2003.0)  # year
+            self.assertEqual(cells['N2'], '3')  # rating, text cell
+            self.assertEqual(cells['S3'], -2.5)  # track_gain
+            self.assertEqual(cells['T2'], 0.0)  # album_gain
+            self.assertEqual(cells['E2'], 'Artist 1')
+            self.assertNotIn('F2', cells)  # no album_title, blank cell
+            self.assertEqual(cells['W2'], 43831.5)  # 2020-01-01 12:00 serial
+            self.assertEqual(cells['Y4'], f"{3:064X}")
+            self.assertEqual(read_xlsx_autofilter(report_path), 'A1:Z4')
+
+    def test_excel_sink_width_sample(self):
+        records = self.records + [cmr.media_tools.TrackRecord(
+            index=num, track_title='Long' * 15) for num in range(5, 8)]
+        for constant_memory, title_width in [(False, 72), (True, 24)]:
+            excel_sink = cmr.ExcelSink(
+                self.tmp_dir, f"~{constant_memory}.xlsx", 'media',
+                constant_memory=constant_memory, width_sample=4)
+            for record in records:
+                excel_sink.write(record)
+            # rows 5-7 are past the sample, measured only when streaming
+            # is off: widths stay exact in the default mode
+            self.assertEqual(excel_sink.column_widths()['track_title'],
+                             title_width)
+            with contextlib.redirect_stdout(io.StringIO()):
+                self.assertIn('SUCCESS!', excel_sink.close([]))
+
+    def test_excel_sink_shards(self):
+        report_path = Path(self.tmp_dir, '~rows.xlsx')
+        self.assertIn('SUCCESS!', self.write_report(
+            report_path.name, self.records[:3], shard_rows=2))
+        self.assertEqual(read_xlsx_sheet_names(report_path),
+                         ['media', 'media_002', 'idx_media', 'dir_media'])
+        self.assertEqual(read_xlsx_autofilter(report_path, 1), 'A1:Z3')
+        self.assertEqual(read_xlsx_autofilter(report_path, 2), 'A1:Z2')
+        self.assertEqual(read_xlsx_sheet(report_path, 2)['A2'], 3.0)
+        self.assertEqual(read_xlsx_autofilter(report_path, 3), 'A1:H3')
+        index_cells = read_xlsx_sheet(report_path, 3)
+        self.assertEqual([index_cells[f"{col}3"] for col in 'ABCDEF'],
+                         [2.0, 'media_002', report_path.name, 1.0, 3.0, 3.0])
+        # one workbook per top-level folder, input path files first
+        input_path = Path(self.tmp_dir, 'input')
+        for rel_path in ['01.mp3', 'B/02.mp3', 'z.mp3', 'A/03.mp3']:
+            Path(input_path, rel_path).parent.mkdir(exist_ok=True)
+            Path(input_path, rel_path).write_bytes(b'\x00')
+        shard_keys = [cmr.top_folder(input_path, entry.path) for entry
+                      in cmr.media_tools.iter_media_entries(input_path,
+                                                            order='folder')]
+        self.assertEqual(shard_keys, ['.', '.', 'A', 'B'])
+        report_path = Path(self.tmp_dir, '~folder.xlsx')
+        status = self.write_report(report_path.name, self.records, shard_keys,
+                                   shard_by='folder', shard_to='workbook')
+        self.assertEqual(status.count('SUCCESS!'), 3)
+        self.assertEqual(read_xlsx_sheet_names(report_path),
+                         ['media', 'idx_media', 'dir_media'])
+        self.assertEqual(read_xlsx_autofilter(report_path, 1), 'A1:Z3')
+        for num, shard_key in [(2, 'A'), (3, 'B')]:
+            shard_path = Path(self.tmp_dir, f"~folder_00{num}.xlsx")
+            self.assertEqual(read_xlsx_sheet_names(shard_path),
+                             [f"media_00{num}"])
+            self.assertEqual(read_xlsx_autofilter(shard_path), 'A1:Z2')
+            self.assertEqual(read_xlsx_sheet(shard_path)['A2'], num + 1.0)
+        index_cells = read_xlsx_sheet(report_path, 2)
+        self.assertEqual(read_xlsx_autofilter(report_path, 2), 'A1:H4')
+        self.assertEqual([index_cells[f"{col}2"] for col in 'ABCDEFGH'],
+                         [1.0, 'media', report_path.name, 2.0, 1.0, 2.0,
+                          '.', '.'])
+        self.assertEqual([index_cells[f"{col}4"] for col in 'ABCDEFGH'],
+                         [3.0, 'media_003', '~folder_003.xlsx', 1.0, 4.0,
+                          4.0, 'B', 'B'])
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,115 @@
+import unittest
+import contextlib
+import csv
+import datetime
+import gzip
+import io
+import json
+import shutil
+import tempfile
+from pathlib import Path
+from media_parser.lib import export_tools as et
+from media_parser.lib import media_tools as mt
+
+MODULE_NAME = Path(__file__).resolve().name
+BASE_DIR = Path.cwd()
+
+
+class TestExportTools(unittest.TestCase):
+    """Test case class for export_tools.py"""
+
+    def setUp(self):
+        self.tmp_dir = Path(tempfile.mkdtemp(prefix='~export_tools_'))
+        self.records = [mt.TrackRecord(
+            index=num, file_size=1000 + num, artist_name=f"artist, {num}",
+            track_title='title "quoted"', track_number=None,
+            track_gain=-1.5, last_modified=datetime.datetime(
+                2020, 1, 2, 3, 4, 5, 123000)) for num in range(1, 6)]
+
+    def export(self, export_format: str) -> str:
+        export_sink = et.open_export_sink(self.tmp_dir, export_format,
+                                          chunk_rows=2)
+        for record in self.records:
+            export_sink.write(record)
+        with contextlib.redirect_stdout(io.StringIO()):
+            return export_sink.close()
+
+    def test_csv_sink(self):
+        self.assertIn('SUCCESS!', self.export('csv'))
+        with open(Path(self.tmp_dir, 'media_lib.csv'), newline='',
+                  encoding='utf-8') as csv_file:
+            rows = list(csv.reader(csv_file))
+        self.assertEqual(rows[0], mt.HEADER_KEYS)
+        self.assertEqual(len(rows), len(self.records) + 1)
+        loaded = mt.TrackRecord(zip(rows[0], rows[-1]))
+        self.assertEqual(loaded, self.records[-1])
+        with self.assertRaises(ValueError):
+            et.open_export_sink(self.tmp_dir, 'xlsx')
+        with self.assertRaises(TypeError):  # abstract _open/_write_rows
+            et.RecordSink(self.tmp_dir)
+
+    def check_json_lines(self, export_format: str) -> None:
+        self.assertIn('SUCCESS!', self.export(export_format))
+        file_path = Path(self.tmp_dir, f"media_lib.{export_format}")
+        with et.JsonLinesReader(file_path) as reader:
+            self.assertEqual(len(reader), len(self.records))
+            for num in [4, 0, 3]:  # seeks back and forth
+                self.assertEqual(reader[num], self.records[num])
+            self.assertEqual(list(reader.iter_records(1)), self.records[1:])
+            self.assertEqual(list(reader.iter_records(5)), [])
+            with self.assertRaises(IndexError):
+                next(reader.iter_records(6))
+            with self.assertRaises(IndexError):
+                reader[5]
+            # iterators and lookups each read their own stream
+            first, third = reader.iter_records(0), reader.iter_records(2)
+            self.assertEqual([next(first), next(third), reader[4],
+                              next(first), next(third)],
+                             [self.records[0], self.records[2],
+                              self.records[4], self.records[1],
+                              self.records[3]])
+
+    def test_json_lines_sink(self):
+        for export_format in ['jsonl', 'jsonl.gz']:
+            self.check_json_lines(export_format)
+        # gzip members read back as one plain JSON Lines stream
+        with gzip.open(Path(self.tmp_dir, 'media_lib.jsonl.gz')) as gz_file:
+            lines = gz_file.read().splitlines()
+        self.assertEqual(json.loads(lines[2])['artist_name'], 'artist, 3')
+        # same datetime format as media_lib.json
+        self.assertEqual(json.loads(lines[2])['last_modified'],
+                         '2020-01-02T03:04:05.123')
+
+    def test_json_lines_zstd(self):
+        if et.zstandard is None:
+            self.assertIn('zstandard is not installed',
+                          self.export('jsonl.zst'))
+            self.skipTest('zstandard not installed')
+        self.check_json_lines('jsonl.zst')
+        with open(Path(self.tmp_dir, 'media_lib.jsonl.zst'), 'rb') as zst_file:
+            lines = et.zstandard.ZstdDecompressor().stream_reader(
+                zst_file, read_across_frames=True).read().splitlines()
+        self.assertEqual(len(lines), len(self.records))
+
+    def test_arrow_sink(self):
+        if et.pyarrow is None:
+            self.assertIn('pyarrow is not installed', self.export('parquet'))
+            self.skipTest('pyarrow not installed')
+        self.assertIn('SUCCESS!', self.export('parquet'))
+        self.assertIn('SUCCESS!', self.export('arrow'))
+        table = et.pyarrow.parquet.read_table(
+            str(Path(self.tmp_dir, 'media_lib.parquet')))
+        self.assertEqual(table.schema, et.arrow_schema())
+        self.assertEqual(table.to_pylist(),
+                         [dict(record) for record in self.records])
+        with et.pyarrow.ipc.open_file(
+                str(Path(self.tmp_dir, 'media_lib.arrow'))) as reader:
+            self.assertEqual(reader.num_record_batches, 3)
+            self.assertEqual(reader.read_all(), table)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    unittest.main()
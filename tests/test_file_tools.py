@@ -1,5 +1,8 @@
 import unittest
+import hashlib
 import os
+import shutil
+import tempfile
 from pathlib import Path
 from sys import platform
 from media_parser.lib import file_tools as ft
@@ -23,6 +26,7 @@ class TestFileTools(unittest.TestCase):
         if not self.out_path.exists():
             self.out_path.mkdir(parents=True, exist_ok=True)
             print(f"\nsetUp: {self.out_path}\n")
+        self.tmp_dir = Path(tempfile.mkdtemp(prefix='~file_tools_'))
 
     def test_build_index_alphabet(self):
         alpha_dict = ft.build_index_alphabet()
@@ -106,6 +110,45 @@ class TestFileTools(unittest.TestCase):
         self.assertIsInstance(sha_hex, str)
         self.assertEqual(len(sha_hex), 64)
 
+    def test_get_file_hash(self):
+        file_bytes = self.valid_file.read_bytes()
+        for algorithm in ['sha256', 'sha3_256']:
+            expected = hashlib.new(algorithm, file_bytes).hexdigest().upper()
+            # small buffer forces many reused readinto() chunks
+            self.assertEqual(ft.get_file_hash(self.valid_file, algorithm,
+                                              buffer_size=64), expected)
+            self.assertEqual(ft.get_file_hash(self.valid_file, algorithm),
+                             expected)
+        self.assertEqual(ft.get_sha256_hash(self.valid_file),
+                         hashlib.sha256(file_bytes).hexdigest().upper())
+        self.assertEqual(ft.get_sha256_hash(self.invalid_path), 'no hash')
+
+    def test_hash_pool(self):
+        file_bytes = self.valid_file.read_bytes()
+        file_paths = [self.valid_file, self.invalid_path, self.valid_file]
+        for algorithm in ft.HASH_ALGORITHMS:
+            expected = hashlib.new(algorithm, file_bytes).hexdigest().upper()
+            for workers in [1, 4]:
+                with ft.HashPool(algorithm, workers) as hash_pool:
+                    self.assertEqual(hash_pool.hash_files(file_paths),
+                                     [expected, None, expected])
+                    self.assertEqual(hash_pool.hash_head_tail(
+                        self.valid_file, len(file_bytes), len(file_bytes)),
+                        expected)
+        head_tail = hashlib.sha3_256(file_bytes[:16] + file_bytes[-16:])
+        self.assertEqual(ft.get_head_tail_hash(self.valid_file,
+                                               len(file_bytes), 16),
+                         head_tail.hexdigest().upper())
+        with self.assertRaises(ValueError):
+            ft.HashPool('not_an_algorithm')
+        ft.register_hash_algorithm('blake2s_16', lambda: hashlib.blake2s(
+            digest_size=16))
+        try:
+            self.assertEqual(len(ft.get_file_hash(self.valid_file,
+                                                  'blake2s_16')), 32)
+        finally:
+            del ft.HASH_ALGORITHMS['blake2s_16']
+
     def test_get_dir_stats(self):
         dir_stats = ft.get_dir_stats(self.valid_dir)
         self.assertIsInstance(dir_stats, list)
@@ -114,6 +157,67 @@ class TestFileTools(unittest.TestCase):
             self.assertIsInstance(dir_stat, list)
             self.assertIsInstance(dir_stat[0], str)
 
+    def test_directory_inventory(self):
+        inventory = ft.DirectoryInventory(self.valid_dir)
+        self.assertTrue(inventory.is_valid)
+        self.assertEqual(inventory.total_size,
+                         ft.get_directory_size(self.valid_dir))
+        dir_list = inventory.get_directories()
+        self.assertEqual(dir_list, ft.get_directories(self.valid_dir))
+        for subdir_path in dir_list:
+            self.assertEqual(inventory.get_size(subdir_path),
+                             ft.get_directory_size(subdir_path))
+            self.assertEqual(inventory.get_mtime(subdir_path),
+                             os.path.getmtime(subdir_path))
+        self.assertEqual(sum(inventory.ext_counts.values()),
+                         len(list(self.valid_dir.rglob('*.*'))))
+        self.assertEqual(ft.get_dir_stats(self.valid_dir, inventory),
+                         ft.get_dir_stats(self.valid_dir))
+        inventory = ft.DirectoryInventory(self.invalid_path)
+        self.assertFalse(inventory.is_valid)
+        self.assertEqual(inventory.total_size, 0)
+        self.assertEqual(inventory.get_directories(), [])
+
+    def test_duplicate_finder(self):
+        dup_dir = Path(self.tmp_dir, 'duplicates')
+        dup_dir.mkdir()
+        chunk = 1024
+        big = os.urandom(chunk * 4)
+        # same size, head and tail as big: only a full hash tells them apart
+        near = big[:chunk] + os.urandom(chunk * 2) + big[-chunk:]
+        small = os.urandom(chunk)
+        files = {'big_1.mp3': big, 'big_2.mp3': big, 'near.mp3': near,
+                 'small_1.flac': small, 'small_2.flac': small,
+                 'small_3.txt': small, 'unique.mp3': os.urandom(chunk * 3)}
+        for file_name, file_bytes in files.items():
+            Path(dup_dir, file_name).write_bytes(file_bytes)
+        inventory = ft.DirectoryInventory(dup_dir, keep_files=True)
+        finder = ft.DuplicateFinder(inventory, extensions=self.valid_ext,
+                                    partial_size=chunk)
+        groups = finder.find()
+        self.assertEqual(len(groups), 2)
+        self.assertEqual([Path(p).name for p in groups[0].paths],
+                         ['big_1.mp3', 'big_2.mp3'])
+        self.assertEqual(groups[0].hash,
+                         hashlib.sha3_256(big).hexdigest().upper())
+        self.assertEqual([Path(p).name for p in groups[1].paths],
+                         ['small_1.flac', 'small_2.flac'])
+        self.assertEqual(groups[1].hash,
+                         hashlib.sha3_256(small).hexdigest().upper())
+        # unique size never opened, near duplicate hashed in full once
+        self.assertEqual(finder.counts['partial_hashed'], 5)
+        self.assertEqual(finder.counts['full_hashed'], 3)
+        self.assertLess(finder.counts['bytes_read'],
+                        chunk * 2 * 5 + len(big) * 3 + 1)
+        self.assertIn('2 groups', finder.summary())
+        threaded = ft.DuplicateFinder(inventory, extensions=self.valid_ext,
+                                      partial_size=chunk, workers=4)
+        self.assertEqual(threaded.find(), groups)
+        self.assertEqual(threaded.counts, finder.counts)
+        self.assertIn('SUCCESS', finder.save_json(dup_dir))
+        self.assertTrue(Path(dup_dir, '~duplicates.json').exists())
+        self.assertIsNone(ft.DirectoryInventory(dup_dir).file_stats)
+
     def test_get_files(self):
         file_list = ft.get_files(BASE_DIR, file_ext='.txt')
         for _file in file_list:
@@ -139,7 +243,7 @@ class TestFileTools(unittest.TestCase):
             self.assertEqual(len(ext_list), len(self.valid_ext))
 
     def tearDown(self):
-        pass
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
 
 
 if __name__ == '__main__':
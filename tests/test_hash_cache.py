@@ -0,0 +1,102 @@
+import unittest
+from unittest import mock
+import hashlib
+import os
+import shutil
+import tempfile
+from pathlib import Path
+from media_parser.lib import file_tools as ft
+from media_parser.lib import hash_cache as hc
+from media_parser.lib import media_tools as mt
+
+MODULE_NAME = Path(__file__).resolve().name
+BASE_DIR = Path.cwd()
+OLD_TS = 1e9  # outside the racy mtime window
+
+
+class TestHashCache(unittest.TestCase):
+    """Test case class for hash_cache.py"""
+
+    def setUp(self):
+        self.valid_dir = Path(BASE_DIR, 'data', 'input')
+        self.tmp_dir = Path(tempfile.mkdtemp(prefix='~hash_cache_'))
+        self.db_path = Path(self.tmp_dir, 'cache', '~hash_cache.sqlite')
+        self.file_path = Path(self.tmp_dir, 'a.bin')
+        self.file_path.write_bytes(b'abc' * 1000)
+        os.utime(self.file_path, (OLD_TS, OLD_TS))
+
+    def test_get_file_hash(self):
+        expected = {algorithm: hashlib.new(
+            algorithm, self.file_path.read_bytes()).hexdigest().upper()
+            for algorithm in ['sha256', 'sha3_256']}
+        with hc.HashCache(self.db_path) as cache:
+            for algorithm, digest in expected.items():
+                self.assertEqual(cache.get_file_hash(self.file_path,
+                                                     algorithm), digest)
+        with hc.HashCache(self.db_path) as cache:
+            with mock.patch.object(ft, 'get_file_hash',
+                                   side_effect=AssertionError):
+                for algorithm, digest in expected.items():
+                    self.assertEqual(cache.get_file_hash(self.file_path,
+                                                         algorithm), digest)
+            self.assertEqual(cache.counts['hits'], 2)
+            # renamed: same inode, row follows the new path
+            moved_path = Path(self.tmp_dir, 'b.bin')
+            self.file_path.rename(moved_path)
+            self.assertEqual(cache.get(moved_path, 'sha256'),
+                             expected['sha256'])
+            self.assertEqual(cache.evict_missing(self.tmp_dir), 0)
+            # modified in place: size/mtime_ns no longer match
+            moved_path.write_bytes(b'xyz')
+            os.utime(moved_path, (OLD_TS, OLD_TS + 1))
+            self.assertIsNone(cache.get(moved_path, 'sha256'))
+            self.assertEqual(cache.evict_missing(Path(BASE_DIR, 'tests')), 0)
+            self.assertEqual(cache.evict_missing(), 2)
+            self.assertIn('evicted: 2', cache.summary())
+
+    def test_racy_mtime(self):
+        self.file_path.touch()  # modified just now, digest not stored
+        with hc.HashCache(self.db_path) as cache:
+            cache.get_file_hash(self.file_path)
+            self.assertEqual(cache.counts['stored'], 0)
+            self.assertIsNone(cache.get(self.file_path, 'sha256'))
+
+    def test_xattr(self):
+        with hc.HashCache(self.db_path, use_xattr=True) as cache:
+            digest = cache.get_file_hash(self.file_path)
+            if not cache.use_xattr:
+                self.skipTest('os.setxattr() not available')
+            # stored in the file itself when the filesystem allows it
+            try:
+                os.getxattr(self.file_path, f"{hc.XATTR_PREFIX}sha256")
+            except OSError:
+                self.skipTest('user xattrs not supported')
+            self.assertEqual(os.stat(self.file_path).st_mtime, OLD_TS)
+            self.assertEqual(cache.get(self.file_path, 'sha256'), digest)
+
+    def test_iter_stat_records(self):
+        media_file = mt.get_all_media_paths(self.valid_dir)[0]
+        media_dir = Path(self.tmp_dir, 'media')
+        media_dir.mkdir()
+        for file_name in ['01.mp3', '02.mp3']:
+            shutil.copy(media_file, Path(media_dir, file_name))
+            os.utime(Path(media_dir, file_name), (OLD_TS, OLD_TS))
+        with hc.HashCache(self.db_path) as cache:
+            first_list = list(mt.iter_stat_records(media_dir,
+                                                   hash_cache=cache))
+            self.assertEqual(cache.counts['stored'], 4)
+        with hc.HashCache(self.db_path) as cache:
+            with mock.patch.object(mt, 'dump_tag_data_and_hash',
+                                   side_effect=AssertionError):
+                second_list = list(mt.iter_stat_records(media_dir,
+                                                        hash_cache=cache))
+            self.assertEqual(cache.counts['hits'], 4)
+        self.assertEqual([dict(d) for d in first_list],
+                         [dict(d) for d in second_list])
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    unittest.main()
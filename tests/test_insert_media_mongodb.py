@@ -0,0 +1,130 @@
+import unittest
+from unittest import mock
+import contextlib
+import io
+import shutil
+import sys
+import tempfile
+from pathlib import Path
+import mutagen
+import mutagen.id3
+from pymongo import UpdateOne
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / 'media_parser'))
+import insert_media_mongodb as imm  # noqa: E402 (scripts import 'lib')
+
+MODULE_NAME = Path(__file__).resolve().name
+BASE_DIR = Path.cwd()
+
+
+class TestInsertMediaMongodb(unittest.TestCase):
+    """Test case class for insert_media_mongodb.py, MongoMedia mocked."""
+
+    def setUp(self):
+        self.mdb = mock.Mock()
+        self.mdb.upsert_batch_tags.side_effect = (
+            lambda tag, batch: imm.mongodb_api.UpsertBatch(
+                [f"new_{num}" for num in range(len(batch))], [], 0))
+        self.media_file = imm.media_tools.get_all_media_paths(
+            Path(BASE_DIR, 'data', 'input'))[0]
+
+    def test_mongo_sink(self):
+        records = [imm.media_tools.TrackRecord(
+            hash=sha_hex, audio_hash=audio_hex, file_name=f"{num}.mp3")
+            for num, (sha_hex, audio_hex) in enumerate([
+                ('1' * 64, 'A' * 64), ('no hash', 'no hash'),
+                ('2' * 64, 'A' * 64), ('', ''), ('3' * 64, 'no hash'),
+                ('4' * 64, ''), ('5' * 64, 'B' * 64)])]
+        mongo_sink = imm.MongoSink(self.mdb, batch_size=2)
+        with contextlib.redirect_stdout(io.StringIO()):
+            for record in records:
+                mongo_sink.write(record)
+            status = mongo_sink.close()
+        # keyed by file name and audio, same audio in other files kept apart
+        self.assertEqual([call.args[0] for call
+                          in self.mdb.upsert_batch_tags.call_args_list],
+                         [imm.UPSERT_KEY, imm.UPSERT_KEY])
+        self.assertEqual([call.args[1] for call
+                          in self.mdb.upsert_batch_tags.call_args_list],
+                         [[records[0], records[2]], [records[6]]])
+        self.assertIn('3 media tags added (3 new, 0 existing)', status)
+        self.assertIn('4 files without hash skipped', status)
+        self.assertEqual(mongo_sink.audio_hashes,
+                         {'0.mp3': 'A' * 64, '2.mp3': 'A' * 64,
+                          '6.mp3': 'B' * 64})
+
+    def test_retagged_media(self):
+        tmp_dir = Path(tempfile.mkdtemp(prefix='~insert_mongodb_'))
+        self.addCleanup(shutil.rmtree, tmp_dir, ignore_errors=True)
+        media_copy = Path(tmp_dir, self.media_file.name)
+        shutil.copy(self.media_file, media_copy)
+        genre_dict = imm.media_tools.build_genre_dictionary()
+        record = imm.media_tools.parse_media_file(
+            media_copy, media_copy.stat(), genre_dict)
+        audio = mutagen.File(media_copy)
+        audio.tags.add(mutagen.id3.TALB(encoding=3, text=['Remastered']))
+        audio.save()
+        retagged = imm.media_tools.parse_media_file(
+            media_copy, media_copy.stat(), genre_dict)
+        new_sha_hex = retagged['hash']
+        self.assertNotEqual(new_sha_hex, record['hash'])
+        # MongoMedia as stored from the first run: one document, one file
+        media_api = imm.mongodb_api.MongoMedia
+        stored_doc = {'_id': 'doc_1', 'file_name': media_copy.name,
+                      'audio_hash': record['audio_hash']}
+        tags_coll, grid_fs = mock.Mock(), mock.Mock()
+        tags_coll.bulk_write.return_value.bulk_api_result = {
+            'upserted': [], 'writeErrors': []}
+        tags_coll.find.return_value = [stored_doc]
+        grid_fs.find_one.return_value = mock.Mock(
+            _id='grid_1', audio_hash=record['audio_hash'])
+        with mock.patch.multiple(media_api, create=True, tags_coll=tags_coll,
+                                 grid_fs=grid_fs), \
+                contextlib.redirect_stdout(io.StringIO()):
+            audio_hashes = imm.insert_tags_mongodb([retagged], media_api)
+            imm.insert_files_mongodb([media_copy], media_api, audio_hashes)
+        # tags and 'hash' updated in place on the existing document
+        operations = tags_coll.bulk_write.call_args.args[0]
+        self.assertEqual(operations, [UpdateOne(
+            {'file_name': media_copy.name,
+             'audio_hash': record['audio_hash']},
+            {'$set': retagged}, upsert=True)])
+        self.assertEqual(operations[0]._doc['$set']['hash'], new_sha_hex)
+        self.assertEqual(operations[0]._doc['$set']['album_title'],
+                         'Remastered')
+        # same audio: the stored file is kept, nothing uploaded
+        grid_fs.put.assert_not_called()
+        grid_fs.delete.assert_not_called()
+        # changed audio under the same name replaces the stored file
+        grid_fs.find_one.return_value.audio_hash = 'C' * 64
+        with mock.patch.multiple(media_api, create=True, grid_fs=grid_fs):
+            media_api.store_bin_file(media_copy, record['audio_hash'])
+        grid_fs.delete.assert_called_once_with('grid_1')
+        self.assertEqual(grid_fs.put.call_args.kwargs['audio_hash'],
+                         record['audio_hash'])
+
+    def test_backfill_audio_hash(self):
+        self.mdb.get_media_without.return_value = [
+            {'_id': 1, 'file_name': self.media_file.name},
+            {'_id': 2, 'file_name': 'not_stored.mp3'}, {'_id': 3}]
+        self.mdb.get_gridfs_id.side_effect = (
+            lambda file_path: 'grid_1' if file_path == Path(
+                self.media_file.name) else None)
+        self.mdb.get_bin_file.return_value = self.media_file.read_bytes()
+        self.mdb.update_existing.return_value = True
+        with contextlib.redirect_stdout(io.StringIO()):
+            status = imm.backfill_audio_hash(self.mdb)
+        self.mdb.get_media_without.assert_called_once_with(
+            'audio_hash', ['file_name'])
+        self.mdb.update_existing.assert_called_once_with(
+            1, {'audio_hash': imm.media_tools.get_audio_hash(
+                self.media_file)})
+        self.assertIn('1 documents backfilled, 2 without stored file',
+                      status)
+
+    def tearDown(self):
+        pass
+
+
+if __name__ == '__main__':
+    unittest.main()
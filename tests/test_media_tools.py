@@ -0,0 +1,525 @@
+import unittest
+from unittest import mock
+import asyncio
+import datetime
+import hashlib
+import io
+import os
+import pickle
+import shutil
+import struct
+import tempfile
+import types
+from pathlib import Path
+import mutagen
+import mutagen.asf
+import mutagen.flac
+import mutagen.id3
+import mutagen.mp4
+from media_parser.lib import media_tools as mt
+
+MODULE_NAME = Path(__file__).resolve().name
+BASE_DIR = Path.cwd()
+COVER_DATA = b'\xff\xd8\xff\xe0' + b'\x00' * 20000  # stand-in JPEG
+
+
+def write_flac(file_path: Path, album_art: bool = True) -> Path:
+    """Writes a tagged FLAC: STREAMINFO (75 s), no decodable frames."""
+    stream_info = struct.pack('>HH', 4096, 4096) + b'\x00' * 6
+    stream_info += ((44100 << 44) | (1 << 41) | (15 << 36) |
+                    44100 * 75).to_bytes(8, 'big') + b'\x00' * 16
+    file_path.write_bytes(b'fLaC\x80' + len(stream_info).to_bytes(3, 'big') +
+                          stream_info + b'\xff\xf8' + b'\x00' * 5000)
+    audio = mutagen.flac.FLAC(file_path)
+    for key, value in [('artist', 'Beethoven'), ('album', 'Symphony 4'),
+                       ('title', 'Allegro vivace'), ('tracknumber', '3/8'),
+                       ('date', '1963'), ('rating', '80'),
+                       ('replaygain_track_gain', '-3.61 dB')]:
+        audio[key] = value
+    if album_art:
+        picture = mutagen.flac.Picture()
+        picture.type, picture.mime = 3, 'image/jpeg'
+        picture.data = COVER_DATA
+        audio.add_picture(picture)
+    audio.save()
+    return file_path
+
+
+def mp4_atom(name: bytes, data: bytes) -> bytes:
+    """Returns size/name header followed by data."""
+    return struct.pack('>I4s', 8 + len(data), name) + data
+
+
+def write_m4a(file_path: Path, album_art: bool = True) -> Path:
+    """Writes a tagged M4A: mvhd/mdhd (201 s), mdat filler, ilst tags."""
+    mdhd = mp4_atom(b'mdhd', struct.pack('>5I', 0, 0, 0, 44100, 201 * 44100)
+                    + b'\x00' * 4)
+    hdlr = mp4_atom(b'hdlr', b'\x00' * 8 + b'soun' + b'\x00' * 13)
+    moov = mp4_atom(b'moov', mp4_atom(
+        b'mvhd', struct.pack('>5I', 0, 0, 0, 1000, 201000) + b'\x00' * 80) +
+        mp4_atom(b'trak', mp4_atom(b'mdia', mdhd + hdlr)))
+    file_path.write_bytes(mp4_atom(b'ftyp', b'M4A \x00\x00\x00\x00M4A mp42') +
+                          moov + mp4_atom(b'mdat', b'\x00' * 6000))
+    audio = mutagen.mp4.MP4(file_path)
+    audio.add_tags()
+    for key, value in [('\xa9ART', ['Interpol']), ('\xa9nam', ['Untitled']),
+                       ('\xa9alb', ['Turn on the Bright Lights']),
+                       ('trkn', [(1, 11)]), ('\xa9day', ['2002']),
+                       ('----:com.apple.iTunes:replaygain_track_gain',
+                        [mutagen.mp4.MP4FreeForm(b'-7.12 dB')])]:
+        audio[key] = value
+    if album_art:
+        audio['covr'] = [mutagen.mp4.MP4Cover(
+            COVER_DATA, mutagen.mp4.MP4Cover.FORMAT_JPEG)]
+    audio.save()
+    return file_path
+
+
+def write_wma(file_path: Path, album_art: bool = True) -> Path:
+    """Writes a tagged WMA: ASF header with File Properties (185 s)."""
+    properties = b'\x00' * 16 + struct.pack(
+        '<6Q4L', 0, 0, 0, 185 * 10**7, 185 * 10**7, 0, 2, 0, 0, 128000)
+    properties = (bytes.fromhex('a1dcab8c47a9cf118ee400c00c205365') +
+                  struct.pack('<Q', 24 + len(properties)) + properties)
+    file_path.write_bytes(bytes.fromhex('3026b2758e66cf11a6d900aa0062ce6c') +
+                          struct.pack('<QL', 30 + len(properties), 1) +
+                          b'\x01\x02' + properties + b'\x00' * 4000)
+    audio = mutagen.asf.ASF(file_path)
+    for key, value in [('Author', 'Patsy Cline'), ('Title', 'Crazy'),
+                       ('WM/AlbumTitle', 'Showcase'), ('WM/Year', '1961'),
+                       ('WM/TrackNumber', '7')]:
+        audio[key] = [value]
+    if album_art:
+        audio['WM/Picture'] = [mutagen.asf.ASFByteArrayAttribute(
+            b'\x03' + struct.pack('<I', len(COVER_DATA)) +
+            'image/jpeg\x00\x00'.encode('utf-16-le') + COVER_DATA)]
+    audio.save()
+    return file_path
+
+
+SYNTHETIC_WRITERS = {'.flac': write_flac, '.m4a': write_m4a,
+                     '.wma': write_wma}
+
+
+class TestMediaTools(unittest.TestCase):
+    """Test case class for media_tools.py"""
+
+    def setUp(self):
+        self.valid_dir = Path(BASE_DIR, 'data', 'input')
+        self.valid_ext = ['.mp3', '.m4a', '.flac', '.wma']
+        self.tmp_dir = Path(tempfile.mkdtemp(prefix='~media_tools_'))
+        for rel_path in ['b/02.mp3', 'b/01.flac', 'a/03.wma', 'a/c/04.m4a',
+                         'a/05.mp3', 'a/cover.jpg', 'notes.txt']:
+            file_path = Path(self.tmp_dir, rel_path)
+            file_path.parent.mkdir(parents=True, exist_ok=True)
+            file_path.write_bytes(b'\x00' * len(rel_path))
+
+    def test_iter_media_entries(self):
+        entries = list(mt.iter_media_entries(self.tmp_dir))
+        self.assertEqual(len(entries), 5)
+        for entry in entries:
+            self.assertIsInstance(entry, os.DirEntry)
+            self.assertIn(Path(entry.name).suffix, self.valid_ext)
+            self.assertEqual(entry.stat().st_size,
+                             os.stat(entry.path).st_size)
+        # default order matches the legacy per-extension rglob() sweeps
+        legacy_paths = []
+        for file_ext in self.valid_ext:
+            legacy_paths.extend([p.absolute() for p in
+                                 sorted(self.tmp_dir.rglob(f"*{file_ext}"))
+                                 if p.is_file()])
+        self.assertEqual([Path(e.path) for e in entries], legacy_paths)
+        self.assertEqual(mt.get_all_media_paths(self.tmp_dir), legacy_paths)
+        path_order = [Path(e.path) for e in
+                      mt.iter_media_entries(self.tmp_dir, order='path')]
+        self.assertEqual(path_order, sorted(legacy_paths))
+        Path(self.tmp_dir, '06.mp3').write_bytes(b'\x00')
+        folder_order = [Path(e.path).relative_to(self.tmp_dir).as_posix()
+                        for e in mt.iter_media_entries(self.tmp_dir,
+                                                       order='folder')]
+        self.assertEqual(folder_order, ['06.mp3', 'a/03.wma', 'a/05.mp3',
+                                        'a/c/04.m4a', 'b/01.flac',
+                                        'b/02.mp3'])
+        Path(self.tmp_dir, '06.mp3').unlink()
+        no_order = [Path(e.path) for e in
+                    mt.iter_media_entries(self.tmp_dir, order='none')]
+        self.assertEqual(sorted(no_order), sorted(legacy_paths))
+        with self.assertRaises(ValueError):
+            list(mt.iter_media_entries(self.tmp_dir, order='size'))
+
+    def test_get_all_media_paths(self):
+        media_paths = mt.get_all_media_paths(self.valid_dir)
+        self.assertGreater(len(media_paths), 0)
+        for media_path in media_paths:
+            self.assertIsInstance(media_path, Path)
+            self.assertTrue(media_path.is_file())
+            self.assertTrue(media_path.is_absolute())
+        invalid_path = Path(BASE_DIR, 'does', 'not', 'exist')
+        self.assertEqual(mt.get_all_media_paths(invalid_path), [])
+
+    def test_convert_mp3_rating(self):
+        self.assertEqual(mt.convert_mp3_rating(), 'Unknown')
+        self.assertEqual(mt.convert_mp3_rating('0'), '0-star')
+        self.assertEqual(mt.convert_mp3_rating('22'), '1/2-star')
+        self.assertEqual(mt.convert_mp3_rating('40'), '1-1/2-star')
+        self.assertEqual(mt.convert_mp3_rating('196'), '4-star')
+        self.assertEqual(mt.convert_mp3_rating('255'), '5-star')
+        self.assertEqual(mt.convert_mp3_rating('256'), '')
+        self.assertEqual(mt.convert_mp3_rating('n/a'), '-999.0-star')
+        self.assertEqual(len(mt.MP3_RATINGS), 256)
+
+    def test_tag_mappings(self):
+        self.assertEqual(sorted(mt.TAG_MAPPINGS), sorted(self.valid_ext))
+        for tag_mapping in mt.TAG_MAPPINGS.values():
+            for _, field_name, converter, _ in tag_mapping.fields:
+                self.assertIn(field_name, mt.HEADER_KEYS)
+                self.assertTrue(callable(converter))
+        for media_file in mt.get_all_media_paths(self.valid_dir):
+            tag_dict = mt.dump_tag_data(media_file)
+            self.assertTrue(tag_dict['artist_name'])
+            self.assertIn(tag_dict['album_art'], ['ALBUM_ART', 'MISSING_ART'])
+        # only mapped tags are read, Vorbis comment names in any case
+        flac_mapping = mt.TAG_MAPPINGS['.flac']
+        vorbis_tags = mutagen.flac.VCFLACDict()
+        for key, value in [('ARTIST', 'Nina'), ('Title', 'Sinnerman'),
+                           ('lyrics', 'x' * 1000), ('picture', 'text')]:
+            vorbis_tags[key] = value
+        audio = types.SimpleNamespace(tags=vorbis_tags, pictures=[])
+        self.assertEqual(flac_mapping.read_tags(audio, flac_mapping.tag_keys),
+                         {'artist': ['Nina'], 'title': ['Sinnerman']})
+        asf_mapping = mt.TAG_MAPPINGS['.wma']
+        audio = types.SimpleNamespace(tags=mutagen.asf.ASFTags())
+        audio.tags['Author'] = 'Patsy Cline'
+        audio.tags['WM/Lyrics'] = 'x' * 1000
+        self.assertEqual(list(asf_mapping.read_tags(
+            audio, asf_mapping.tag_keys)), ['Author'])
+
+    def test_track_record(self):
+        record = mt.TrackRecord(index='001', file_size='1024', year='',
+                                track_gain='-3.61', album_gain='n/a',
+                                last_modified='2021-03-04 05:06:07')
+        self.assertEqual(list(record), mt.HEADER_KEYS)
+        self.assertEqual(len(record), 29)
+        self.assertEqual(record['index'], 1)
+        self.assertEqual(record.file_size, 1024)
+        self.assertIsNone(record['year'])
+        self.assertIsNone(record['track_number'])
+        self.assertEqual(record['track_gain'], -3.61)
+        self.assertEqual(record['album_gain'], 0.0)  # not a number
+        gain_rows = [row for mapping in mt.TAG_MAPPINGS.values()
+                     for row in mapping.fields if row[1].endswith('_gain')]
+        self.assertEqual(len(gain_rows), 8)
+        for tag_str in ['-3.61 dB', '-3.610000 dB', "b'-3.61 dB'"]:
+            for _, _, converter, _ in gain_rows:
+                record['track_gain'] = converter(tag_str)
+                self.assertEqual(record['track_gain'], -3.61)
+        self.assertEqual(record['last_modified'],
+                         datetime.datetime(2021, 3, 4, 5, 6, 7))
+        self.assertEqual(record['artist_name'], '')
+        self.assertIn('hash', record)
+        with self.assertRaises(KeyError):
+            record['not_a_field'] = 'value'
+        with self.assertRaises(AttributeError):
+            record.not_a_field = 'value'  # no per-record __dict__
+        copied = mt.TrackRecord(zip(mt.HEADER_KEYS, record.json_values()))
+        self.assertEqual(copied, record)
+        self.assertEqual(pickle.loads(pickle.dumps(record)), record)
+        for media_file in mt.get_all_media_paths(self.valid_dir):
+            record = mt.parse_media_file(media_file, media_file.stat(),
+                                         mt.build_genre_dictionary())
+            self.assertIsInstance(record, mt.TrackRecord)
+            self.assertEqual(record['file_size'], media_file.stat().st_size)
+            self.assertIsInstance(record['last_modified'], datetime.datetime)
+            self.assertIsInstance(record['track_gain'], float)
+
+    def test_classify_path_encoding(self):
+        path_strs = [str(path) for path in
+                     mt.get_all_media_paths(self.valid_dir)]
+        path_strs.extend([
+            '/music/Björk/Debut/01~Human Behaviour.flac',
+            '/music/Сергей Рахманинов/01.mp3',
+            '/music/東京事変/教育/01.m4a',
+            '/music/01~Capriccio Espagnol, Opus 35 – Alborada.mp3',
+            '/music/HZ~{escape}/01.mp3', '/music/tab\there.mp3',
+            '\ufeff/music/bom.mp3', '/music/\U0001f3b5 notes/01.mp3',
+            '/music/\udcff/undecodable.mp3'])
+        for path_str in path_strs:
+            chardet_enc = mt.check_encoding(path_str)[0]['encoding']
+            self.assertEqual(mt.classify_path_encoding(path_str),
+                             f"{chardet_enc}")
+        self.assertEqual(mt.classify_path_encoding('/music/a/01.mp3'),
+                         'ascii')
+        self.assertEqual(mt.classify_path_encoding('/музыка/01.mp3'),
+                         'utf-8')
+        self.assertEqual(mt.classify_path_encoding(b'/music/a/01.mp3'),
+                         'ascii')
+        latin1_path = '/music/Björk/01.mp3'.encode('latin-1')
+        self.assertEqual(mt.classify_path_encoding(latin1_path),
+                         f"{mt.check_encoding(latin1_path)[0]['encoding']}")
+
+    def test_load_audio(self):
+        for media_file in mt.get_all_media_paths(self.valid_dir):
+            audio = mt.load_audio(media_file)
+            self.assertIsInstance(audio,
+                                  mt.AUDIO_CLASSES[media_file.suffix.lower()])
+            self.assertGreater(audio.info.length, 0)
+        media_dir = Path(self.tmp_dir, 'media')
+        media_dir.mkdir()
+        for file_ext, (length, artist, track_number) in {
+                '.flac': (75, 'Beethoven', 3), '.m4a': (201, 'Interpol', 1),
+                '.wma': (185, 'Patsy Cline', 7)}.items():
+            for album_art in [True, False]:
+                media_file = SYNTHETIC_WRITERS[file_ext](
+                    Path(media_dir, f"{album_art}{file_ext}"), album_art)
+                audio = mt.load_audio(media_file)
+                self.assertIsInstance(audio, mt.AUDIO_CLASSES[file_ext])
+                self.assertAlmostEqual(audio.info.length, length, places=0)
+                with open(media_file, 'rb') as file_ptr:
+                    self.assertIsInstance(mt.load_audio(media_file, file_ptr),
+                                          mt.AUDIO_CLASSES[file_ext])
+                tag_dict = mt.dump_tag_data(media_file)
+                self.assertEqual(tag_dict['artist_name'], artist)
+                self.assertEqual(tag_dict['track_number'], track_number)
+                art_str = 'ALBUM_ART' if album_art else 'MISSING_ART'
+                self.assertEqual(tag_dict['album_art'], art_str)
+        with self.assertRaises(KeyError):
+            mt.load_audio(Path(self.tmp_dir, 'notes.txt'))
+
+    def test_load_audio_lean(self):
+        for media_file in mt.get_all_media_paths(self.valid_dir):
+            audio = mt.load_audio(media_file)
+            lean_audio = mt.load_audio_lean(media_file)
+            self.assertIsInstance(lean_audio, type(audio))
+            self.assertAlmostEqual(lean_audio.info.length, audio.info.length)
+            self.assertEqual(sorted(lean_audio.tags.keys()),
+                             sorted(audio.tags.keys()))
+        media_dir = Path(self.tmp_dir, 'media')
+        media_dir.mkdir()
+        for file_ext, lean_source in [('.flac', mt._lean_flac_source),
+                                      ('.m4a', mt._lean_mp4_source),
+                                      ('.wma', None)]:
+            for album_art in [True, False]:
+                media_file = SYNTHETIC_WRITERS[file_ext](
+                    Path(media_dir, f"{album_art}{file_ext}"), album_art)
+                audio = mt.load_audio(media_file)
+                lean_audio = mt.load_audio_lean(media_file)
+                self.assertIsInstance(lean_audio, type(audio))
+                self.assertAlmostEqual(lean_audio.info.length,
+                                       audio.info.length)
+                self.assertEqual(sorted(lean_audio.tags.keys()),
+                                 sorted(audio.tags.keys()))
+                with mock.patch.object(mt, 'LEAN_READ', False):
+                    full_dict = mt.dump_tag_data(media_file)
+                self.assertEqual(mt.dump_tag_data(media_file), full_dict)
+                if lean_source is None:
+                    self.assertNotIn(file_ext, mt.LEAN_SOURCES)
+                    continue
+                with open(media_file, 'rb') as file_ptr:
+                    source = lean_source(file_ptr, str(media_file))
+                # artwork payload and audio data are not copied
+                self.assertLess(len(source.getvalue()), 1024)
+        # empty placeholders keep artwork presence, not the image bytes
+        self.assertEqual(mt.load_audio_lean(
+            Path(media_dir, 'True.flac')).pictures[0].data, b'')
+        self.assertEqual(bytes(mt.load_audio_lean(
+            Path(media_dir, 'True.m4a')).tags['covr'][0]), b'')
+        # ID3 prefixed FLAC and files without moov take the full parse
+        flac_file = Path(media_dir, 'True.flac')
+        id3_flac = Path(media_dir, 'id3.flac')
+        id3_flac.write_bytes(b'ID3\x04\x00\x00\x00\x00\x00\x00' +
+                             flac_file.read_bytes())
+        with open(id3_flac, 'rb') as file_ptr:
+            self.assertIsNone(mt._lean_flac_source(file_ptr))
+        self.assertEqual(len(mt.load_audio_lean(id3_flac).pictures[0].data),
+                         len(COVER_DATA))
+        with open(Path(self.tmp_dir, 'a', 'c', '04.m4a'), 'rb') as file_ptr:
+            self.assertIsNone(mt._lean_mp4_source(file_ptr))
+        # not an ID3v2 tag: ambiguous, so the full parse decides
+        with self.assertRaises(mutagen.MutagenError):
+            mt.load_audio_lean(Path(self.tmp_dir, 'b', '02.mp3'))
+
+    def test_dump_tag_data_and_hash(self):
+        for media_file in mt.get_all_media_paths(self.valid_dir):
+            tag_dict, sha_hex = mt.dump_tag_data_and_hash(media_file)
+            self.assertEqual(sha_hex, mt.get_sha256_hash(media_file))
+            expected = mt.dump_tag_data(media_file)
+            expected['audio_hash'] = mt.get_audio_hash(media_file)
+            self.assertEqual(dict(tag_dict), dict(expected))
+        with open(media_file, 'rb') as file_ptr:
+            reader = mt.HashingReader(file_ptr, hashlib.sha3_256(),
+                                      str(media_file))
+            reader.seek(-128, os.SEEK_END)  # read past the hash frontier
+            self.assertEqual(len(reader.read(128)), 128)
+            reader.seek(0)
+            self.assertEqual(len(reader.read(10)), 10)
+            self.assertEqual(reader.finish(), mt.get_sha256_hash(media_file))
+
+    def test_audio_hash(self):
+        media_file = mt.get_all_media_paths(self.valid_dir)[0]
+        media_copy = Path(self.tmp_dir, 'retag.mp3')
+        shutil.copy(media_file, media_copy)
+        tag_dict, sha_hex = mt.dump_tag_data_and_hash(media_copy)
+        audio_hex = tag_dict['audio_hash']
+        self.assertEqual(mt.hash_media_file(media_copy), (sha_hex, audio_hex))
+        self.assertEqual(mt.get_audio_hash(media_copy), audio_hex)
+        audio = mutagen.File(media_copy)
+        audio.tags.add(mutagen.id3.TCON(encoding=3, text=['Retagged' * 99]))
+        audio.save(v1=2)  # grows the ID3v2 tag and appends ID3v1
+        tag_dict, new_sha_hex = mt.dump_tag_data_and_hash(media_copy)
+        self.assertNotEqual(new_sha_hex, sha_hex)
+        self.assertEqual(tag_dict['audio_hash'], audio_hex)
+        payload = b'\x01' * 64
+        flac_bytes = (b'fLaC' + bytes([0x80]) + (34).to_bytes(3, 'big') +
+                      b'\x00' * 34 + payload)
+        mp4_bytes = (b'\x00\x00\x00\x10ftypM4A \x00\x00\x00\x00' +
+                     b'\x00\x00\x00\x08moov' +
+                     (len(payload) + 8).to_bytes(4, 'big') + b'mdat' + payload)
+        for file_ext, file_bytes in [('.flac', flac_bytes),
+                                     ('.m4a', mp4_bytes)]:
+            (start, end), = mt.audio_payload_ranges(io.BytesIO(file_bytes),
+                                                    file_ext)
+            self.assertEqual(file_bytes[start:end], payload)
+        # unknown layout: the whole file is the payload
+        self.assertEqual(mt.audio_payload_ranges(io.BytesIO(payload), '.m4a'),
+                         [(0, len(payload))])
+
+    def test_scan_manifest(self):
+        media_file = mt.get_all_media_paths(self.valid_dir)[0]
+        media_dir = Path(self.tmp_dir, 'media')
+        media_dir.mkdir()
+        for file_name in ['01.mp3', '02.mp3', '03.mp3']:
+            shutil.copy(media_file, Path(media_dir, file_name))
+        old_ts = 1e9  # outside the racy mtime window
+        for file_path in [*media_dir.iterdir(), media_dir]:
+            os.utime(file_path, (old_ts, old_ts))
+        manifest_path = Path(self.tmp_dir, '~manifest.json')
+        first_list = mt.build_stat_list(media_dir,
+                                        manifest_path=manifest_path)[0]
+        self.assertTrue(manifest_path.exists())
+        manifest = mt.ScanManifest(manifest_path)
+        self.assertEqual(len(manifest.files), 3)
+        second_list, output_str = mt.build_stat_list(
+            media_dir, manifest_path=manifest_path)
+        self.assertIn('cached_dirs: 1', output_str)
+        self.assertIn('reused_files: 3', output_str)
+        self.assertEqual([dict(d) for d in first_list],
+                         [dict(d) for d in second_list])
+        with open(Path(media_dir, '02.mp3'), 'ab') as media_ptr:
+            media_ptr.write(b'\x00')  # in-place edit, dir mtime unchanged
+        os.utime(Path(media_dir, '02.mp3'), (old_ts, old_ts))
+        third_list, output_str = mt.build_stat_list(
+            media_dir, manifest_path=manifest_path)
+        self.assertIn('parsed_files: 1', output_str)
+        self.assertNotEqual(first_list[1]['hash'], third_list[1]['hash'])
+        Path(media_dir, '03.mp3').unlink()
+        mt.build_stat_list(media_dir, manifest_path=manifest_path)
+        manifest = mt.ScanManifest(manifest_path)
+        self.assertEqual(len(manifest.files), 2)
+
+    def test_build_stat_list_workers(self):
+        media_file = mt.get_all_media_paths(self.valid_dir)[0]
+        media_dir = Path(self.tmp_dir, 'media')
+        media_dir.mkdir()
+        for file_name in ['01.mp3', '02.mp3', '03.mp3', '04.mp3']:
+            shutil.copy(media_file, Path(media_dir, file_name))
+        Path(media_dir, '00.mp3').write_bytes(b'not an mpeg frame')
+        serial_list, serial_str = mt.build_stat_list(media_dir)
+        pool_list, pool_str = mt.build_stat_list(media_dir, workers=2,
+                                                 chunk_size=2)
+        self.assertEqual(len(serial_list), 4)
+        self.assertEqual([dict(d) for d in serial_list],
+                         [dict(d) for d in pool_list])
+        self.assertEqual([d['index'] for d in pool_list],
+                         [1, 2, 3, 4])
+        self.assertIn("00.mp3", pool_str)  # failure isolated and logged
+        self.assertIn("100.0%", pool_str)
+
+    def test_iter_stat_records(self):
+        media_file = mt.get_all_media_paths(self.valid_dir)[0]
+        media_dir = Path(self.tmp_dir, 'media')
+        media_dir.mkdir()
+        for file_name in ['01.mp3', '02.mp3', '03.mp3']:
+            shutil.copy(media_file, Path(media_dir, file_name))
+        log_lines = []
+        record_iter = mt.iter_stat_records(media_dir, log=log_lines.append)
+        self.assertIsInstance(record_iter, types.GeneratorType)
+        first_record = next(record_iter)
+        self.assertEqual(first_record['file_name'], '01.mp3')
+        self.assertEqual(first_record['index'], 1)
+        records = [first_record, *record_iter]
+        self.assertEqual(records, mt.build_stat_list(media_dir)[0])
+        self.assertIn("100.0%", log_lines[-1])
+        pool_records = list(mt.iter_stat_records(media_dir, workers=2,
+                                                 chunk_size=1))
+        self.assertEqual(records, pool_records)
+        path_records = list(mt.iter_stat_records(media_dir, with_path=True))
+        self.assertEqual(path_records[-1],
+                         (str(Path(media_dir, '03.mp3')), records[-1]))
+
+    def test_scan_pipeline(self):
+        media_file = mt.get_all_media_paths(self.valid_dir)[0]
+        media_dir = Path(self.tmp_dir, 'media')
+        media_dir.mkdir()
+        for file_name in ['01.mp3', '02.mp3', '03.mp3', '04.mp3']:
+            shutil.copy(media_file, Path(media_dir, file_name))
+        Path(media_dir, '00.mp3').write_bytes(b'not an mpeg frame')
+        serial_list = mt.build_stat_list(media_dir, order='none')[0]
+        log_lines = []
+        pipeline = mt.ScanPipeline(media_dir, queue_size=1,
+                                   stage_workers={'parse': 3})
+        with mock.patch('builtins.open', wraps=open) as mock_open:
+            self.assertEqual(list(pipeline.run(log=log_lines.append)),
+                             serial_list)
+        opened = sorted(Path(call.args[0]).name
+                        for call in mock_open.call_args_list
+                        if str(call.args[0]).endswith('.mp3'))
+        # each file read once, tag parse and hashes share the handle
+        self.assertEqual(opened[-4:], ['01.mp3', '02.mp3', '03.mp3',
+                                       '04.mp3'])
+        self.assertIn("00.mp3", log_lines[0])  # failure isolated and logged
+        self.assertEqual(list(pipeline.stats), mt.PIPELINE_STAGES)
+        self.assertEqual(pipeline.stats['hash'].items, 5)
+        self.assertEqual(pipeline.stats['sink'].items, 4)
+        self.assertIn(pipeline.bottleneck(), mt.PIPELINE_STAGES)
+        record_iter = pipeline.run()
+        self.assertEqual(next(record_iter)['index'], 1)
+        record_iter.close()  # early close stops all stage threads
+        with self.assertRaises(ValueError):
+            mt.ScanPipeline(media_dir, order='bogus')
+        entries = list(mt.iter_media_entries(media_dir))
+
+        def failing_walk(*args, **kwargs):
+            yield from entries[:2]
+            raise OSError('walk failed')
+        with mock.patch.object(mt, 'iter_media_entries', failing_walk):
+            with self.assertRaisesRegex(OSError, 'walk failed'):
+                list(pipeline.run())
+
+    def test_async_scanner(self):
+        media_file = mt.get_all_media_paths(self.valid_dir)[0]
+        for rel_path in ['b/02.mp3', 'a/05.mp3', 'a/c/06.mp3']:
+            shutil.copy(media_file, Path(self.tmp_dir, rel_path))
+        Path(self.tmp_dir, 'a', 'c', '07.mp3').write_bytes(b'not mpeg')
+        stat_list, output_str = mt.build_stat_list(self.tmp_dir)
+        async_list, async_str = mt.build_stat_list_async(self.tmp_dir,
+                                                         concurrency=2)
+        self.assertEqual(async_list, stat_list)
+        self.assertEqual(async_str.split('\n')[1:],
+                         output_str.split('\n')[1:])
+        scanner = mt.AsyncScanner(self.tmp_dir, concurrency=4)
+
+        async def first_record():
+            async for record in scanner.records():
+                return record
+        self.assertEqual(asyncio.run(first_record()), stat_list[0])
+        self.assertGreater(scanner.peak_in_flight, 1)
+        self.assertLessEqual(scanner.peak_in_flight, 4)
+        with self.assertRaises(ValueError):
+            mt.AsyncScanner(self.tmp_dir, order='size')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    unittest.main()
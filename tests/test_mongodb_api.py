@@ -86,6 +86,40 @@ class TestDatabase(unittest.TestCase):
             self.assertEqual(new_data['album_title'], self.new_value)
             self.mdb_api.show_tags(random_id)
 
+    def test_iter_upsert_tags(self):
+        if self.mdb_api.conn_status:
+            random_id = self.id_list[random.randint(0, self.id_count - 1)]
+            orig_data = self.mdb_api.get_media(random_id)
+            orig_data['album_title'] = self.new_value
+            new_data = {'hash': self.new_value, 'album_title': 'new'}
+            batches = list(self.mdb_api.iter_upsert_tags(
+                'hash', [orig_data, new_data, new_data], batch_size=2))
+            self.assertEqual(len(batches), 2)
+            self.assertEqual(batches[0].matched_ids, [random_id])
+            self.assertEqual(len(batches[0].upserted_ids), 1)
+            self.assertEqual(batches[1].matched_ids,
+                             batches[0].upserted_ids)
+            self.assertEqual(batches[1].error_count, 0)
+            self.assertEqual(self.mdb_api.get_media(random_id)['album_title'],
+                             self.new_value)
+            self.mdb_api.remove_data(batches[0].upserted_ids[0])
+
+    def test_upsert_compound_key(self):
+        if self.mdb_api.conn_status:
+            upsert_key = ('file_name', 'audio_hash')
+            data = {'file_name': f"{self.new_value}.mp3",
+                    'audio_hash': self.new_value, 'hash': 'old'}
+            first = self.mdb_api.upsert_batch_tags(upsert_key, [data])
+            self.assertEqual(len(first.upserted_ids), 1)
+            # retagged: same file and audio, new file hash and tags
+            retagged = dict(data, hash='new', album_title='new')
+            second = self.mdb_api.upsert_batch_tags(upsert_key, [retagged])
+            self.assertEqual(second.upserted_ids, [])
+            self.assertEqual(second.matched_ids, first.upserted_ids)
+            new_data = self.mdb_api.get_media(first.upserted_ids[0])
+            self.assertEqual(new_data['hash'], 'new')
+            self.mdb_api.remove_data(first.upserted_ids[0])
+
     def test_store_bin_file(self):
         if self.mdb_api.conn_status:
             if len(self.media_paths) > 0: